@@ -8,11 +8,36 @@ short_description: Retrieve BGP neighbor information from Quagga
 description:
     - Retrieve BGP neighbor information from Quagga, using the VTYSH command line
     - Retrieved facts will be inserted into the 'bgp_neighbors' key
+options:
+    use_json:
+        description:
+            - Collect the facts from the JSON output of FRR ('show bgp summary json' and
+              'show ip bgp neighbors json') instead of parsing the text output.
+        required: false
+        default: false
+    neighbors:
+        description:
+            - List of neighbor addresses to collect the facts of. With use_json only these neighbors are
+              queried, otherwise the other neighbors are dropped from the parsed output.
+              'bgp_statistics' only counts these neighbors.
+        required: false
+        default: all neighbors
+    state_only:
+        description:
+            - Collect only the state, admin status, remote AS, description and accepted prefixes of the
+              neighbors from 'show bgp summary json'. Implies use_json.
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
 - name: Get BGP neighbor information
   bgp_facts:
+
+- name: Get state of some BGP neighbors while waiting for the sessions
+  bgp_facts:
+    neighbors: ['10.0.0.57', 'fc00::72']
+    state_only: yes
 '''
 
 # Example of the source data
@@ -46,15 +71,48 @@ Read thread: off  Write thread: off
 '''
 
 
+import json
+
+# FRR JSON message statistics counter name to the name in the text output
+MESSAGE_STATS = [
+    ('opens', 'Opens'),
+    ('notifications', 'Notifications'),
+    ('updates', 'Updates'),
+    ('keepalives', 'Keepalives'),
+    ('routeRefresh', 'Route Refresh'),
+    ('capability', 'Capability'),
+    ('total', 'Total'),
+]
+
+
+def decamel(name):
+    """
+        Convert FRR JSON value like 'advertisedAndReceived' to the text output form 'advertised and received'
+    """
+    words = []
+    start = 0
+    for i, c in enumerate(name):
+        if c.isupper():
+            words.append(name[start:i])
+            start = i
+    words.append(name[start:])
+    return ' '.join(words).lower()
+
+
 class BgpModule(object):
     def __init__(self):
         self.module = AnsibleModule(
             argument_spec=dict(
+                use_json=dict(required=False, type='bool', default=False),
+                neighbors=dict(required=False, type='list', default=None),
+                state_only=dict(required=False, type='bool', default=False),
             ),
             supports_check_mode=True)
 
         self.out = None
         self.facts = {}
+        neighbors = self.module.params['neighbors']
+        self.neighbors = [str(n).lower() for n in neighbors] if neighbors else None
 
         return
 
@@ -62,19 +120,27 @@ class BgpModule(object):
         """
             Main method of the class
         """
-        self.collect_data('summary')
-        self.parse_summary()
-        self.collect_data('neighbor')
-        self.parse_neighbors()
+        if self.module.params['use_json'] or self.module.params['state_only']:
+            self.collect_json_facts()
+        else:
+            self.collect_data('summary')
+            self.parse_summary()
+            self.collect_data('neighbor')
+            self.parse_neighbors()
+            if self.neighbors is not None:
+                wanted = set(self.neighbors)
+                self.facts['bgp_neighbors'] = dict((ip, neighbor) for ip, neighbor in self.facts['bgp_neighbors'].items()
+                                                   if ip in wanted)
         self.get_statistics()
         self.module.exit_json(ansible_facts=self.facts)
 
-    def collect_data(self, command_str):
+    def run_vtysh(self, commands):
         """
-            Collect bgp information by reading output of 'vtysh' command line tool
+            Run the commands in one 'vtysh' session, self.out holds their output
         """
         try:
-            rc, self.out, err = self.module.run_command('docker exec -i bgp vtysh -c "show ip bgp ' + command_str + '"',
+            rc, self.out, err = self.module.run_command('docker exec -i bgp vtysh ' +
+                                                        ' '.join('-c "%s"' % command for command in commands),
                                                         executable='/bin/bash', use_unsafe_shell=True)
         except Exception as e:
             self.module.fail_json(msg=str(e))
@@ -85,6 +151,141 @@ class BgpModule(object):
 
         return
 
+    def collect_data(self, command_str):
+        """
+            Collect bgp information by reading output of 'vtysh' command line tool
+        """
+        self.run_vtysh(['show ip bgp ' + command_str])
+
+        return
+
+    def collect_json(self, commands):
+        """
+            Run the commands in one 'vtysh' session and decode the JSON document each of them outputs
+        """
+        self.run_vtysh(commands)
+
+        decoder = json.JSONDecoder()
+        docs = []
+        pos = 0
+        end = len(self.out)
+        try:
+            while True:
+                while pos < end and self.out[pos].isspace():
+                    pos += 1
+                if pos == end:
+                    break
+                doc, pos = decoder.raw_decode(self.out, pos)
+                docs.append(doc)
+        except ValueError as e:
+            self.module.fail_json(msg="Failed to decode JSON output of %s: %s" % (str(commands), str(e)))
+
+        if len(docs) != len(commands):
+            self.module.fail_json(msg="Expected %d JSON documents from %s, got %d" % (len(commands), str(commands), len(docs)))
+
+        return docs
+
+    def collect_json_facts(self):
+        commands = ['show bgp summary json']
+        if not self.module.params['state_only']:
+            if self.neighbors is None:
+                commands.append('show ip bgp neighbors json')
+            else:
+                commands.extend('show ip bgp neighbors %s json' % ip for ip in self.neighbors)
+
+        docs = self.collect_json(commands)
+        summary = docs[0]
+        # Older FRR outputs the IPv4 unicast summary only, not keyed by the address family
+        if 'peers' in summary:
+            summary = {'ipv4Unicast': summary}
+
+        if self.module.params['state_only']:
+            self.parse_json_summary(summary)
+        else:
+            for af_summary in summary.values():
+                if isinstance(af_summary, dict) and 'as' in af_summary:
+                    self.facts['bgp_localasn'] = str(af_summary['as'])
+                    break
+            self.parse_json_neighbors(docs[1:])
+
+        return
+
+    def parse_json_summary(self, summary):
+        neighbors = {}
+        wanted = set(self.neighbors) if self.neighbors is not None else None
+        for af_summary in summary.values():
+            if not isinstance(af_summary, dict):
+                continue
+            if 'as' in af_summary:
+                self.facts['bgp_localasn'] = str(af_summary['as'])
+            for ip, peer in af_summary.get('peers', {}).items():
+                ip = ip.lower()
+                if wanted is not None and ip not in wanted:
+                    continue
+                if ip not in neighbors:
+                    state = peer.get('state', '')
+                    neighbors[ip] = {
+                        'ip_version': 6 if ':' in ip else 4,
+                        'remote AS': peer.get('remoteAs'),
+                        'state': state.split(' ', 1)[0].lower(),
+                        'admin': 'down' if '(Admin)' in state else 'up',
+                        'accepted prefixes': 0,
+                    }
+                    if 'desc' in peer:
+                        neighbors[ip]['description'] = peer['desc']
+                neighbors[ip]['accepted prefixes'] += peer.get('pfxRcd', peer.get('prefixReceivedCount', 0))
+
+        self.facts['bgp_neighbors'] = neighbors
+        return
+
+    def parse_json_neighbors(self, docs):
+        neighbors = {}
+        for doc in docs:
+            for ip, peer in doc.items():
+                # Unknown neighbors are reported as {"bgpNoSuchNeighbor": true}
+                if not isinstance(peer, dict):
+                    continue
+                neighbor = {}
+                neighbor['ip_version'] = 6 if ':' in ip else 4
+                neighbor['admin'] = 'down' if peer.get('adminShutDown') else 'up'
+                neighbor['remote AS'] = peer.get('remoteAs')
+                neighbor['local AS'] = peer.get('localAs')
+                neighbor['remote routerid'] = peer.get('remoteRouterId')
+                neighbor['state'] = peer.get('bgpState', '').lower()
+                if 'nbrDesc' in peer: neighbor['description'] = peer['nbrDesc']
+                if 'minBtwnAdvertisementRunsTimerMsecs' in peer: neighbor['mrai'] = peer['minBtwnAdvertisementRunsTimerMsecs'] / 1000
+                if 'connectionsEstablished' in peer: neighbor['connections established'] = peer['connectionsEstablished']
+                if 'connectionsDropped' in peer: neighbor['connections dropped'] = peer['connectionsDropped']
+                if 'peerGroup' in peer: neighbor['peer group'] = peer['peerGroup']
+                if 'peerSubnetRangeGroup' in peer: neighbor['subnet'] = peer['peerSubnetRangeGroup']
+                neighbor['accepted prefixes'] = sum(af.get('acceptedPrefixCounter', 0)
+                                                    for af in peer.get('addressFamilyInfo', {}).values())
+
+                capabilities = {}
+                peer_capabilities = peer.get('neighborCapabilities', {})
+                if 'gracefulRestart' in peer_capabilities:
+                    capabilities['graceful restart'] = decamel(peer_capabilities['gracefulRestart'])
+                if 'gracefulRestartRemoteTimerMsecs' in peer_capabilities:
+                    capabilities['peer restart timer'] = peer_capabilities['gracefulRestartRemoteTimerMsecs'] / 1000
+                for af, af_restart in peer_capabilities.get('addressFamiliesByPeer', {}).items():
+                    if isinstance(af_restart, dict):
+                        capabilities['peer af ' + decamel(af)] = 'preserved' if af_restart.get('preserved') else 'not preserved'
+                if capabilities:
+                    neighbor['capabilities'] = capabilities
+
+                stats = peer.get('messageStats', {})
+                message_stats = {}
+                for counter, key in MESSAGE_STATS:
+                    if counter + 'Sent' in stats:
+                        message_stats[key] = {'sent': stats[counter + 'Sent'], 'rcvd': stats.get(counter + 'Recv', 0)}
+                if message_stats:
+                    neighbor['message statistics'] = message_stats
+
+                neighbors[ip.lower()] = neighbor
+
+        self.facts['bgp_neighbors'] = neighbors
+        return
+
     def parse_summary(self):
         regex_asn = re.compile(r'.*local AS number (\d+).*')
         if regex_asn.match(self.out):
@@ -12,6 +12,8 @@ description:
       Currently supported parsing commands:
         * show ip bgp 100.0.0.1  ### show ip bgp prefix info
         * show ip bgp neighbor 10.0.0.1 adv   ### show ip bgp neighbor nei_address advertised routes
+        * show ip bgp 100.0.0.1/28 json, show ipv6 bgp fc00::/64 json   ### bulk prefix info
+        * show ip bgp json, show ipv6 bgp json   ### all prefixes
     - Retrieved facts will be inserted into the 'bgp_route'  or 'bgp_route_neiadv'
 Options:
     - option-name: prefix
@@ -19,6 +21,13 @@ Options:
       required: False
       Default: None
 
+    - option-name: prefixes
+      description: list of bgp prefixes to be retrieved at once, or 'all' for all the IPv4 and IPv6 prefixes.
+                   The prefixes are retrieved in one vtysh session from the JSON output of the commands,
+                   the result has the same form as for the prefix option.
+      required: False
+      Default: None
+
     - option-name: neighbor
       description: restirct retrieving routing information from bgp neighbor
                    bgp neighbor address is expected to follow this option
@@ -35,6 +44,13 @@ EXAMPLES = '''
 - name: Get BGP route information
   bgp_route: prefix='100.0.0.1/28'
 
+- name: Get BGP route information of several prefixes
+  bgp_route:
+    prefixes: ['100.0.0.1/28', '192.168.10.1/32', 'fc00::/64']
+
+- name: Get BGP route information of all prefixes
+  bgp_route: prefixes='all'
+
 - name: Get neighbor BGP advertise route information
   bgp_route: neighbor='10.0.0.1' direction='adv'
 '''
@@ -143,6 +159,45 @@ SAMPLE_COMMAND_DATA = '''
 
 ### TODO: Not fully tested ipv6 route entries parsing option, need continue working on ipv6 specific commands###
 
+def decode_json_docs(output, commands):
+    '''
+    decode the JSON documents output one after another by the commands of one vtysh session
+    '''
+    decoder = json.JSONDecoder()
+    docs = []
+    pos = 0
+    end = len(output)
+    while True:
+        while pos < end and output[pos].isspace():
+            pos += 1
+        if pos == end:
+            break
+        try:
+            doc, pos = decoder.raw_decode(output, pos)
+        except ValueError as e:
+            # vtysh prints an error like "% Malformed address" instead of the JSON output of a bad command
+            command = commands[len(docs)] if len(docs) < len(commands) else 'none of the commands'
+            raise ValueError("invalid JSON output of '%s': %s: %s" % (command, output[pos:].split('\n', 1)[0], str(e)))
+        docs.append(doc)
+    return docs
+
+
+def valid_prefix(prefix):
+    '''
+    return 'ip' or 'ipv6' for a valid IPv4 or IPv6 address or prefix, None otherwise
+    '''
+    address, _, prefixlen = prefix.partition('/')
+    if netaddr.valid_ipv4(address, netaddr.INET_PTON):
+        family, max_prefixlen = 'ip', 32
+    elif netaddr.valid_ipv6(address):
+        family, max_prefixlen = 'ipv6', 128
+    else:
+        return None
+    if '/' in prefix and not (prefixlen.isdigit() and int(prefixlen) <= max_prefixlen):
+        return None
+    return family
+
+
 class BgpRoutes(object):
     '''
         parsing bgp routing information
@@ -164,18 +219,17 @@ class BgpRoutes(object):
         self.facts['bgp_route_neiadv']['neighbor'] = self.neighbor
         ### so far parsing prefix, nexthop and aspath, origin and weight 
         header = 'Metric LocPrf Weight Path'
-        result_lines = cmd_result.split('\n')
+        result_lines = iter(cmd_result.split('\n'))
         table_start = False
         re_aspath = re.compile('.*\s{2,}(\d+)\s((\d+\s)+)?([ie\?])$')
-        while len(result_lines) != 0:
-            line = result_lines.pop(0)
+        for line in result_lines:
             if not table_start:
                 if header in line:
                     table_start = True
                     continue
             else:
                 ## only parse valid route entry, ignore if it's not marked as valid
-                if not re.match('^\*', line):
+                if not line.startswith('*'):
                     continue
                 entry = dict()
                 fields = line.strip().split()
@@ -183,7 +237,7 @@ class BgpRoutes(object):
                 if len(fields) > 2:    ### route entry in one line
                     nexthop = fields[2]
                 else:                  ### route entry in two lines
-                    line = result_lines.pop(0)
+                    line = next(result_lines)
                     nexthop = line.strip().split()[0]
                 m = re_aspath.match(line)
                 if m:
@@ -233,11 +287,9 @@ class BgpRoutes(object):
             self.facts['bgp_route'][prefix]['found'] = False
             return
 
-        result_lines = cmd_result.split('\n')
         state = HEADER
         self.facts['bgp_route'][prefix]['aspath'] = []
-        while len(result_lines) != 0:
-            line = result_lines.pop(0)
+        for line in cmd_result.split('\n'):
             if line == '':
                 continue
             if state == HEADER:
@@ -289,13 +341,51 @@ class BgpRoutes(object):
             elif state == ERR:
                 raise Exception("cannot parse bgp prefix info correctly " + str(state) + str(self.facts))
 
+    @staticmethod
+    def path_aspath(path):
+        '''
+        AS path of a path in the JSON output, 'Local' for a locally originated route as in the text output
+        '''
+        aspath = path.get('aspath', path.get('path', ''))
+        if isinstance(aspath, dict):
+            aspath = aspath.get('string', '')
+        return aspath if aspath else 'Local'
+
+    def parse_bgp_route_prefixes_json(self, prefixes, docs):
+        '''
+        parse BGP facts of the prefixes from the JSON output of "show ip bgp <prefix> json" of every prefix
+        '''
+        self.facts['bgp_route'] = defaultdict(dict)
+        for prefix, doc in zip(prefixes, docs):
+            # A prefix not in table gives {} or {"warning": "Network not in table"}
+            paths = doc.get('paths')
+            found_prefix = doc.get('prefix', '')
+            if not paths or (found_prefix != prefix and found_prefix.split('/')[0] != prefix):
+                self.facts['bgp_route'][prefix]['found'] = False
+                continue
+            self.facts['bgp_route'][prefix]['found'] = True
+            self.facts['bgp_route'][prefix]['path_num'] = str(len(paths))
+            self.facts['bgp_route'][prefix]['aspath'] = [self.path_aspath(path) for path in paths]
+
+    def parse_bgp_route_table_json(self, docs):
+        '''
+        parse BGP facts of all the prefixes from the JSON output of "show ip bgp json" and "show ipv6 bgp json"
+        '''
+        self.facts['bgp_route'] = defaultdict(dict)
+        for doc in docs:
+            for prefix, paths in doc.get('routes', {}).items():
+                self.facts['bgp_route'][prefix]['found'] = True
+                self.facts['bgp_route'][prefix]['path_num'] = str(len(paths))
+                self.facts['bgp_route'][prefix]['aspath'] = [self.path_aspath(path) for path in paths]
+
 
 def main():
     module = AnsibleModule(
             argument_spec=dict(
                 neighbor=dict(required=False, default=None),
                 direction=dict(required=False, choices=['adv', 'rec']),
-                prefix=dict(required=False, default=None)
+                prefix=dict(required=False, default=None),
+                prefixes=dict(required=False, type='list', default=None)
                 ),
             supports_check_mode=False
             )
@@ -303,10 +393,11 @@ def main():
     neighbor = m_args['neighbor']
     direction = m_args['direction']
     prefix = m_args['prefix']
+    prefixes = m_args['prefixes']
     regex_ip = re.compile('[0-9a-fA-F.:]+')
     regex_iprange = re.compile('[0-9a-fA-F.:]+\/\d+')
     regex_ipv4 = re.compile('[12][0-9]{0,2}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\/?\d+?')
-    if neighbor == None and direction == None and prefix == None:
+    if neighbor == None and direction == None and prefix == None and not prefixes:
         module.fail_json(msg="No support of parsing 'show ip bgp' full prefix table yet")
         return
     if neighbor and ((not netaddr.valid_ipv4(neighbor)) and (not netaddr.valid_ipv6(neighbor))):
@@ -320,14 +411,39 @@ def main():
     try:
         bgproute = BgpRoutes(neighbor, direction, prefix)
 
-        if prefix:
+        if prefixes:
+            if prefixes == ['all']:
+                commands = ['show ip bgp json', 'show ipv6 bgp json']
+            else:
+                commands = []
+                for p in prefixes:
+                    family = valid_prefix(p)
+                    if family is None:
+                        module.fail_json(msg="Invalid prefix %s ??" % p)
+                        return
+                    commands.append('show %s bgp %s json' % (family, p))
+            command = "docker exec -i bgp vtysh " + " ".join("-c '%s'" % c for c in commands)
+            rc, out, err = module.run_command(command)
+            if rc != 0:
+                err_message = "command %s failed rc=%d, out=%s, err=%s" %(command, rc, out, err)
+                module.fail_json(msg=err_message)
+                return
+            docs = decode_json_docs(out, commands)
+            if len(docs) != len(commands):
+                raise Exception("expected %d JSON outputs of %s, got %d" % (len(commands), command, len(docs)))
+            if prefixes == ['all']:
+                bgproute.parse_bgp_route_table_json(docs)
+            else:
+                bgproute.parse_bgp_route_prefixes_json(prefixes, docs)
+
+        elif prefix:
             if regex_ipv4.match(prefix):
                 command = "docker exec -i bgp vtysh -c 'show ip bgp " + str(prefix) + "'"
             else:
                 command = "docker exec -i bgp vtysh -c 'show ipv6 bgp " + str(prefix) +  "'"
             rc, out, err = module.run_command(command)
             if rc != 0:
-                err_message = "command %s failed rc=%d, out=%s, err=%s" %(command, rt, out, err)
+                err_message = "command %s failed rc=%d, out=%s, err=%s" %(command, rc, out, err)
                 module.fail_json(msg=err_message)
                 return
             bgproute.parse_bgp_route_prefix(out)
@@ -339,7 +455,7 @@ def main():
                 command = "docker exec -i bgp vtysh -c 'show ipv6 bgp neighbor " + str(neighbor) + " " + str(direction) + "'"
             rc, out, err = module.run_command(command)
             if rc !=  0:
-                err_message = "command %s failed rc=%d, out=%s, err=%s" %(command, rt, out, err)
+                err_message = "command %s failed rc=%d, out=%s, err=%s" %(command, rc, out, err)
                 module.fail_json(msg=err_message)
                 return
             bgproute.parse_bgp_route_adv(out)
@@ -355,6 +471,7 @@ def main():
 
 from ansible.module_utils.basic import *
 from collections  import defaultdict
+import json
 import netaddr
 if __name__ == "__main__":
     main()
@@ -2,12 +2,18 @@
 
 import lxml.etree as ET
 import yaml
+import glob
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 import traceback
+import urllib
 import ipaddr as ipaddress
 from operator import itemgetter
 from itertools import groupby
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 DOCUMENTATION='''
 module: conn_graph_facts.py
@@ -70,6 +76,10 @@ EXAMPLES='''
 
 LAB_CONNECTION_GRAPH_FILE = 'lab_connection_graph.xml'
 LAB_GRAPHFILE_PATH = 'files/'
+LAB_GRAPH_INDEX_PATH = os.path.expanduser('~/.ansible/conn_graph')
+LAB_GRAPH_INDEX_DIR = '{}_{}.v{}'
+# Increase when the index format changes, to drop the indexes built by the previous versions of this module
+LAB_GRAPH_INDEX_VERSION = 1
 
 class Parse_Lab_Graph():
     """
@@ -81,39 +91,136 @@ class Parse_Lab_Graph():
     The  2 csv files under ansible/files are csv files to list all devices and device links for Sonic testbed
     There is a sonic_server_links.yml file to describe the connections between servers port and Sonic devices
     This module conn_graph_file also parse the server links to have a full root fanout switches template for deployment.
+
+    The parsed graph (the lab devices, the links of every device and port VLANs as lists of intervals) is saved
+    as an index in LAB_GRAPH_INDEX_PATH, with a file per host, keyed by the name and the content hash of the graph
+    file. A host query loads the index instead of parsing the graph again until the file changes, and expands only
+    the VLANs of the queried host.
     """
 
     def __init__(self, xmlfile):
-        self.root = ET.parse(xmlfile)
+        self.xmlfile = xmlfile
         self.devices = {}
         self.vlanport = {}
         self.vlanrange = {}
         self.links = {}
+        self.host_port_vlans = {}
         self.server = defaultdict(dict)
         self.pngtag = 'PhysicalNetworkGraphDeclaration'
         self.dpgtag = 'DataPlaneGraph'
 
-    def port_vlanlist(self, vlanrange):
-        vlans = []
+    def port_vlan_intervals(self, vlanrange):
+        """
+        convert vlan range string like "201-220,230" to the sorted list of non-overlapping [first, last] intervals
+        """
+        intervals = []
         for vlanid in list(map(str.strip,vlanrange.split(','))):
             if vlanid.isdigit():
-                vlans.append(int(vlanid))
+                intervals.append([int(vlanid), int(vlanid)])
                 continue
             elif '-' in vlanid:
                 vlanlist = list(map(str.strip,vlanid.split('-')))
-                vlans.extend(range(int(vlanlist[0]), int(vlanlist[1])+1))
+                if int(vlanlist[0]) <= int(vlanlist[1]):
+                    intervals.append([int(vlanlist[0]), int(vlanlist[1])])
                 continue
             elif vlanid != '':
                 raise Exception, 'vlan range error "%s"'%vlanrange
-        vlans = sorted(set(vlans))
+
+        if len(intervals) < 2:
+            return intervals
+        merged = []
+        for interval in sorted(intervals):
+            if merged and interval[0] <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], interval[1])
+            else:
+                merged.append(interval)
+        return merged
+
+    def vlan_intervals2list(self, intervals):
+        vlans = []
+        for first, last in intervals:
+            vlans.extend(range(first, last + 1))
         return vlans
 
+    def port_vlanlist(self, vlanrange):
+        return self.vlan_intervals2list(self.port_vlan_intervals(vlanrange))
+
+    def get_index_dir(self):
+        with open(self.xmlfile, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return os.path.join(LAB_GRAPH_INDEX_PATH,
+                            LAB_GRAPH_INDEX_DIR.format(os.path.basename(self.xmlfile), digest, LAB_GRAPH_INDEX_VERSION))
+
+    def load_graph(self, hostname=None):
+        """
+        Load the devices and the given hostname data from the index of the graph, if the hostname is indexed.
+        Otherwise parse the whole graph and build the index if it doesn't exist yet.
+        """
+        index_dir = self.get_index_dir()
+        if hostname:
+            try:
+                # ports are kept in the order of the parsed graph, device_vlan_list follows it
+                with open(os.path.join(index_dir, 'hosts', urllib.quote(hostname, safe=''))) as f:
+                    host = json.load(f, object_pairs_hook=OrderedDict)
+                with open(os.path.join(index_dir, 'devices.json')) as f:
+                    self.devices = json.load(f)
+                self.links = {hostname: host['links']}
+                self.host_port_vlans = {hostname: host['port_vlans']}
+                return
+            except (IOError, ValueError, KeyError):
+                pass
+
+        self.parse_graph()
+        if not os.path.exists(os.path.join(index_dir, 'devices.json')):
+            self.save_index(index_dir)
+
+    def save_index(self, index_dir):
+        """
+        Save the index of the graph: the devices and a file per host with the host links and port vlans. Hosts
+        without own port vlans get the vlans of all the hosts, they are not indexed.
+        The indexes of the previous versions of the graph file are removed.
+        """
+        tmp_dir = None
+        try:
+            if not os.path.isdir(LAB_GRAPH_INDEX_PATH):
+                os.makedirs(LAB_GRAPH_INDEX_PATH)
+            tmp_dir = tempfile.mkdtemp(dir=LAB_GRAPH_INDEX_PATH)
+            with open(os.path.join(tmp_dir, 'devices.json'), 'w') as f:
+                json.dump(self.devices, f)
+            os.mkdir(os.path.join(tmp_dir, 'hosts'))
+            for hostname in self.links:
+                try:
+                    port_vlans = self.get_host_port_vlan_intervals(hostname)
+                except KeyError:
+                    # peer port without vlans, the error is reported when the host is queried
+                    continue
+                if port_vlans is None:
+                    continue
+                with open(os.path.join(tmp_dir, 'hosts', urllib.quote(hostname, safe='')), 'w') as f:
+                    json.dump({'links': self.links[hostname], 'port_vlans': port_vlans}, f)
+
+            # directory is renamed only if the index isn't saved concurrently by another run
+            os.rename(tmp_dir, index_dir)
+            tmp_dir = None
+
+            index_name = os.path.basename(self.xmlfile)
+            for path in glob.glob(os.path.join(LAB_GRAPH_INDEX_PATH, LAB_GRAPH_INDEX_DIR.format(index_name, '*', '*'))):
+                if path != index_dir:
+                    shutil.rmtree(path, ignore_errors=True)
+        except (IOError, OSError):
+            # the index is only an optimization, the graph is parsed again next time
+            pass
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
     def parse_graph(self):
         """
         Parse  the xml graph file
         """
+        root = ET.parse(self.xmlfile)
         deviceinfo = {}
-        deviceroot = self.root.find(self.pngtag).find('Devices')
+        deviceroot = root.find(self.pngtag).find('Devices')
         devices = deviceroot.findall('Device')
         if devices is not None:
             for dev in devices:
@@ -126,8 +233,8 @@ class Parse_Lab_Graph():
                     deviceinfo[hostname]['Type'] = devtype
                     self.links[hostname] = {}
         devicel2info = {}
-        devicel3s = self.root.find(self.dpgtag).findall('DevicesL3Info')
-        devicel2s = self.root.find(self.dpgtag).findall('DevicesL2Info')
+        devicel3s = root.find(self.dpgtag).findall('DevicesL3Info')
+        devicel2s = root.find(self.dpgtag).findall('DevicesL2Info')
         if devicel2s is not None:
             for l2info in devicel2s:
                 hostname = l2info.attrib['Hostname']
@@ -138,8 +245,8 @@ class Parse_Lab_Graph():
                         portname = vlan.attrib['portname']
                         portmode = vlan.attrib['mode']
                         portvlanid = vlan.attrib['vlanids']
-                        portvlanlist = self.port_vlanlist(portvlanid)
-                        devicel2info[hostname][portname] = {'mode': portmode, 'vlanids': portvlanid, 'vlanlist': portvlanlist}
+                        portvlanintervals = self.port_vlan_intervals(portvlanid)
+                        devicel2info[hostname][portname] = {'mode': portmode, 'vlanids': portvlanid, 'vlanintervals': portvlanintervals}
         if devicel3s is not None:
             for l3info in devicel3s:
                 hostname = l3info.attrib['Hostname']
@@ -150,7 +257,7 @@ class Parse_Lab_Graph():
                     deviceinfo[hostname]['mgmtip'] = str(mgmtip.ip)
                     management_gw = str(mgmtip.network+1)
                     deviceinfo[hostname]['ManagementGw'] = management_gw
-        allinks = self.root.find(self.pngtag).find('DeviceInterfaceLinks').findall('DeviceInterfaceLink')
+        allinks = root.find(self.pngtag).find('DeviceInterfaceLinks').findall('DeviceInterfaceLink')
         if allinks is not None:
             for link in allinks:
                 start_dev = link.attrib['StartDevice']
@@ -179,26 +286,34 @@ class Parse_Lab_Graph():
     def get_server_links(self):
         return self.server
 
-    def get_host_vlan(self, hostname):
+    def get_host_port_vlan_intervals(self, hostname):
         """
-        Calculate dpg vlan data for each link(port) and return a Switch/Device total Vlan range
+        return the given hostname ports vlan intervals, vlans of DevSonic ports are the vlans of their peer ports
         """
+        if hostname in self.host_port_vlans:
+            return self.host_port_vlans[hostname]
 
         if hostname in self.devices and  self.devices[hostname]['Type'].lower() == 'devsonic':
-            self.vlanport[hostname] = {}
+            port_vlans = {}
             for port in self.links[hostname]:
                 peerdevice = self.links[hostname][port]['peerdevice']
                 peerport = self.links[hostname][port]['peerport']
-                peerportmode = self.vlanport[peerdevice][peerport]['mode']
-                peervlanids = self.vlanport[peerdevice][peerport]['vlanids']
-                peervlanlist = self.vlanport[peerdevice][peerport]['vlanlist']
-                self.vlanport[hostname][port] = {'mode': peerportmode, 'vlanids': peervlanids, 'vlanlist': peervlanlist}
+                port_vlans[port] = self.vlanport[peerdevice][peerport]
+        else:
+            port_vlans = self.vlanport.get(hostname)
+
+        self.host_port_vlans[hostname] = port_vlans
+        return port_vlans
 
-        if hostname in self.vlanport:
-            dpgvlans = self.vlanport[hostname]
+    def get_host_vlan(self, hostname):
+        """
+        Calculate dpg vlan data for each link(port) and return a Switch/Device total Vlan range
+        """
+        dpgvlans = self.get_host_port_vlan_intervals(hostname)
+        if dpgvlans is not None:
             vlans  = []
             for intf in dpgvlans:
-                vlans += dpgvlans[intf]['vlanlist']
+                vlans += self.vlan_intervals2list(dpgvlans[intf]['vlanintervals'])
             self.vlanrange = self.convert_list2range(vlans)
             return {'VlanRange': self.vlanrange, 'VlanList': vlans }
 
@@ -211,14 +326,20 @@ class Parse_Lab_Graph():
         else:
             return self.devices
 
+    def expand_port_vlans(self, port_vlans):
+        return dict((port, {'mode': vlans['mode'], 'vlanids': vlans['vlanids'],
+                            'vlanlist': self.vlan_intervals2list(vlans['vlanintervals'])})
+                    for port, vlans in port_vlans.items())
+
     def get_host_port_vlans(self, hostname):
         """
         return the given hostname device  vlan port information
         """
-        if hostname in self.vlanport:
-            return self.vlanport[hostname]
+        port_vlans = self.get_host_port_vlan_intervals(hostname)
+        if port_vlans is not None:
+            return self.expand_port_vlans(port_vlans)
         else:
-            return self.vlanport
+            return dict((host, self.expand_port_vlans(port_vlans)) for host, port_vlans in self.vlanport.items())
 
     def get_host_connections(self, hostname):
         """
@@ -245,16 +366,17 @@ def main():
         else:
             filename = LAB_GRAPHFILE_PATH + LAB_CONNECTION_GRAPH_FILE
         lab_graph = Parse_Lab_Graph(filename)
-        lab_graph.parse_graph()
+        lab_graph.load_graph(hostname)
         dev = lab_graph.get_host_device_info(hostname)
         if dev is None:
             module.fail_json(msg="cannot find info for "+hostname)
         results = {}
         results['device_info'] =  lab_graph.get_host_device_info(hostname)
         results['device_conn'] = lab_graph.get_host_connections(hostname)
-        if lab_graph.get_host_vlan(hostname):
-            results['device_vlan_range'] = lab_graph.get_host_vlan(hostname)['VlanRange']
-            results['device_vlan_list'] = lab_graph.get_host_vlan(hostname)['VlanList']
+        host_vlan = lab_graph.get_host_vlan(hostname)
+        if host_vlan:
+            results['device_vlan_range'] = host_vlan['VlanRange']
+            results['device_vlan_list'] = host_vlan['VlanList']
         results['device_port_vlans'] = lab_graph.get_host_port_vlans(hostname)
         module.exit_json(ansible_facts=results)
     except (IOError, OSError):
@@ -12,11 +12,27 @@ description: start/stop exabgp instance with certain configurations
 Options:
     - option-name: name
       description: exabgp instance name
-      required: True
+      required: False, either name or peers is required
+    - option-name: peers
+      description: list of exabgp instances to manage at once. Every item is a dictionary with the name
+                   of the instance and its router_id, local_ip, peer_ip, local_asn, peer_asn and port.
+                   Items missing a parameter take it from the module parameters.
+      required: False
     - option-name: state
-      description: instance state. [started|stopped|present|absent]
+      description: instance state. [started|restarted|stopped|present|absent|status]
       required: True
-
+    - option-name: timeout
+      description: seconds to wait for the instances to run and, with wait_established, for the BGP sessions
+      required: False
+      default: 60
+    - option-name: wait_established
+      description: wait until the TCP sessions of the instances to their BGP peers are established
+      required: False
+      default: False
+
+Returns:
+    peers: dictionary of instance name to its supervisord status, time_to_running,
+           and with wait_established, established and time_to_established (seconds since the instances were started)
 '''
 
 EXAMPLES = '''
@@ -35,9 +51,21 @@ EXAMPLES = '''
   exabgp:
     name: t1
     state: stopped
+
+- name: start exabgp for several peers
+  exabgp:
+    state: started
+    router_id: 10.0.0.0
+    local_asn: 65534
+    peer_asn: 65535
+    wait_established: yes
+    peers:
+      - { name: t1, local_ip: 10.0.0.0, peer_ip: 10.0.0.1, port: 5000 }
+      - { name: t1-v6, local_ip: fc00::1, peer_ip: fc00::2, port: 6000 }
 '''
 
 import sys
+import socket
 import jinja2
 from ansible.module_utils.basic import *
 
@@ -61,25 +89,171 @@ while True:
 '''
 
 http_api_py = '''\
-from flask import Flask, request
+#!/usr/bin/env python
+"""
+Control API of an exabgp instance, started by exabgp as an API process with the TCP port to listen on.
+Every command written to stdout of this process is executed by exabgp.
+
+Two kinds of connections are accepted on the port:
+
+HTTP, any number of requests over a keep-alive connection:
+    POST / with the form field 'command', or 'commands' holding ';' separated commands,
+    or a JSON body {"commands": ["announce route ...", ...]}.
+    The reply is sent when exabgp has read all the commands of the request.
+    Other methods are answered with 405.
+
+Stream, the line 'stream' followed by newline-delimited commands:
+    stream
+    announce route 192.168.0.0/25 next-hop 10.0.0.1
+    announce route 192.168.0.128/25 next-hop 10.0.0.1
+    sync
+    The 'sync' line is answered with 'OK <count>' when exabgp has read all the commands received on
+    the connection so far, count is the number of those commands. 'TIMEOUT <count>' is sent instead
+    if exabgp didn't read them in SYNC_TIMEOUT seconds.
+
+Commands are passed to exabgp as they arrive. Writing to exabgp blocks while its pipe is full, which
+stops reading from the connection, so the client is slowed down to the rate exabgp takes the commands.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import cgi
+import fcntl
+import json
+import socket
+import struct
 import sys
+import termios
+import threading
+import time
+
+SYNC = 'sync'
+# First line of a stream connection, any other connection is HTTP
+STREAM_PREAMBLE = 'stream\\n'
+SYNC_TIMEOUT = 60
+RECV_SIZE = 1 << 16
+
+output_lock = threading.Lock()
+
+
+def write_commands(cmds):
+    if not cmds:
+        return
+    data = ''.join('%s\\n' % cmd for cmd in cmds)
+    with output_lock:
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+
+def wait_commands_read(timeout=SYNC_TIMEOUT):
+    """
+    Waits until exabgp has read everything written to its pipe.
+    Returns False if it didn't in timeout seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            pending = struct.unpack('i', fcntl.ioctl(sys.stdout.fileno(), termios.FIONREAD, '\\0' * 4))[0]
+        except IOError:
+            # Not a pipe, nothing to wait for.
+            return True
+        if pending == 0:
+            return True
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+
+
+class StreamHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        count = 0
+        data = ''
+        while True:
+            chunk = self.request.recv(RECV_SIZE)
+            if not chunk:
+                break
+            lines = (data + chunk).split('\\n')
+            data = lines.pop()
+            cmds = []
+            for line in lines:
+                cmd = line.strip()
+                if cmd == SYNC:
+                    write_commands(cmds)
+                    cmds = []
+                    status = 'OK' if wait_commands_read() else 'TIMEOUT'
+                    self.request.sendall('%s %d\\n' % (status, count))
+                elif cmd:
+                    cmds.append(cmd)
+                    count += 1
+            write_commands(cmds)
+        if data.strip():
+            write_commands([data.strip()])
+
+
+class HttpHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send the whole reply at once, it is flushed after every request.
+    wbufsize = -1
+
+    def do_POST(self):
+        content_type = self.headers.getheader('content-type', '')
+        if content_type.startswith('application/json'):
+            body = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+            cmds = body['commands'] if isinstance(body, dict) else body
+            cmds = [cmd.encode('utf-8') for cmd in cmds]
+        else:
+            form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                    environ={'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': content_type})
+            if 'commands' in form:
+                cmds = form.getfirst('commands').split(';')
+            else:
+                cmds = form.getlist('command')
+
+        write_commands(cmds)
+        if wait_commands_read():
+            self.reply(200, 'OK\\n')
+        else:
+            self.reply(504, 'TIMEOUT\\n')
+
+    def __getattr__(self, name):
+        # Handler of any other method than POST
+        if name.startswith('do_'):
+            return self.method_not_allowed
+        raise AttributeError(name)
+
+    def method_not_allowed(self):
+        self.reply(405, 'Method not allowed\\n', allow='POST')
+
+    def reply(self, code, text, allow=None):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(text)))
+        if allow:
+            self.send_header('Allow', allow)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        pass
 
-app = Flask(__name__)
 
-# Setup a command route to listen for prefix advertisements
-@app.route('/', methods=['POST'])
-def run_command():
-    if request.form.has_key('commands'):
-        cmds = request.form['commands'].split(';')
-    else:
-        cmds = [ request.form['command'] ]
-    for cmd in cmds:
-        sys.stdout.write("%s\\n" % cmd)
-    sys.stdout.flush()
-    return "OK\\n"
+class ApiServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def finish_request(self, request, client_address):
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        head = request.recv(len(STREAM_PREAMBLE), socket.MSG_PEEK | socket.MSG_WAITALL)
+        if head == STREAM_PREAMBLE:
+            request.recv(len(STREAM_PREAMBLE))
+            StreamHandler(request, client_address, self)
+        else:
+            HttpHandler(request, client_address, self)
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=sys.argv[1])
+    ApiServer(('0.0.0.0', int(sys.argv[1])), StreamHandler).serve_forever()
 '''
 
 exabgp_conf_tmpl = '''\
@@ -127,39 +301,92 @@ def exec_command(module, cmd, ignore_error=False, msg="executing command"):
                          (msg, rc, out, err))
     return out
 
-def get_exabgp_status(module, name):
-    output = exec_command(module, cmd="supervisorctl status exabgp-%s" % name)
-    m = re.search('^([\w|-]*)\s+(\w*).*$', output.decode("utf-8"))
-    return m.group(2)
+POLL_INTERVAL = 0.5
+BGP_PORT = 179
+
+def exabgp_programs(names):
+    return " ".join("exabgp-%s" % name for name in names)
+
+def get_exabgp_statuses(module, names):
+    output = exec_command(module, cmd="supervisorctl status %s" % exabgp_programs(names), ignore_error=True)
+    statuses = {}
+    for line in output.decode("utf-8").splitlines():
+        m = re.search('^exabgp-([\w|-]*)\s+(\w*).*$', line)
+        if m:
+            statuses[m.group(1)] = m.group(2)
+    return statuses
+
+def normalize_ip(ip):
+    ip = ip.strip('[]')
+    if ip.startswith('::ffff:') and '.' in ip:
+        ip = ip[len('::ffff:'):]
+    family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+    return socket.inet_pton(family, ip)
+
+def get_established_sessions(module):
+    """
+    Returns set of (local ip, peer ip) of the established TCP sessions to or from the BGP port.
+    """
+    output = exec_command(module, cmd="ss -tn state established ( sport = :%d or dport = :%d )" % (BGP_PORT, BGP_PORT))
+    sessions = set()
+    for line in output.decode("utf-8").splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        try:
+            sessions.add((normalize_ip(fields[-2].rsplit(':', 1)[0]), normalize_ip(fields[-1].rsplit(':', 1)[0])))
+        except (socket.error, ValueError):
+            continue
+    return sessions
 
 def refresh_supervisord(module):
     exec_command(module, cmd="supervisorctl reread", ignore_error=True)
     exec_command(module, cmd="supervisorctl update", ignore_error=True)
 
-def start_exabgp(module, name):
-    refresh_supervisord(module)
-    exec_command(module, cmd="supervisorctl start exabgp-%s" % name)
-
-    for count in range(0, 60):
-        time.sleep(1)
-        status = get_exabgp_status(module, name)
-        if u'RUNNING' == status:
+def wait_exabgp(module, peers, start, timeout, wait_established):
+    """
+    Polls all the instances at once until they are running and, with wait_established,
+    their BGP peers are connected, or until timeout.
+    Returns the per instance report and list of instances not ready.
+    """
+    report = dict((peer['name'], {'status': None, 'time_to_running': None}) for peer in peers)
+    pending = set(report)
+    sessions = {}
+    if wait_established:
+        for peer in peers:
+            report[peer['name']].update({'established': False, 'time_to_established': None})
+            sessions[peer['name']] = (normalize_ip(peer['local_ip']), normalize_ip(peer['peer_ip']))
+
+    while True:
+        statuses = get_exabgp_statuses(module, sorted(report))
+        established = get_established_sessions(module) if wait_established else set()
+        now = round(time.time() - start, 2)
+        for name in list(pending):
+            report[name]['status'] = statuses.get(name)
+            if report[name]['status'] == u'RUNNING' and report[name]['time_to_running'] is None:
+                report[name]['time_to_running'] = now
+            if wait_established and sessions[name] in established:
+                report[name]['established'] = True
+                report[name]['time_to_established'] = now
+            if report[name]['time_to_running'] is not None and (not wait_established or report[name]['established']):
+                pending.discard(name)
+        if not pending or now > timeout:
             break
-    assert u'RUNNING' == status
+        time.sleep(POLL_INTERVAL)
+
+    return report, sorted(pending)
 
-def restart_exabgp(module, name):
+def start_exabgp(module, names):
     refresh_supervisord(module)
-    exec_command(module, cmd="supervisorctl restart exabgp-%s" % name)
+    # New instances are already started by the update
+    exec_command(module, cmd="supervisorctl start %s" % exabgp_programs(names), ignore_error=True)
 
-    for count in range(0, 60):
-        time.sleep(1)
-        ret = get_exabgp_status(module, name)
-        if u'RUNNING' == status:
-            break
-    assert u'RUNNING' == status
+def restart_exabgp(module, names):
+    refresh_supervisord(module)
+    exec_command(module, cmd="supervisorctl restart %s" % exabgp_programs(names), ignore_error=True)
 
-def stop_exabgp(module, name):
-    exec_command(module, cmd="supervisorctl stop exabgp-%s" % name, ignore_error=True)
+def stop_exabgp(module, names):
+    exec_command(module, cmd="supervisorctl stop %s" % exabgp_programs(names), ignore_error=True)
 
 def setup_exabgp_conf(name, router_id, local_ip, peer_ip, local_asn, peer_asn, port, auto_flush=True, group_updates=True):
     try:
@@ -183,7 +410,7 @@ def setup_exabgp_conf(name, router_id, local_ip, peer_ip, local_asn, peer_asn, p
 def remove_exabgp_conf(name):
     try:
         os.remove("/etc/exabgp/%s.conf" % name)
-    except e:
+    except OSError:
         pass
 
 
@@ -196,7 +423,7 @@ def setup_exabgp_supervisord_conf(name):
 def remove_exabgp_supervisord_conf(name):
     try:
         os.remove("/etc/supervisor/conf.d/exabgp-%s.conf" % name)
-    except e:
+    except OSError:
         pass
 
 def setup_exabgp_processor():
@@ -210,10 +437,30 @@ def setup_exabgp_processor():
     with open("/usr/share/exabgp/http_api.py", 'w') as out_file:
         out_file.write(http_api_py)
 
+PEER_PARAMS = ['router_id', 'local_ip', 'peer_ip', 'local_asn', 'peer_asn', 'port']
+
+def get_peers(module):
+    """
+    Returns the list of instances to manage, either the instance given by the module parameters or the peers list.
+    """
+    defaults = dict((param, module.params[param]) for param in PEER_PARAMS)
+    if not module.params['peers']:
+        return [dict(defaults, name=module.params['name'])]
+
+    peers = []
+    for item in module.params['peers']:
+        if not isinstance(item, dict) or 'name' not in item:
+            module.fail_json(msg="Every item of peers needs a name: %s" % str(item))
+        peer = dict(defaults)
+        peer.update(item)
+        peers.append(peer)
+    return peers
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
-            name=dict(required=True, type='str'),
+            name=dict(required=False, type='str'),
+            peers=dict(required=False, type='list'),
             state=dict(required=True, choices=['started', 'restarted', 'stopped', 'present', 'absent', 'status'], type='str'),
             router_id=dict(required=False, type='str'),
             local_ip=dict(required=False, type='str'),
@@ -221,48 +468,60 @@ def main():
             local_asn=dict(required=False, type='int'),
             peer_asn=dict(required=False, type='int'),
             port=dict(required=False, type='int', default=5000),
+            timeout=dict(required=False, type='int', default=60),
+            wait_established=dict(required=False, type='bool', default=False),
         ),
+        required_one_of=[['name', 'peers']],
+        mutually_exclusive=[['name', 'peers']],
         supports_check_mode=False)
 
-    name  = module.params['name']
     state = module.params['state']
-    router_id = module.params['router_id']
-    local_ip  = module.params['local_ip']
-    peer_ip   = module.params['peer_ip']
-    local_asn = module.params['local_asn']
-    peer_asn  = module.params['peer_asn']
-    port      = module.params['port']
+    timeout = module.params['timeout']
+    wait_established = module.params['wait_established']
+    peers = get_peers(module)
+    names = [peer['name'] for peer in peers]
 
     setup_exabgp_processor()
 
     result = {}
+    not_ready = []
     try:
+        if state in ['started', 'restarted', 'present']:
+            for peer in peers:
+                setup_exabgp_conf(peer['name'], peer['router_id'], peer['local_ip'], peer['peer_ip'],
+                                  peer['local_asn'], peer['peer_asn'], peer['port'])
+                setup_exabgp_supervisord_conf(peer['name'])
+        start = time.time()
         if state == 'started':
-            setup_exabgp_conf(name, router_id, local_ip, peer_ip, local_asn, peer_asn, port)
-            setup_exabgp_supervisord_conf(name)
-            start_exabgp(module, name)
+            start_exabgp(module, names)
         elif state == 'restarted':
-            setup_exabgp_conf(name, router_id, local_ip, peer_ip, local_asn, peer_asn, port)
-            setup_exabgp_supervisord_conf(name)
-            restart_exabgp(module, name)
+            restart_exabgp(module, names)
         elif state == 'present':
-            setup_exabgp_conf(name, router_id, local_ip, peer_ip, local_asn, peer_asn, port)
-            setup_exabgp_supervisord_conf(name)
             refresh_supervisord(module)
         elif state == 'stopped':
-            stop_exabgp(module, name)
+            stop_exabgp(module, names)
         elif state == 'absent':
-            stop_exabgp(module, name)
-            remove_exabgp_supervisord_conf(name)
-            remove_exabgp_conf(name)
+            stop_exabgp(module, names)
+            for name in names:
+                remove_exabgp_supervisord_conf(name)
+                remove_exabgp_conf(name)
             refresh_supervisord(module)
         elif state == 'status':
-            status = get_exabgp_status(module, name)
-            result = {'status' : status}
+            statuses = get_exabgp_statuses(module, names)
+            if module.params['name']:
+                result = {'status' : statuses.get(module.params['name'])}
+            else:
+                result = {'peers' : dict((name, {'status': statuses.get(name)}) for name in names)}
+
+        if state in ['started', 'restarted']:
+            result['peers'], not_ready = wait_exabgp(module, peers, start, timeout, wait_established)
     except:
         err = str(sys.exc_info())
         module.fail_json(msg="Error: %s" % err)
 
+    if not_ready:
+        module.fail_json(msg="exabgp instances not ready in %d seconds: %s" % (timeout, ", ".join(not_ready)), **result)
+
     module.exit_json(**result)
 
 if __name__ == '__main__':
@@ -8,6 +8,7 @@ description: The module scans the 'directory' in search of files which filenames
 The found files are ungzipped and combined together in the rotation order. After that all lines after
 'start_string' are copied into a file with name 'target_filename'. All input strings with 'nsible' in it
 aren't considered as 'start_string' to avoid clashing with ansible output.
+Log files can be rotated during extraction, in this case extraction is repeated.
 
 Options:
     - option-name: directory
@@ -30,6 +31,14 @@ Options:
       required: True
       Default: None
 
+    - option-name: start_position
+      description: a position of the log file recorded before 'start_string' was logged, a dict with
+                   'inode' and 'offset' keys. When the file with the recorded inode still exists
+                   uncompressed, 'start_string' is searched starting from the recorded offset, and
+                   extraction continues through the newer files. Otherwise all files are scanned.
+      required: False
+      Default: None
+
 '''
 
 EXAMPLES = '''
@@ -46,6 +55,16 @@ EXAMPLES = '''
     dest: '/tmp/'
     flat: yes
 
+- name: Extract all syslog entries since the loganalyzer start marker, using position recorded by loganalyzer init
+  extract_log:
+    directory: '/var/log'
+    file_prefix: 'syslog'
+    start_string: 'start-LogAnalyzer-test.2020-02-27-10:00:00'
+    target_filename: '/tmp/syslog'
+    start_position:
+      inode: 1234567
+      offset: 98765
+
 - name: Extract all sairedis.rec entries since the last reboot
   extract_log:
     directory: '/var/log/swss'
@@ -76,18 +95,22 @@ EXAMPLES = '''
 import os
 import gzip
 import re
+import shutil
 import sys
+import time
 from datetime import datetime
 from ansible.module_utils.basic import *
 
 
+def open_log(path):
+    if 'gz' in path:
+        return gzip.GzipFile(path)
+    return open(path)
+
+
 def extract_lines(directory, filename, target_string):
     path = os.path.join(directory, filename)
-    file = None
-    if 'gz' in path:
-        file = gzip.GzipFile(path)
-    else:
-        file = open(path)
+    file = open_log(path)
     result = None
     with file:
         # This might be a gunzip file or logrotate issue, there has
@@ -208,12 +231,7 @@ def combine_logs_and_save(directory, filenames, start_string, target_filename):
     with open(target_filename, 'w') as fp:
         for filename in reversed(filenames):
             path = os.path.join(directory, filename)
-            file = None
-            if 'gz' in path:
-                file = gzip.GzipFile(path)
-            else:
-                file = open(path)
-            with file:
+            with open_log(path) as file:
                 for line in file:
                     if line == start_string:
                         do_copy = True
@@ -221,13 +239,109 @@ def combine_logs_and_save(directory, filenames, start_string, target_filename):
                         fp.write(line)
 
 
-def extract_log(directory, prefixname, target_string, target_filename):
-    filenames = list_files(directory, prefixname)
+def find_file_with_position(directory, filenames, start_position):
+    """Finds the file which still contains @start_position, i.e. the uncompressed
+    file with the recorded inode and size not less than the recorded offset.
+    Returns index of the file in @filenames or None if rotation invalidated the position"""
+
+    inode = int(start_position['inode'])
+    offset = int(start_position['offset'])
+    for index, filename in enumerate(filenames):
+        path = os.path.join(directory, filename)
+        if 'gz' in path:
+            continue
+        stat = os.stat(path)
+        if stat.st_ino == inode:
+            return index if stat.st_size >= offset else None
+
+    return None
+
+
+def seek_to_line(file, offset):
+    """Moves @file position to the beginning of the first line starting at or after @offset"""
+
+    if offset == 0:
+        file.seek(0)
+        return
+    file.seek(offset - 1)
+    if file.read(1) != '\n':
+        file.readline()
+
+
+def extract_log_from_position(directory, filenames, target_string, target_filename, start_position):
+    """Extracts lines starting from the first line with @target_string found after @start_position.
+    The search starts from the recorded offset and continues through the newer files, if the log
+    was rotated after the position was recorded. Returns False if the position is no longer valid
+    or @target_string was not found after it"""
+
+    index = find_file_with_position(directory, filenames, start_position)
+    if index is None:
+        return False
+
+    found = False
+    with open(target_filename, 'w') as fp:
+        for position, filename in enumerate(reversed(filenames[:index + 1])):
+            with open_log(os.path.join(directory, filename)) as file:
+                if not found:
+                    if position == 0:
+                        seek_to_line(file, int(start_position['offset']))
+                    for line in iter(file.readline, ''):
+                        if target_string in line and 'nsible' not in line:
+                            fp.write(line)
+                            found = True
+                            break
+                if found:
+                    shutil.copyfileobj(file, fp)
+
+    return found
+
+
+# Number of extraction attempts when log files are rotated during extraction
+ROTATION_RETRIES = 3
+# Delay between extraction attempts, gives logrotate time to finish compression
+ROTATION_RETRY_DELAY = 1
+
+
+def snapshot_files(directory, filenames):
+    """Returns identity of log files, which is used to detect log rotation during extraction.
+    Assumes @filenames are sorted and first file in @filenames is the newest log file,
+    which size is not a part of identity since the file is still being written to"""
+
+    snapshot = []
+    for index, filename in enumerate(filenames):
+        stat = os.stat(os.path.join(directory, filename))
+        snapshot.append((filename, stat.st_ino, stat.st_size if index > 0 else None))
+    return snapshot
+
+
+def extract_log_once(directory, filenames, target_string, target_filename, start_position):
+    if start_position and extract_log_from_position(directory, filenames, target_string, target_filename, start_position):
+        return
     file_with_latest_line, latest_line = extract_latest_line_with_string(directory, filenames, target_string)
     files_to_copy = calculate_files_to_copy(filenames, file_with_latest_line)
     combine_logs_and_save(directory, files_to_copy, latest_line, target_filename)
 
 
+def extract_log(directory, prefixname, target_string, target_filename, start_position=None):
+    """Extracts log, while logrotate is allowed to run. If log files were renamed, compressed
+    or removed during extraction, the extraction is repeated"""
+
+    for attempt in range(ROTATION_RETRIES):
+        try:
+            filenames = list_files(directory, prefixname)
+            snapshot = snapshot_files(directory, filenames)
+            extract_log_once(directory, filenames, target_string, target_filename, start_position)
+            if snapshot_files(directory, list_files(directory, prefixname)) == snapshot:
+                return
+        except Exception:
+            # A file might be removed or partially compressed by logrotate
+            if attempt == ROTATION_RETRIES - 1:
+                raise
+        time.sleep(ROTATION_RETRY_DELAY)
+
+    raise Exception("{} files in {} were rotated during extraction".format(prefixname, directory))
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
@@ -235,12 +349,13 @@ def main():
             file_prefix=dict(required=True, type='str'),
             start_string=dict(required=True, type='str'),
             target_filename=dict(required=True, type='str'),
+            start_position=dict(required=False, type='dict', default=None),
         ),
         supports_check_mode=False)
 
     p = module.params;
     try:
-        extract_log(p['directory'], p['file_prefix'], p['start_string'], p['target_filename'])
+        extract_log(p['directory'], p['file_prefix'], p['start_string'], p['target_filename'], p['start_position'])
     except:
         err = str(sys.exc_info())
         module.fail_json(msg="Error: %s" % err)
@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 import calendar
+import glob
+import hashlib
 import os
+import re
+import tempfile
 import sys
 import socket
 import struct
@@ -28,6 +32,16 @@ options:
         description:
             - Set to target snmp server (normally {{inventory_hostname}})
         required: true
+    filename:
+        description:
+            - Path to the minigraph file to parse
+        required: false
+    cache:
+        description:
+            - Cache parsed facts in ~/.ansible/minigraph, keyed by the hostname and the hash of minigraph content.
+              The minigraph is parsed again only when its content changes.
+        required: false
+        default: true
 '''
 
 EXAMPLES = '''
@@ -44,6 +58,9 @@ ns3 = "http://www.w3.org/2001/XMLSchema-instance"
 ANSIBLE_USER_MINIGRAPH_PATH = os.path.expanduser('~/.ansible/minigraph')
 ANSIBLE_LOCAL_MINIGRAPH_PATH = '{}.xml'
 ANSIBLE_USER_MINIGRAPH_MAX_AGE = 86400  # 24-hours (in seconds)
+ANSIBLE_USER_MINIGRAPH_FACTS = '{}_{}.v{}.json'
+# Increase when the parsed facts change, to drop the facts cached by the previous versions of this module
+MINIGRAPH_FACTS_VERSION = 1
 
 class minigraph_encoder(json.JSONEncoder):
     def default(self, obj):
@@ -53,6 +70,244 @@ class minigraph_encoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def _tag(namespace, name):
+    return intern(str(QName(namespace, name)))
+
+# Tags of the minigraph elements, compared with the tags of parsed elements
+HWSKU_TAG = _tag(ns, "HwSku")
+HOSTNAME_TAG = _tag(ns, "Hostname")
+DPG_TAG = _tag(ns, "DpgDec")
+CPG_TAG = _tag(ns, "CpgDec")
+PNG_TAG = _tag(ns, "PngDec")
+UNG_TAG = _tag(ns, "UngDec")
+META_TAG = _tag(ns, "MetadataDeclaration")
+
+DEVICE_INTERFACE_LINKS_TAG = _tag(ns, "DeviceInterfaceLinks")
+DEVICE_LINK_BASE_TAG = _tag(ns, "DeviceLinkBase")
+ELEMENT_TYPE_TAG = _tag(ns, "ElementType")
+START_DEVICE_TAG = _tag(ns, "StartDevice")
+START_PORT_TAG = _tag(ns, "StartPort")
+END_DEVICE_TAG = _tag(ns, "EndDevice")
+END_PORT_TAG = _tag(ns, "EndPort")
+DEVICES_TAG = _tag(ns, "Devices")
+DEVICE_TAG = _tag(ns, "Device")
+ADDRESS_TAG = _tag(ns, "Address")
+MANAGEMENT_ADDRESS_TAG = _tag(ns, "ManagementAddress")
+IP_PREFIX_TAG = _tag(ns2, "IPPrefix")
+XSI_TYPE_ATTR = _tag(ns3, "type")
+
+IP_INTERFACES_TAG = _tag(ns, "IPInterfaces")
+IP_INTERFACE_TAG = _tag(ns, "IPInterface")
+ATTACH_TO_TAG = _tag(ns, "AttachTo")
+PREFIX_TAG = _tag(ns, "Prefix")
+LOOPBACK_IP_INTERFACES_TAG = _tag(ns, "LoopbackIPInterfaces")
+LOOPBACK_IP_INTERFACE_TAG = _tag(ns1, "LoopbackIPInterface")
+PREFIX_STR_TAG = _tag(ns1, "PrefixStr")
+MANAGEMENT_IP_INTERFACES_TAG = _tag(ns, "ManagementIPInterfaces")
+MANAGEMENT_IP_INTERFACE_TAG = _tag(ns1, "ManagementIPInterface")
+PORT_CHANNEL_INTERFACES_TAG = _tag(ns, "PortChannelInterfaces")
+PORT_CHANNEL_TAG = _tag(ns, "PortChannel")
+NAME_TAG = _tag(ns, "Name")
+FALLBACK_TAG = _tag(ns, "Fallback")
+VLAN_INTERFACES_TAG = _tag(ns, "VlanInterfaces")
+VLAN_INTERFACE_TAG = _tag(ns, "VlanInterface")
+VLAN_ID_TAG = _tag(ns, "VlanID")
+DHCP_RELAYS_TAG = _tag(ns, "DhcpRelays")
+ACL_INTERFACES_TAG = _tag(ns, "AclInterfaces")
+ACL_INTERFACE_TAG = _tag(ns, "AclInterface")
+IN_ACL_TAG = _tag(ns, "InAcl")
+
+PEERING_SESSIONS_TAG = _tag(ns, "PeeringSessions")
+BGP_SESSION_TAG = _tag(ns, "BGPSession")
+START_ROUTER_TAG = _tag(ns, "StartRouter")
+START_PEER_TAG = _tag(ns, "StartPeer")
+END_ROUTER_TAG = _tag(ns, "EndRouter")
+END_PEER_TAG = _tag(ns, "EndPeer")
+ROUTERS_TAG = _tag(ns, "Routers")
+BGP_ROUTER_DECLARATION_TAG = _tag(ns1, "BGPRouterDeclaration")
+ASN_TAG = _tag(ns1, "ASN")
+HOSTNAME1_TAG = _tag(ns1, "Hostname")
+PEERS_TAG = _tag(ns1, "Peers")
+BGP_PEER_TAG = _tag(ns, "BGPPeer")
+PEERS_RANGE_TAG = _tag(ns1, "PeersRange")
+NAME1_TAG = _tag(ns1, "Name")
+
+DEVICE_METADATA_TAG = _tag(ns1, "DeviceMetadata")
+PROPERTIES_TAG = _tag(ns1, "Properties")
+DEVICE_PROPERTY_TAG = _tag(ns1, "DeviceProperty")
+VALUE_TAG = _tag(ns1, "Value")
+
+
+def _children(elem, tag):
+    if elem is None:
+        return []
+    return elem.iterchildren(tag)
+
+
+def read_png_link(link):
+    """
+    :param link: DeviceLinkBase element
+    :return: tuple(xsi type, element type, start device, start port, end device, end port)
+    """
+    fields = {}
+    for node in link:
+        fields[node.tag] = node.text
+    return (link.get(XSI_TYPE_ATTR), fields.get(ELEMENT_TYPE_TAG),
+            fields.get(START_DEVICE_TAG), fields.get(START_PORT_TAG),
+            fields.get(END_DEVICE_TAG), fields.get(END_PORT_TAG))
+
+
+def read_png_device(device):
+    """
+    :param device: Device element
+    :return: tuple(hostname, device facts)
+    """
+    name = None
+    facts = {'lo_addr': None, 'type': device.get(XSI_TYPE_ATTR), 'mgmt_addr': None, 'hwsku': None}
+    for node in device:
+        if node.tag == ADDRESS_TAG:
+            facts['lo_addr'] = node.find(IP_PREFIX_TAG).text.split('/')[0]
+        elif node.tag == MANAGEMENT_ADDRESS_TAG:
+            facts['mgmt_addr'] = node.find(IP_PREFIX_TAG).text.split('/')[0]
+        elif node.tag == HOSTNAME_TAG:
+            name = node.text
+        elif node.tag == HWSKU_TAG:
+            facts['hwsku'] = node.text
+    return name, facts
+
+
+def read_dpg(dpg_info):
+    """
+    :param dpg_info: child element of DpgDec
+    :return: dict with the data plane configuration of a device, port names are not converted from aliases yet
+    """
+    dpg = {'hostname': dpg_info.findtext(HOSTNAME_TAG)}
+    dpg['intfs'] = [(intf.findtext(ATTACH_TO_TAG), intf.findtext(PREFIX_TAG))
+                    for intf in _children(dpg_info.find(IP_INTERFACES_TAG), IP_INTERFACE_TAG)]
+    dpg['lo_intfs'] = [(intf.findtext(ATTACH_TO_TAG), intf.findtext(PREFIX_STR_TAG))
+                       for intf in _children(dpg_info.find(LOOPBACK_IP_INTERFACES_TAG), LOOPBACK_IP_INTERFACE_TAG)]
+    dpg['mgmt_intfs'] = [(intf.findtext(ATTACH_TO_TAG), intf.findtext(PREFIX_STR_TAG))
+                         for intf in _children(dpg_info.find(MANAGEMENT_IP_INTERFACES_TAG), MANAGEMENT_IP_INTERFACE_TAG)]
+    dpg['pcs'] = []
+    for pc in _children(dpg_info.find(PORT_CHANNEL_INTERFACES_TAG), PORT_CHANNEL_TAG):
+        fallback_node = pc.find(FALLBACK_TAG)
+        dpg['pcs'].append((pc.findtext(NAME_TAG), pc.findtext(ATTACH_TO_TAG),
+                           fallback_node is not None, fallback_node.text if fallback_node is not None else None))
+    dpg['vlans'] = []
+    for vlan in _children(dpg_info.find(VLAN_INTERFACES_TAG), VLAN_INTERFACE_TAG):
+        dhcp_node = vlan.find(DHCP_RELAYS_TAG)
+        dpg['vlans'].append((vlan.findtext(NAME_TAG), vlan.findtext(VLAN_ID_TAG), vlan.findtext(ATTACH_TO_TAG),
+                             dhcp_node.text if dhcp_node is not None else None))
+    dpg['acls'] = [(acl.findtext(IN_ACL_TAG), acl.findtext(ATTACH_TO_TAG))
+                   for acl in _children(dpg_info.find(ACL_INTERFACES_TAG), ACL_INTERFACE_TAG)]
+    return dpg
+
+
+def read_cpg_router(router):
+    """
+    :param router: BGPRouterDeclaration element
+    :return: tuple(asn, hostname, list of tuple(name, peers range) for the peers with range)
+    """
+    peers_with_range = []
+    for peer in _children(router.find(PEERS_TAG), BGP_PEER_TAG):
+        if peer.find(PEERS_RANGE_TAG) is not None:
+            peers_with_range.append((peer.findtext(NAME1_TAG), peer.findtext(PEERS_RANGE_TAG)))
+    return router.findtext(ASN_TAG), router.findtext(HOSTNAME1_TAG), peers_with_range
+
+
+def read_meta_device(device):
+    """
+    :param device: DeviceMetadata element
+    :return: tuple(device name, list of tuple(property name, property value))
+    """
+    properties = [(prop.findtext(NAME1_TAG), prop.findtext(VALUE_TAG))
+                  for prop in _children(device.find(PROPERTIES_TAG), DEVICE_PROPERTY_TAG)]
+    return device.findtext(NAME1_TAG), properties
+
+
+def _free(elem):
+    # drop the element content and the already processed siblings, the rest of the document is not kept in memory
+    elem.clear()
+    parent = elem.getparent()
+    while elem.getprevious() is not None:
+        del parent[0]
+
+
+def read_section_element(section_tag, elem):
+    """
+    :param section_tag: tag of the minigraph section the element belongs to
+    :param elem: element of the minigraph section
+    :return: record read from the element, None if the element is not read by itself
+    """
+    tag = elem.tag
+    parent_tag = elem.getparent().tag
+    if section_tag == PNG_TAG or section_tag == UNG_TAG:
+        if tag == DEVICE_LINK_BASE_TAG and parent_tag == DEVICE_INTERFACE_LINKS_TAG:
+            return ('link',) + read_png_link(elem)
+        elif tag == DEVICE_TAG and parent_tag == DEVICES_TAG:
+            return ('device',) + read_png_device(elem)
+    elif section_tag == CPG_TAG:
+        if tag == BGP_SESSION_TAG and parent_tag == PEERING_SESSIONS_TAG:
+            return ('session', elem.findtext(START_ROUTER_TAG), elem.findtext(START_PEER_TAG),
+                    elem.findtext(END_ROUTER_TAG), elem.findtext(END_PEER_TAG))
+        elif tag == BGP_ROUTER_DECLARATION_TAG and parent_tag == ROUTERS_TAG:
+            return ('router',) + read_cpg_router(elem)
+    elif section_tag == META_TAG:
+        if tag == DEVICE_METADATA_TAG and parent_tag == DEVICES_TAG:
+            return read_meta_device(elem)
+    return None
+
+
+def read_minigraph(mini_graph_path):
+    """
+    Read the minigraph in one streaming pass. Hostname and HwSku, required for interpreting the graph, are at the end
+    of the document, so the sections are only read here into plain records and parsed afterwards. Elements are freed
+    as soon as they are read, the whole document is never kept in memory.
+
+    :param mini_graph_path: path to the minigraph file
+    :return: tuple(hwsku, hostname, list of tuple(section tag, list of section records) in the document order)
+    """
+    hwsku = None
+    hostname = None
+    sections = []
+    records = []
+    root = None
+
+    for _, elem in ET.iterparse(mini_graph_path):
+        if root is None:
+            root = elem.getroottree().getroot()
+
+        parent = elem.getparent()
+        if parent is None:
+            continue
+
+        if parent is root:
+            # end of a section
+            if elem.tag == HWSKU_TAG:
+                hwsku = elem.text
+            elif elem.tag == HOSTNAME_TAG:
+                hostname = elem.text
+            sections.append((elem.tag, records))
+            records = []
+            _free(elem)
+            continue
+
+        section = parent.getparent()
+        if section is root:
+            # DpgDec has small data plane configuration per device, it is read at once
+            record = read_dpg(elem) if parent.tag == DPG_TAG else None
+        elif section.getparent() is root:
+            record = read_section_element(section.tag, elem)
+        else:
+            record = None
+
+        if record is not None:
+            records.append(record)
+            _free(elem)
+
+    return hwsku, hostname, sections
+
+
 def parse_png(png, hname):
     neighbors = {}
     devices = {}
@@ -60,84 +315,48 @@ def parse_png(png, hname):
     console_port = ''
     mgmt_dev = ''
     mgmt_port = ''
-    for child in png:
-        if child.tag == str(QName(ns, "DeviceInterfaceLinks")):
-            for link in child.findall(str(QName(ns, "DeviceLinkBase"))):
-                linktype = link.find(str(QName(ns, "ElementType"))).text
-                if linktype != "DeviceInterfaceLink" and linktype != "UnderlayInterfaceLink":
-                    continue
-
-                enddevice = link.find(str(QName(ns, "EndDevice"))).text
-                endport = link.find(str(QName(ns, "EndPort"))).text
-                startdevice = link.find(str(QName(ns, "StartDevice"))).text
-                startport = link.find(str(QName(ns, "StartPort"))).text
-
-                if enddevice == hname:
-                    if port_alias_to_name_map.has_key(endport):
-                        endport = port_alias_to_name_map[endport]
-                    neighbors[endport] = {'name': startdevice, 'port': startport}
-                else:
-                    if port_alias_to_name_map.has_key(startport):
-                        startport = port_alias_to_name_map[startport]
-                    neighbors[startport] = {'name': enddevice, 'port': endport}
-
-        if child.tag == str(QName(ns, "Devices")):
-            for device in child.findall(str(QName(ns, "Device"))):
-                lo_addr = None
-                # don't shadow type()
-                d_type = None
-                mgmt_addr = None
-                hwsku = None
-                if str(QName(ns3, "type")) in device.attrib:
-                    d_type = device.attrib[str(QName(ns3, "type"))]
-
-                for node in device:
-                    if node.tag == str(QName(ns, "Address")):
-                        lo_addr = node.find(str(QName(ns2, "IPPrefix"))).text.split('/')[0]
-                    elif node.tag == str(QName(ns, "ManagementAddress")):
-                        mgmt_addr = node.find(str(QName(ns2, "IPPrefix"))).text.split('/')[0]
-                    elif node.tag == str(QName(ns, "Hostname")):
-                        name = node.text
-                    elif node.tag == str(QName(ns, "HwSku")):
-                        hwsku = node.text
-
-                devices[name] = {'lo_addr': lo_addr, 'type': d_type, 'mgmt_addr': mgmt_addr, 'hwsku': hwsku}
-
-        if child.tag == str(QName(ns, "DeviceInterfaceLinks")):
-            for if_link in child.findall(str(QName(ns, 'DeviceLinkBase'))):
-                if str(QName(ns3, "type")) in if_link.attrib:
-                    link_type = if_link.attrib[str(QName(ns3, "type"))]
-                    if link_type == 'DeviceSerialLink':
-                        for node in if_link:
-                            if node.tag == str(QName(ns, "EndPort")):
-                                console_port = node.text.split()[-1]
-                            elif node.tag == str(QName(ns, "EndDevice")):
-                                console_dev = node.text
-                    elif link_type == 'DeviceMgmtLink':
-                        for node in if_link:
-                            if node.tag == str(QName(ns, "EndPort")):
-                                mgmt_port = node.text.split()[-1]
-                            elif node.tag == str(QName(ns, "EndDevice")):
-                                mgmt_dev = node.text
+    for record in png:
+        if record[0] == 'device':
+            _, name, device = record
+            devices[name] = device
+            continue
+
+        _, link_type, element_type, startdevice, startport, enddevice, endport = record
+        if element_type == "DeviceInterfaceLink" or element_type == "UnderlayInterfaceLink":
+            if enddevice == hname:
+                if port_alias_to_name_map.has_key(endport):
+                    endport = port_alias_to_name_map[endport]
+                neighbors[endport] = {'name': startdevice, 'port': startport}
+            else:
+                if port_alias_to_name_map.has_key(startport):
+                    startport = port_alias_to_name_map[startport]
+                neighbors[startport] = {'name': enddevice, 'port': endport}
+
+        if link_type == 'DeviceSerialLink':
+            if endport is not None:
+                console_port = endport.split()[-1]
+            if enddevice is not None:
+                console_dev = enddevice
+        elif link_type == 'DeviceMgmtLink':
+            if endport is not None:
+                mgmt_port = endport.split()[-1]
+            if enddevice is not None:
+                mgmt_dev = enddevice
 
     return (neighbors, devices, console_dev, console_port, mgmt_dev, mgmt_port)
 
 
-def parse_dpg(dpg, hname):
-    for child in dpg:
-        hostname = child.find(str(QName(ns, "Hostname")))
-        if hostname.text != hname:
+def parse_dpg(dpgs, hname):
+    for dpg in dpgs:
+        if dpg['hostname'] != hname:
             continue
 
-        ipintfs = child.find(str(QName(ns, "IPInterfaces")))
         intfs = []
-        for ipintf in ipintfs.findall(str(QName(ns, "IPInterface"))):
-            intfalias = ipintf.find(str(QName(ns, "AttachTo"))).text
+        for intfalias, ipprefix in dpg['intfs']:
             if port_alias_to_name_map.has_key(intfalias):
                 intfname = port_alias_to_name_map[intfalias]
             else:
                 intfname = intfalias
-            ipprefix = ipintf.find(str(QName(ns, "Prefix"))).text
             ipn = ipaddress.IPNetwork(ipprefix)
             ipaddr = ipn.ip
             prefix_len = ipn.prefixlen
@@ -151,7 +370,7 @@ def parse_dpg(dpg, hname):
             else:
                 intf['mask'] = str(prefix_len)
             intf.update({'attachto': intfname, 'prefixlen': int(prefix_len)})
-                    
+
             # TODO: remove peer_addr after dependency removed
             ipaddr_val = int(ipn.ip)
             peer_addr_val = None
@@ -165,17 +384,14 @@ def parse_dpg(dpg, hname):
                     peer_addr_val = ipaddr_val + 1
                 else:
                     peer_addr_val = ipaddr_val - 1
-                    
+
             if peer_addr_val is not None:
                 intf['peer_addr'] = ipaddress.IPAddress(peer_addr_val)
             intfs.append(intf)
             ports[intfname] = {'name': intfname, 'alias': intfalias}
 
-        lointfs = child.find(str(QName(ns, "LoopbackIPInterfaces")))
         lo_intfs = []
-        for lointf in lointfs.findall(str(QName(ns1, "LoopbackIPInterface"))):
-            intfname = lointf.find(str(QName(ns, "AttachTo"))).text
-            ipprefix = lointf.find(str(QName(ns1, "PrefixStr"))).text
+        for intfname, ipprefix in dpg['lo_intfs']:
             ipn = ipaddress.IPNetwork(ipprefix)
             ipaddr = ipn.ip
             prefix_len = ipn.prefixlen
@@ -187,11 +403,8 @@ def parse_dpg(dpg, hname):
                 lo_intf['mask'] = str(prefix_len)
             lo_intfs.append(lo_intf)
 
-        mgmtintfs = child.find(str(QName(ns, "ManagementIPInterfaces")))
         mgmt_intf = None
-        for mgmtintf in mgmtintfs.findall(str(QName(ns1, "ManagementIPInterface"))):
-            intfname = mgmtintf.find(str(QName(ns, "AttachTo"))).text
-            ipprefix = mgmtintf.find(str(QName(ns1, "PrefixStr"))).text
+        for intfname, ipprefix in dpg['mgmt_intfs']:
             mgmtipn = ipaddress.IPNetwork(ipprefix)
             # Ignore IPv6 management address
             if mgmtipn.version == 6:
@@ -202,35 +415,22 @@ def parse_dpg(dpg, hname):
             gwaddr = ipaddress.IPAddress(int(mgmtipn.network) + 1)
             mgmt_intf = {'addr': ipaddr, 'alias': intfname, 'prefixlen': prefix_len, 'mask': ipmask, 'gwaddr': gwaddr}
 
-        pcintfs = child.find(str(QName(ns, "PortChannelInterfaces")))
-        pc_intfs = []
         pcs = {}
-        for pcintf in pcintfs.findall(str(QName(ns, "PortChannel"))):
-            pcintfname = pcintf.find(str(QName(ns, "Name"))).text
-            pcintfmbr = pcintf.find(str(QName(ns, "AttachTo"))).text
+        for pcintfname, pcintfmbr, has_fallback, fallback in dpg['pcs']:
             pcmbr_list = pcintfmbr.split(';', 1)
             for i, member in enumerate(pcmbr_list):
                 pcmbr_list[i] = port_alias_to_name_map[member]
                 ports[port_alias_to_name_map[member]] = {'name': port_alias_to_name_map[member], 'alias': member}
             pcs[pcintfname] = {'name': pcintfname, 'members': pcmbr_list}
-            fallback_node = pcintf.find(str(QName(ns, "Fallback")))
-            if  fallback_node is not None:
-                pcs[pcintfname]['fallback'] = fallback_node.text
+            if has_fallback:
+                pcs[pcintfname]['fallback'] = fallback
             ports.pop(pcintfname)
 
-        vlanintfs = child.find(str(QName(ns, "VlanInterfaces")))
-        vlan_intfs = []
         dhcp_servers = []
         vlans = {}
-        for vintf in vlanintfs.findall(str(QName(ns, "VlanInterface"))):
-            vintfname = vintf.find(str(QName(ns, "Name"))).text
-            vlanid = vintf.find(str(QName(ns, "VlanID"))).text
-            vintfmbr = vintf.find(str(QName(ns, "AttachTo"))).text
+        for vintfname, vlanid, vintfmbr, vlandhcpservers in dpg['vlans']:
             vmbr_list = vintfmbr.split(';')
-            vintf_node = vintf.find(str(QName(ns, "DhcpRelays")))
-            if vintf_node is not None and vintf_node.text is not None:
-                vlandhcpservers = vintf_node.text
-            else:
+            if vlandhcpservers is None:
                 vlandhcpservers = ""
             dhcp_servers = vlandhcpservers.split(";")
             for i, member in enumerate(vmbr_list):
@@ -240,13 +440,10 @@ def parse_dpg(dpg, hname):
             vlans[vintfname] = vlan_attributes
             ports.pop(vintfname)
 
-        aclintfs = child.find(str(QName(ns, "AclInterfaces")))
         acls = {}
-        for aclintf in aclintfs.findall(str(QName(ns, "AclInterface"))):
-            aclname = aclintf.find(str(QName(ns, "InAcl"))).text
-            aclattach = aclintf.find(str(QName(ns, "AttachTo"))).text.split(';')
+        for aclname, aclattach in dpg['acls']:
             acl_intfs = []
-            for member in aclattach:
+            for member in aclattach.split(';'):
                 member = member.strip()
                 if pcs.has_key(member):
                     acl_intfs.extend(pcs[member]['members'])  # For ACL attaching to port channels, we break them into port channel members
@@ -258,54 +455,41 @@ def parse_dpg(dpg, hname):
                 acls[aclname] = acl_intfs
 
         return intfs, lo_intfs, mgmt_intf, vlans, pcs, acls, dhcp_servers
-    return None, None, None, None, None, None
+    return None, None, None, None, None, None, None
 
 def parse_cpg(cpg, hname):
     bgp_sessions = []
     myasn = None
     bgp_peers_with_range = []
-    for child in cpg:
-        tag = child.tag
-        if tag == str(QName(ns, "PeeringSessions")):
-            for session in child.findall(str(QName(ns, "BGPSession"))):
-                start_router = session.find(str(QName(ns, "StartRouter"))).text
-                start_peer = session.find(str(QName(ns, "StartPeer"))).text
-                end_router = session.find(str(QName(ns, "EndRouter"))).text
-                end_peer = session.find(str(QName(ns, "EndPeer"))).text
-                if end_router == hname:
-                    bgp_sessions.append({
-                        'name': start_router,
-                        'addr': start_peer,
-                        'peer_addr': end_peer
-                    })
-                else:
-                    bgp_sessions.append({
-                        'name': end_router,
-                        'addr': end_peer,
-                        'peer_addr': start_peer
+    for record in cpg:
+        if record[0] == 'session':
+            _, start_router, start_peer, end_router, end_peer = record
+            if end_router == hname:
+                bgp_sessions.append({
+                    'name': start_router,
+                    'addr': start_peer,
+                    'peer_addr': end_peer
+                })
+            else:
+                bgp_sessions.append({
+                    'name': end_router,
+                    'addr': end_peer,
+                    'peer_addr': start_peer
+                })
+        else:
+            _, asn, hostname, peers_with_range = record
+            if hostname == hname:
+                myasn = int(asn)
+                for name, ip_range in peers_with_range:
+                    ip_range_group = ip_range.split(';') if ip_range and ip_range != "" else []
+                    bgp_peers_with_range.append({
+                        'name': name,
+                        'ip_range': ip_range_group
                     })
-        elif child.tag == str(QName(ns, "Routers")):
-            for router in child.findall(str(QName(ns1, "BGPRouterDeclaration"))):
-                asn = router.find(str(QName(ns1, "ASN"))).text
-                hostname = router.find(str(QName(ns1, "Hostname"))).text
-                if hostname == hname:
-                    myasn = int(asn)
-                    peers = router.find(str(QName(ns1, "Peers")))
-                    for bgpPeer in peers.findall(str(QName(ns, "BGPPeer"))):
-                        addr = bgpPeer.find(str(QName(ns, "Address"))).text
-                        if bgpPeer.find(str(QName(ns1, "PeersRange"))) is not None:
-                            name = bgpPeer.find(str(QName(ns1, "Name"))).text
-                            ip_range = bgpPeer.find(str(QName(ns1, "PeersRange"))).text
-                            ip_range_group = ip_range.split(';') if ip_range and ip_range != "" else []
-                            bgp_peers_with_range.append({
-                                'name': name,
-                                'ip_range': ip_range_group
-                            })
-
-                else:
-                    for bgp_session in bgp_sessions:
-                        if hostname == bgp_session['name']:
-                            bgp_session['asn'] = int(asn)
+            else:
+                for bgp_session in bgp_sessions:
+                    if hostname == bgp_session['name']:
+                        bgp_session['asn'] = int(asn)
 
     return bgp_sessions, myasn, bgp_peers_with_range
 
@@ -315,13 +499,9 @@ def parse_meta(meta, hname):
     ntp_servers = []
     mgmt_routes = []
     deployment_id = None
-    device_metas = meta.find(str(QName(ns, "Devices")))
-    for device in device_metas.findall(str(QName(ns1, "DeviceMetadata"))):
-        if device.find(str(QName(ns1, "Name"))).text == hname:
-            properties = device.find(str(QName(ns1, "Properties")))
-            for device_property in properties.findall(str(QName(ns1, "DeviceProperty"))):
-                name = device_property.find(str(QName(ns1, "Name"))).text
-                value = device_property.find(str(QName(ns1, "Value"))).text
+    for device_name, properties in meta:
+        if device_name == hname:
+            for name, value in properties:
                 value_group = value.split(';') if value and value != "" else []
                 if name == "NtpResources":
                     ntp_servers = value_group
@@ -387,17 +567,75 @@ def reconcile_mini_graph_locations(filename, hostname):
 
     :param filename: the filename to load (may be None)
     :param hostname: the hostname to load (required)
-    :return: tuple(the absolute filepath of the {cached,loaded} mini-graph, the root node of the loaded graph)
+    :return: tuple(the absolute filepath of the {cached,loaded} mini-graph, the records read from the graph)
     """
+    mini_graph_path = get_mini_graph_path(filename)
+    return mini_graph_path, read_minigraph(mini_graph_path)
+
+
+def get_mini_graph_path(filename):
     if filename is not None:
         # literal filename specified. read directly from the file.
-        mini_graph_path = filename
+        return filename
     else:
         # only the hostname was specified, determine the output path
-        mini_graph_path = '/etc/sonic/minigraph.xml'
+        return '/etc/sonic/minigraph.xml'
 
-    root = ET.parse(mini_graph_path).getroot()
-    return mini_graph_path, root
+
+def get_facts_cache_path(mini_graph_path, hostname):
+    """
+    :param mini_graph_path: path to the minigraph file
+    :param hostname: the hostname facts are loaded for
+    :return: path of the file with cached facts of the minigraph content, None if the minigraph can't be read
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(mini_graph_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except IOError:
+        # parse_xml() reports the error
+        return None
+
+    return os.path.join(ANSIBLE_USER_MINIGRAPH_PATH,
+                        ANSIBLE_USER_MINIGRAPH_FACTS.format(hostname, digest.hexdigest(), MINIGRAPH_FACTS_VERSION))
+
+
+def load_cached_facts(cache_path):
+    """
+    :param cache_path: path of the file with cached facts
+    :return: the cached facts, None if there are no valid cached facts
+    """
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def save_cached_facts(cache_path, hostname, facts):
+    """
+    Save the facts atomically, so that concurrent runs of the module never read a partially written file, and
+    remove the facts cached for other content of the hostname's minigraph.
+
+    :param cache_path: path of the file with cached facts
+    :param hostname: the hostname facts are loaded for
+    :param facts: the parsed facts
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=ANSIBLE_USER_MINIGRAPH_PATH)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(facts, f)
+        os.rename(tmp_path, cache_path)
+
+        # the digest is matched exactly, '*' alone would also match the files of hosts named '<hostname>_...'
+        own_facts = re.compile(re.escape(hostname) + r'_[0-9a-f]{40}\.v\d+\.json$')
+        for path in glob.glob(os.path.join(ANSIBLE_USER_MINIGRAPH_PATH, ANSIBLE_USER_MINIGRAPH_FACTS.format(hostname, '*', '*'))):
+            if path != cache_path and own_facts.match(os.path.basename(path)):
+                os.remove(path)
+    except (IOError, OSError):
+        # the cache is only an optimization, the facts are parsed again next time
+        pass
 
 def port_alias_to_name_map_50G(all_ports, s100G_ports):
     # 50G ports
@@ -413,11 +651,10 @@ def port_alias_to_name_map_50G(all_ports, s100G_ports):
     return port_alias_to_name_map
 
 def parse_xml(filename, hostname):
-    mini_graph_path, root = reconcile_mini_graph_locations(filename, hostname)
+    mini_graph_path, (hwsku, hostname, sections) = reconcile_mini_graph_locations(filename, hostname)
 
     u_neighbors = None
     u_devices = None
-    hwsku = None
     bgp_sessions = None
     bgp_asn = None
     intfs = None
@@ -429,7 +666,6 @@ def parse_xml(filename, hostname):
     lo_intf = None
     neighbors = None
     devices = None
-    hostname = None
     syslog_servers = []
     dhcp_servers = []
     ntp_servers = []
@@ -437,14 +673,6 @@ def parse_xml(filename, hostname):
     bgp_peers_with_range = []
     deployment_id = None
 
-    hwsku_qn = QName(ns, "HwSku")
-    hostname_qn = QName(ns, "Hostname")
-    for child in root:
-        if child.tag == str(hwsku_qn):
-            hwsku = child.text
-        if child.tag == str(hostname_qn):
-            hostname = child.text
-
     global port_alias_to_name_map
 
     if hwsku == "Force10-S6000":
@@ -541,17 +769,17 @@ def parse_xml(filename, hostname):
         for i in range(0, 128, 4):
             port_alias_to_name_map["Ethernet%d" % i] = "Ethernet%d" % i
 
-    for child in root:
-        if child.tag == str(QName(ns, "DpgDec")):
-            (intfs, lo_intfs, mgmt_intf, vlans, pcs, acls, dhcp_servers) = parse_dpg(child, hostname)
-        elif child.tag == str(QName(ns, "CpgDec")):
-            (bgp_sessions, bgp_asn, bgp_peers_with_range) = parse_cpg(child, hostname)
-        elif child.tag == str(QName(ns, "PngDec")):
-            (neighbors, devices, console_dev, console_port, mgmt_dev, mgmt_port) = parse_png(child, hostname)
-        elif child.tag == str(QName(ns, "UngDec")):
-            (u_neighbors, u_devices, _, _, _, _) = parse_png(child, hostname)
-        elif child.tag == str(QName(ns, "MetadataDeclaration")):
-            (syslog_servers, ntp_servers, mgmt_routes, deployment_id) = parse_meta(child, hostname)
+    for tag, records in sections:
+        if tag == DPG_TAG:
+            (intfs, lo_intfs, mgmt_intf, vlans, pcs, acls, dhcp_servers) = parse_dpg(records, hostname)
+        elif tag == CPG_TAG:
+            (bgp_sessions, bgp_asn, bgp_peers_with_range) = parse_cpg(records, hostname)
+        elif tag == PNG_TAG:
+            (neighbors, devices, console_dev, console_port, mgmt_dev, mgmt_port) = parse_png(records, hostname)
+        elif tag == UNG_TAG:
+            (u_neighbors, u_devices, _, _, _, _) = parse_png(records, hostname)
+        elif tag == META_TAG:
+            (syslog_servers, ntp_servers, mgmt_routes, deployment_id) = parse_meta(records, hostname)
 
     # TODO: Move all alias-related code out of minigraph_facts.py and into
     # its own module to be used as another layer after parsing the minigraph.
@@ -634,6 +862,7 @@ def main():
         argument_spec=dict(
             host=dict(required=True),
             filename=dict(),
+            cache=dict(required=False, type='bool', default=True),
         ),
         supports_check_mode=True
     )
@@ -659,8 +888,20 @@ def main():
         filename = None
 
     try:
+        cache_path = None
+        if m_args['cache']:
+            mini_graph_path = get_mini_graph_path(filename)
+            cache_path = get_facts_cache_path(mini_graph_path, m_args['host'])
+            results_clean = load_cached_facts(cache_path) if cache_path is not None else None
+            if results_clean is not None:
+                # the same content could be cached from another file
+                results_clean['minigraph_as_xml'] = mini_graph_path
+                module.exit_json(ansible_facts=results_clean)
+
         results = parse_xml(filename, m_args['host'])
         results_clean = json.loads(json.dumps(results, cls=minigraph_encoder))
+        if cache_path is not None:
+            save_cached_facts(cache_path, m_args['host'], results_clean)
         module.exit_json(ansible_facts=results_clean)
     except Exception as e:
         # all attempts to find a minigraph failed.
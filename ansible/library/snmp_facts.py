@@ -73,6 +73,22 @@ options:
         description:
             - Encryption key, required if version is authPriv
         required: false
+    groups:
+        description:
+            - MIB groups to collect, all groups by default. System facts are always collected.
+        choices: [ 'interfaces', 'interface_counters', 'physical_entities', 'sensors', 'lldp', 'pfc', 'queues', 'psu' ]
+        required: false
+    max_repetitions:
+        description:
+            - Number of rows of every walked table column requested in one GETBULK request,
+              0 to walk the tables with GETNEXT requests
+        required: false
+        default: 25
+    concurrency:
+        description:
+            - Number of SNMP requests running at the same time
+        required: false
+        default: 4
 '''
 
 EXAMPLES = '''
@@ -89,15 +105,26 @@ EXAMPLES = '''
     username=snmp-user
     authkey=abc12345
     privkey=def6789
+
+# Gather only interface and PFC facts
+- snmp_facts:
+    host={{ inventory_hostname }}
+    version=v2c
+    community=public
+    groups=interfaces,pfc
 '''
 
 from ansible.module_utils.basic import *
 from collections import defaultdict
+import Queue
+import threading
 
 try:
-    from pysnmp.proto import rfc1902
+    from pysnmp.proto import rfc1902, rfc1905
     from pysnmp.entity.rfc3413.oneliner import cmdgen
     from pyasn1.type import univ
+    # Returned instead of a value when there are no more objects in the walked subtree
+    WALK_END_TYPES = (rfc1905.NoSuchObject, rfc1905.NoSuchInstance, rfc1905.EndOfMibView)
     has_pysnmp = True
 except:
     has_pysnmp = False
@@ -274,6 +301,319 @@ def decode_type(module, current_oid, val):
     return pyVal
 
 
+# MIB groups which can be requested with the 'groups' option, system facts are always collected
+MIB_GROUPS = ['interfaces', 'interface_counters', 'physical_entities', 'sensors', 'lldp', 'pfc', 'queues', 'psu']
+
+Tree = lambda: defaultdict(Tree)
+
+
+class OidTrie(object):
+    """
+    Prefix tree of OIDs. Maps the OID of a returned variable to the handler registered for its table column
+    (or scalar) and to the index part of the OID, with one dictionary lookup per OID component.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, oid, handler):
+        node = self.root
+        for sub_id in oid.split('.'):
+            node = node.setdefault(int(sub_id), {})
+        node[None] = handler
+
+    def lookup(self, oid):
+        """
+        :param oid: OID of a returned variable as a tuple of integers
+        :return: tuple (handler, index), (None, None) if no handler is registered for the OID
+        """
+        node = self.root
+        for pos, sub_id in enumerate(oid):
+            node = node.get(sub_id)
+            if node is None:
+                break
+            if None in node:
+                return node[None], oid[pos + 1:]
+        return None, None
+
+
+class SnmpRequest(object):
+    """
+    One SNMP request: GET of scalars or walk of table columns, together with the handlers which store
+    the returned values to the facts.
+    """
+
+    def __init__(self, group, description, columns, scalar=False, timeout=None):
+        self.group = group
+        self.description = description
+        self.oids = [oid for oid, _ in columns]
+        self.handlers = [handler for _, handler in columns]
+        self.scalar = scalar
+        self.timeout = timeout
+        self.trie = OidTrie()
+        for oid, handler in columns:
+            self.trie.insert(oid, handler)
+
+
+class SnmpFacts(object):
+
+    def __init__(self):
+        self.results = Tree()
+        self.ipv4_networks = Tree()
+        self.all_ipv4_addresses = []
+
+    def update(self, request, varTable):
+        for varBinds in varTable:
+            for column, (oid, val) in enumerate(varBinds):
+                if not request.scalar and isinstance(val, WALK_END_TYPES):
+                    continue
+                handler, index = request.trie.lookup(oid.asTuple())
+                # A walk returns the next objects after the end of a column, they belong to other columns
+                # or tables and are returned by their own walks
+                if handler is None or (not request.scalar and handler is not request.handlers[column]):
+                    continue
+                handler(self, index, val)
+
+    def finalize(self, groups):
+        if 'interfaces' in groups:
+            interface_to_ipv4 = {}
+            for ipv4_network in self.ipv4_networks:
+                current_interface = self.ipv4_networks[ipv4_network]['interface']
+                current_network = {
+                                    'address':  self.ipv4_networks[ipv4_network]['address'],
+                                    'netmask':  self.ipv4_networks[ipv4_network]['netmask']
+                                  }
+                interface_to_ipv4.setdefault(current_interface, []).append(current_network)
+
+            for interface in interface_to_ipv4:
+                self.results['snmp_interfaces'][int(interface)]['ipv4'] = interface_to_ipv4[interface]
+
+            self.results['ansible_all_ipv4_addresses'] = self.all_ipv4_addresses
+
+        return self.results
+
+
+def pretty(val):
+    return val.prettyPrint()
+
+def scalar_fact(key, convert=pretty):
+    def handler(facts, index, val):
+        facts.results[key] = convert(val)
+    return handler
+
+def lldp_fact(key):
+    def handler(facts, index, val):
+        facts.results['snmp_lldp'][key] = pretty(val)
+    return handler
+
+def table_fact(table, key, convert=pretty, pos=-1):
+    def handler(facts, index, val):
+        facts.results[table][int(index[pos])][key] = convert(val)
+    return handler
+
+def interface_fact(key, convert=pretty, pos=-1):
+    return table_fact('snmp_interfaces', key, convert, pos)
+
+def interface_index_fact(facts, index, val):
+    facts.results['snmp_interfaces'][int(index[-1])]['ifindex'] = pretty(val)
+
+def ipv4_fact(key):
+    def handler(facts, index, val):
+        current_val = pretty(val)
+        facts.ipv4_networks['.'.join(map(str, index[-4:]))][key] = current_val
+        if key == 'address':
+            facts.all_ipv4_addresses.append(current_val)
+    return handler
+
+def priority_fact(key):
+    def handler(facts, index, val):
+        facts.results['snmp_interfaces'][int(index[-2])][key][int(index[-1])] = pretty(val)
+    return handler
+
+def queue_fact(facts, index, val):
+    ifIndex, ifDirection, queueId, counterId = [int(sub_id) for sub_id in index[-4:]]
+    facts.results['snmp_interfaces'][ifIndex]['queues'][ifDirection][queueId][counterId] = pretty(val)
+
+def psu_fact(facts, index, val):
+    facts.results['snmp_psu'][int(index[-1])]['operstatus'] = pretty(val)
+
+
+def build_requests(module, v, is_dell):
+    adminstatus = lambda val: lookup_adminstatus(int(pretty(val)))
+    operstatus = lambda val: lookup_operstatus(int(pretty(val)))
+    to_int = lambda val: int(pretty(val))
+
+    requests = [
+        # Getting system description could take more than 1 second on some Dell platform
+        # (e.g. S6000) when cpu utilization is high, increse timeout to tolerate the delay.
+        SnmpRequest('system', 'querying system description.', [
+            (v.sysDescr, scalar_fact('ansible_sysdescr', lambda val: decode_hex(pretty(val)))),
+        ], scalar=True, timeout=5.0),
+        SnmpRequest('system', 'querying system infomation.', [
+            (v.sysObjectId, scalar_fact('ansible_sysobjectid')),
+            (v.sysUpTime,   scalar_fact('ansible_sysuptime')),
+            (v.sysContact,  scalar_fact('ansible_syscontact')),
+            (v.sysName,     scalar_fact('ansible_sysname')),
+            (v.sysLocation, scalar_fact('ansible_syslocation')),
+        ], scalar=True),
+        SnmpRequest('interfaces', 'querying interface details', [
+            (v.ifIndex,        interface_index_fact),
+            (v.ifDescr,        interface_fact('name')),
+            (v.ifMtu,          interface_fact('mtu')),
+            (v.ifSpeed,        interface_fact('speed')),
+            (v.ifPhysAddress,  interface_fact('mac', lambda val: decode_mac(pretty(val)))),
+            (v.ifAdminStatus,  interface_fact('adminstatus', adminstatus)),
+            (v.ifOperStatus,   interface_fact('operstatus', operstatus)),
+            (v.ipAdEntAddr,    ipv4_fact('address')),
+            (v.ipAdEntIfIndex, ipv4_fact('interface')),
+            (v.ipAdEntNetMask, ipv4_fact('netmask')),
+            (v.ifAlias,        interface_fact('description')),
+        ]),
+        SnmpRequest('interface_counters', 'querying interface counters', [
+            (v.ifInDiscards,   interface_fact('ifInDiscards')),
+            (v.ifOutDiscards,  interface_fact('ifOutDiscards')),
+            (v.ifInErrors,     interface_fact('ifInErrors')),
+            (v.ifOutErrors,    interface_fact('ifOutErrors')),
+            (v.ifHCInOctets,   interface_fact('ifHCInOctets')),
+            (v.ifHCOutOctets,  interface_fact('ifHCOutOctets')),
+            (v.ifInUcastPkts,  interface_fact('ifInUcastPkts')),
+            (v.ifOutUcastPkts, interface_fact('ifOutUcastPkts')),
+        ]),
+        SnmpRequest('physical_entities', 'querying physical table', [
+            (v.entPhysDescr,     table_fact('snmp_physical_entities', 'entPhysDescr')),
+            (v.entPhysClass,     table_fact('snmp_physical_entities', 'entPhysClass', to_int)),
+            (v.entPhysName,      table_fact('snmp_physical_entities', 'entPhysName')),
+            (v.entPhysHwVer,     table_fact('snmp_physical_entities', 'entPhysHwVer')),
+            (v.entPhysFwVer,     table_fact('snmp_physical_entities', 'entPhysFwVer')),
+            (v.entPhysSwVer,     table_fact('snmp_physical_entities', 'entPhysSwVer')),
+            (v.entPhysMfgName,   table_fact('snmp_physical_entities', 'entPhysMfgName')),
+            (v.entPhysModelName, table_fact('snmp_physical_entities', 'entPhysModelName')),
+        ]),
+        SnmpRequest('sensors', 'querying physical table', [
+            (v.entPhySensorType,       table_fact('snmp_sensors', 'entPhySensorType')),
+            (v.entPhySensorScale,      table_fact('snmp_sensors', 'entPhySensorScale', to_int)),
+            (v.entPhySensorPrecision,  table_fact('snmp_sensors', 'entPhySensorPrecision')),
+            (v.entPhySensorValue,      table_fact('snmp_sensors', 'entPhySensorValue')),
+            (v.entPhySensorOperStatus, table_fact('snmp_sensors', 'entPhySensorOperStatus')),
+        ]),
+        SnmpRequest('lldp', 'querying  lldp local system infomation.', [
+            (v.lldpLocChassisIdSubtype, lldp_fact('lldpLocChassisIdSubtype')),
+            (v.lldpLocChassisId,        lldp_fact('lldpLocChassisId')),
+            (v.lldpLocSysName,          lldp_fact('lldpLocSysName')),
+            (v.lldpLocSysDesc,          lldp_fact('lldpLocSysDesc')),
+        ], scalar=True),
+        SnmpRequest('lldp', 'querying lldpLocPortTable counters', [
+            (v.lldpLocPortIdSubtype, interface_fact('lldpLocPortIdSubtype')),
+            (v.lldpLocPortId,        interface_fact('lldpLocPortId')),
+            (v.lldpLocPortDesc,      interface_fact('lldpLocPortDesc')),
+        ]),
+        SnmpRequest('lldp', 'querying lldpLocPortTable counters', [
+            (v.lldpLocManAddrLen,       lldp_fact('lldpLocManAddrLen')),
+            (v.lldpLocManAddrIfSubtype, lldp_fact('lldpLocManAddrIfSubtype')),
+            (v.lldpLocManAddrIfId,      lldp_fact('lldpLocManAddrIfId')),
+            (v.lldpLocManAddrOID,       lldp_fact('lldpLocManAddrOID')),
+        ]),
+        # lldpRemTable and lldpRemManAddrTable are indexed by .time mark + .ifindex + .rem index
+        SnmpRequest('lldp', 'querying lldpLocPortTable counters', [
+            (v.lldpRemChassisIdSubtype, interface_fact('lldpRemChassisIdSubtype', pos=1)),
+            (v.lldpRemChassisId,        interface_fact('lldpRemChassisId', pos=1)),
+            (v.lldpRemPortIdSubtype,    interface_fact('lldpRemPortIdSubtype', pos=1)),
+            (v.lldpRemPortId,           interface_fact('lldpRemPortId', pos=1)),
+            (v.lldpRemPortDesc,         interface_fact('lldpRemPortDesc', pos=1)),
+            (v.lldpRemSysName,          interface_fact('lldpRemSysName', pos=1)),
+            (v.lldpRemSysDesc,          interface_fact('lldpRemSysDesc', pos=1)),
+            (v.lldpRemSysCapSupported,  interface_fact('lldpRemSysCapSupported', pos=1)),
+            (v.lldpRemSysCapEnabled,    interface_fact('lldpRemSysCapEnabled', pos=1)),
+        ]),
+        SnmpRequest('lldp', 'querying lldpLocPortTable counters', [
+            (v.lldpRemManAddrIfSubtype, interface_fact('lldpRemManAddrIfSubtype', pos=1)),
+            (v.lldpRemManAddrIfId,      interface_fact('lldpRemManAddrIfId', pos=1)),
+            (v.lldpRemManAddrOID,       interface_fact('lldpRemManAddrOID', pos=1)),
+        ]),
+        SnmpRequest('pfc', 'querying PFC counters', [
+            (v.cpfcIfRequests,         interface_fact('cpfcIfRequests')),
+            (v.cpfcIfIndications,      interface_fact('cpfcIfIndications')),
+            (v.requestsPerPriority,    priority_fact('requestsPerPriority')),
+            (v.indicationsPerPriority, priority_fact('indicationsPerPriority')),
+        ]),
+        SnmpRequest('queues', 'querying QoS stats', [
+            (v.csqIfQosGroupStats, queue_fact),
+        ]),
+        SnmpRequest('psu', 'querying FRU', [
+            (v.cefcFRUPowerOperStatus, psu_fact),
+        ]),
+    ]
+
+    if is_dell:
+        cpu_util = lambda val: decode_type(module, v.ChStackUnitCpuUtil5sec, val)
+        requests.append(SnmpRequest('system', 'querying CPU busy indeces', [
+            (v.ChStackUnitCpuUtil5sec, scalar_fact('ansible_ChStackUnitCpuUtil5sec', cpu_util)),
+        ], scalar=True))
+
+    return requests
+
+
+def run_request(cmdGen, snmp_auth, host, request, max_repetitions):
+    """
+    Run the request, walks are done with GETBULK unless max_repetitions is 0.
+    If the response doesn't fit to one message, the walk is retried with less repetitions.
+
+    :return: tuple (errorIndication, varTable)
+    """
+    if request.timeout is not None:
+        target = cmdgen.UdpTransportTarget((host, 161), timeout=request.timeout)
+    else:
+        target = cmdgen.UdpTransportTarget((host, 161))
+    varNames = [cmdgen.MibVariable('.' + oid,) for oid in request.oids]
+
+    if request.scalar:
+        errorIndication, errorStatus, errorIndex, varBinds = cmdGen.getCmd(snmp_auth, target, *varNames)
+        return errorIndication, [varBinds]
+
+    while max_repetitions > 0:
+        errorIndication, errorStatus, errorIndex, varTable = cmdGen.bulkCmd(
+            snmp_auth, target, 0, max_repetitions, *varNames)
+        if errorIndication or not errorStatus or errorStatus.prettyPrint() != 'tooBig' or max_repetitions == 1:
+            return errorIndication, varTable
+        max_repetitions //= 2
+
+    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(snmp_auth, target, *varNames)
+    return errorIndication, varTable
+
+
+def run_requests(snmp_auth, host, requests, max_repetitions, concurrency):
+    """
+    Run the requests, up to 'concurrency' requests at a time. Every thread uses its own command generator,
+    as the SNMP engine of the command generator is not thread safe.
+
+    :return: list of tuples (errorIndication, varTable), in the order of the requests
+    """
+    responses = [None] * len(requests)
+    pending = Queue.Queue()
+    for idx in range(len(requests)):
+        pending.put(idx)
+
+    def worker():
+        cmdGen = cmdgen.CommandGenerator()
+        while True:
+            try:
+                idx = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                responses[idx] = run_request(cmdGen, snmp_auth, host, requests[idx], max_repetitions)
+            except Exception as e:
+                responses[idx] = (repr(e), [])
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(concurrency, len(requests))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return responses
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
@@ -287,6 +627,9 @@ def main():
             authkey=dict(required=False),
             privkey=dict(required=False),
             is_dell=dict(required=False, default=False, type='bool'),
+            groups=dict(required=False, default=None, type='list'),
+            max_repetitions=dict(required=False, default=25, type='int'),
+            concurrency=dict(required=False, default=4, type='int'),
             removeplaceholder=dict(required=False)),
             required_together = ( ['username','level','integrity','authkey'],['privacy','privkey'],),
         supports_check_mode=False)
@@ -296,8 +639,6 @@ def main():
     if not has_pysnmp:
         module.fail_json(msg='Missing required pysnmp module (check docs)')
 
-    cmdGen = cmdgen.CommandGenerator()
-
     # Verify that we receive a community when using snmp v2
     if m_args['version'] == "v2" or m_args['version'] == "v2c":
         if m_args['community'] == False:
@@ -321,6 +662,16 @@ def main():
         elif m_args['privacy'] == "des":
             privacy_proto = cmdgen.usmDESPrivProtocol
 
+    groups = m_args['groups'] if m_args['groups'] else MIB_GROUPS
+    unknown_groups = set(groups) - set(MIB_GROUPS)
+    if unknown_groups:
+        module.fail_json(msg='Unknown MIB groups %s, supported groups are %s' % (sorted(unknown_groups), MIB_GROUPS))
+    # System facts are always collected, the system description request checks that the agent responds
+    groups = set(groups) | set(['system'])
+
+    if m_args['max_repetitions'] < 0 or m_args['concurrency'] < 1:
+        module.fail_json(msg='max_repetitions must not be negative and concurrency must be positive')
+
     # Use SNMP Version 2
     if m_args['version'] == "v2" or m_args['version'] == "v2c":
         snmp_auth = cmdgen.CommunityData(m_args['community'])
@@ -333,508 +684,18 @@ def main():
     else:
         snmp_auth = cmdgen.UsmUserData(m_args['username'], authKey=m_args['authkey'], privKey=m_args['privkey'], authProtocol=integrity_proto, privProtocol=privacy_proto)
 
-    # Use p to prefix OIDs with a dot for polling
-    p = DefineOid(dotprefix=True)
     # Use v without a prefix to use with return values
     v = DefineOid(dotprefix=False)
 
-    Tree = lambda: defaultdict(Tree)
-
-    results = Tree()
-
-    # Getting system description could take more than 1 second on some Dell platform
-    # (e.g. S6000) when cpu utilization is high, increse timeout to tolerate the delay.
-    errorIndication, errorStatus, errorIndex, varBinds = cmdGen.getCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161), timeout=5.0),
-        cmdgen.MibVariable(p.sysDescr,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying system description.')
-
-    for oid, val in varBinds:
-        current_oid = oid.prettyPrint()
-        current_val = val.prettyPrint()
-        if current_oid == v.sysDescr:
-            results['ansible_sysdescr'] = decode_hex(current_val)
-
-    errorIndication, errorStatus, errorIndex, varBinds = cmdGen.getCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.sysObjectId,),
-        cmdgen.MibVariable(p.sysUpTime,),
-        cmdgen.MibVariable(p.sysContact,),
-        cmdgen.MibVariable(p.sysName,),
-        cmdgen.MibVariable(p.sysLocation,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying system infomation.')
-
-    for oid, val in varBinds:
-        current_oid = oid.prettyPrint()
-        current_val = val.prettyPrint()
-        if current_oid == v.sysObjectId:
-            results['ansible_sysobjectid'] = current_val
-        elif current_oid == v.sysUpTime:
-            results['ansible_sysuptime'] = current_val
-        elif current_oid == v.sysContact:
-            results['ansible_syscontact'] = current_val
-        elif current_oid == v.sysName:
-            results['ansible_sysname'] = current_val
-        elif current_oid == v.sysLocation:
-            results['ansible_syslocation'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.ifIndex,),
-        cmdgen.MibVariable(p.ifDescr,),
-        cmdgen.MibVariable(p.ifMtu,),
-        cmdgen.MibVariable(p.ifSpeed,),
-        cmdgen.MibVariable(p.ifPhysAddress,),
-        cmdgen.MibVariable(p.ifAdminStatus,),
-        cmdgen.MibVariable(p.ifOperStatus,),
-        cmdgen.MibVariable(p.ipAdEntAddr,),
-        cmdgen.MibVariable(p.ipAdEntIfIndex,),
-        cmdgen.MibVariable(p.ipAdEntNetMask,),
-        cmdgen.MibVariable(p.ifAlias,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying interface details')
-
-    interface_indexes = []
-
-    all_ipv4_addresses = []
-    ipv4_networks = Tree()
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.ifIndex in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifindex'] = current_val
-                interface_indexes.append(ifIndex)
-            if v.ifDescr in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['name'] = current_val
-            if v.ifMtu in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['mtu'] = current_val
-            if v.ifSpeed in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['speed'] = current_val
-            if v.ifPhysAddress in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['mac'] = decode_mac(current_val)
-            if v.ifAdminStatus in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['adminstatus'] = lookup_adminstatus(int(current_val))
-            if v.ifOperStatus in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['operstatus'] = lookup_operstatus(int(current_val))
-            if v.ipAdEntAddr in current_oid:
-                curIPList = current_oid.rsplit('.', 4)[-4:]
-                curIP = ".".join(curIPList)
-                ipv4_networks[curIP]['address'] = current_val
-                all_ipv4_addresses.append(current_val)
-            if v.ipAdEntIfIndex in current_oid:
-                curIPList = current_oid.rsplit('.', 4)[-4:]
-                curIP = ".".join(curIPList)
-                ipv4_networks[curIP]['interface'] = current_val
-            if v.ipAdEntNetMask in current_oid:
-                curIPList = current_oid.rsplit('.', 4)[-4:]
-                curIP = ".".join(curIPList)
-                ipv4_networks[curIP]['netmask'] = current_val
-            if v.ifAlias in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['description'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.ifInDiscards,),
-        cmdgen.MibVariable(p.ifOutDiscards,),
-        cmdgen.MibVariable(p.ifInErrors,),
-        cmdgen.MibVariable(p.ifOutErrors,),
-        cmdgen.MibVariable(p.ifHCInOctets,),
-        cmdgen.MibVariable(p.ifHCOutOctets,),
-        cmdgen.MibVariable(p.ifInUcastPkts,),
-        cmdgen.MibVariable(p.ifOutUcastPkts,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying interface counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.ifInDiscards in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifInDiscards'] = current_val
-            if v.ifOutDiscards in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifOutDiscards'] = current_val
-            if v.ifInErrors in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifInErrors'] = current_val
-            if v.ifOutErrors in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifOutErrors'] = current_val
-            if v.ifHCInOctets in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifHCInOctets'] = current_val
-            if v.ifHCOutOctets in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifHCOutOctets'] = current_val
-            if v.ifInUcastPkts in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifInUcastPkts'] = current_val
-            if v.ifOutUcastPkts in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['ifOutUcastPkts'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.entPhysDescr,),
-        cmdgen.MibVariable(p.entPhysClass,),
-        cmdgen.MibVariable(p.entPhysName,),
-        cmdgen.MibVariable(p.entPhysHwVer,),
-        cmdgen.MibVariable(p.entPhysFwVer,),
-        cmdgen.MibVariable(p.entPhysSwVer,),
-        cmdgen.MibVariable(p.entPhysSerialNum,),
-        cmdgen.MibVariable(p.entPhysMfgName,),
-        cmdgen.MibVariable(p.entPhysModelName,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying physical table')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.entPhysDescr in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysDescr'] = current_val
-            if v.entPhysClass in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysClass'] = int(current_val)
-            if v.entPhysName in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysName'] = current_val
-            if v.entPhysHwVer in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysHwVer'] = current_val
-            if v.entPhysFwVer in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysFwVer'] = current_val
-            if v.entPhysSwVer in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysSwVer'] = current_val
-            if v.entPhysMfgName in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysMfgName'] = current_val
-            if v.entPhysModelName in current_oid:
-                entity_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_physical_entities'][entity_oid]['entPhysModelName'] = current_val 
-
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.entPhySensorType,),
-        cmdgen.MibVariable(p.entPhySensorScale,),
-        cmdgen.MibVariable(p.entPhySensorPrecision,),
-        cmdgen.MibVariable(p.entPhySensorValue,),
-        cmdgen.MibVariable(p.entPhySensorOperStatus,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying physical table')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.entPhySensorType in current_oid:
-                sensor_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_sensors'][sensor_oid]['entPhySensorType'] = current_val
-            if v.entPhySensorScale in current_oid:
-                sensor_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_sensors'][sensor_oid]['entPhySensorScale'] = int(current_val)
-            if v.entPhySensorPrecision in current_oid:
-                sensor_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_sensors'][sensor_oid]['entPhySensorPrecision'] = current_val
-            if v.entPhySensorValue in current_oid:
-                sensor_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_sensors'][sensor_oid]['entPhySensorValue'] = current_val
-            if v.entPhySensorOperStatus in current_oid:
-                sensor_oid = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_sensors'][sensor_oid]['entPhySensorOperStatus'] = current_val
-
-    interface_to_ipv4 = {}
-    for ipv4_network in ipv4_networks:
-        current_interface = ipv4_networks[ipv4_network]['interface']
-        current_network = {
-                            'address':  ipv4_networks[ipv4_network]['address'],
-                            'netmask':  ipv4_networks[ipv4_network]['netmask']
-                          }
-        if not current_interface in interface_to_ipv4:
-            interface_to_ipv4[current_interface] = []
-            interface_to_ipv4[current_interface].append(current_network)
-        else:
-            interface_to_ipv4[current_interface].append(current_network)
-
-    for interface in interface_to_ipv4:
-        results['snmp_interfaces'][int(interface)]['ipv4'] = interface_to_ipv4[interface]
-
-    results['ansible_all_ipv4_addresses'] = all_ipv4_addresses
-
-    if m_args['is_dell']:
-        errorIndication, errorStatus, errorIndex, varBinds = cmdGen.getCmd(
-            snmp_auth,
-            cmdgen.UdpTransportTarget((m_args['host'], 161)),
-            cmdgen.MibVariable(p.ChStackUnitCpuUtil5sec,),
-        )
+    requests = [request for request in build_requests(module, v, m_args['is_dell']) if request.group in groups]
+    responses = run_requests(snmp_auth, m_args['host'], requests, m_args['max_repetitions'], m_args['concurrency'])
 
+    facts = SnmpFacts()
+    for request, (errorIndication, varTable) in zip(requests, responses):
         if errorIndication:
-            module.fail_json(msg=str(errorIndication) + ' querying CPU busy indeces')
-
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if current_oid == v.ChStackUnitCpuUtil5sec:
-                results['ansible_ChStackUnitCpuUtil5sec'] = decode_type(module, current_oid, val)
-
-    errorIndication, errorStatus, errorIndex, varBinds = cmdGen.getCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.lldpLocChassisIdSubtype,),
-        cmdgen.MibVariable(p.lldpLocChassisId,),
-        cmdgen.MibVariable(p.lldpLocSysName,),
-        cmdgen.MibVariable(p.lldpLocSysDesc,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying  lldp local system infomation.')
-
-    for oid, val in varBinds:
-        current_oid = oid.prettyPrint()
-        current_val = val.prettyPrint()
-        if current_oid == v.lldpLocChassisIdSubtype:
-            results['snmp_lldp']['lldpLocChassisIdSubtype'] = current_val
-        elif current_oid == v.lldpLocChassisId:
-            results['snmp_lldp']['lldpLocChassisId'] = current_val
-        elif current_oid == v.lldpLocSysName:
-            results['snmp_lldp']['lldpLocSysName'] = current_val
-        elif current_oid == v.lldpLocSysDesc:
-            results['snmp_lldp']['lldpLocSysDesc'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.lldpLocPortIdSubtype,),
-        cmdgen.MibVariable(p.lldpLocPortId,),
-        cmdgen.MibVariable(p.lldpLocPortDesc,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying lldpLocPortTable counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.lldpLocPortIdSubtype in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['lldpLocPortIdSubtype'] = current_val
-            if v.lldpLocPortId in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['lldpLocPortId'] = current_val
-            if v.lldpLocPortDesc in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['lldpLocPortDesc'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.lldpLocManAddrLen,),
-        cmdgen.MibVariable(p.lldpLocManAddrIfSubtype,),
-        cmdgen.MibVariable(p.lldpLocManAddrIfId,),
-        cmdgen.MibVariable(p.lldpLocManAddrOID,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying lldpLocPortTable counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.lldpLocManAddrLen in current_oid:
-                address = '.'.join(current_oid.split('.')[13:])
-                results['snmp_lldp']['lldpLocManAddrLen'] = current_val
-            if v.lldpLocManAddrIfSubtype in current_oid:
-                address = '.'.join(current_oid.split('.')[13:])
-                results['snmp_lldp']['lldpLocManAddrIfSubtype'] = current_val
-            if v.lldpLocManAddrIfId in current_oid:
-                address = '.'.join(current_oid.split('.')[13:])
-                results['snmp_lldp']['lldpLocManAddrIfId'] = current_val
-            if v.lldpLocManAddrOID in current_oid:
-                address = '.'.join(current_oid.split('.')[13:])
-                results['snmp_lldp']['lldpLocManAddrOID'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.lldpRemChassisIdSubtype,),
-        cmdgen.MibVariable(p.lldpRemChassisId,),
-        cmdgen.MibVariable(p.lldpRemPortIdSubtype,),
-        cmdgen.MibVariable(p.lldpRemPortId,),
-        cmdgen.MibVariable(p.lldpRemPortDesc,),
-        cmdgen.MibVariable(p.lldpRemSysName,),
-        cmdgen.MibVariable(p.lldpRemSysDesc,),
-        cmdgen.MibVariable(p.lldpRemSysCapSupported,),
-        cmdgen.MibVariable(p.lldpRemSysCapEnabled,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying lldpLocPortTable counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.lldpRemChassisIdSubtype in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemChassisIdSubtype'] = current_val
-            if v.lldpRemChassisId in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemChassisId'] = current_val
-            if v.lldpRemPortIdSubtype in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemPortIdSubtype'] = current_val
-            if v.lldpRemPortId in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemPortId'] = current_val
-            if v.lldpRemPortDesc in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemPortDesc'] = current_val
-            if v.lldpRemSysName in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemSysName'] = current_val
-            if v.lldpRemSysDesc in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemSysDesc'] = current_val
-            if v.lldpRemSysCapSupported in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemSysCapSupported'] = current_val
-            if v.lldpRemSysCapEnabled in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                results['snmp_interfaces'][ifIndex]['lldpRemSysCapEnabled'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.lldpRemManAddrIfSubtype,),
-        cmdgen.MibVariable(p.lldpRemManAddrIfId,),
-        cmdgen.MibVariable(p.lldpRemManAddrOID,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying lldpLocPortTable counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.lldpRemManAddrIfSubtype in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                address = '.'.join(current_oid.split('.')[16:])
-                results['snmp_interfaces'][ifIndex]['lldpRemManAddrIfSubtype'] = current_val
-            if v.lldpRemManAddrIfId in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                address = '.'.join(current_oid.split('.')[16:])
-                results['snmp_interfaces'][ifIndex]['lldpRemManAddrIfId'] = current_val
-            if v.lldpRemManAddrOID in current_oid:
-                ifIndex = int(current_oid.split('.')[12])
-                address = '.'.join(current_oid.split('.')[16:])
-                results['snmp_interfaces'][ifIndex]['lldpRemManAddrOID'] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.cpfcIfRequests,),
-        cmdgen.MibVariable(p.cpfcIfIndications,),
-        cmdgen.MibVariable(p.requestsPerPriority,),
-        cmdgen.MibVariable(p.indicationsPerPriority,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying PFC counters')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.cpfcIfRequests in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['cpfcIfRequests'] = current_val
-            if v.cpfcIfIndications in current_oid:
-                ifIndex = int(current_oid.rsplit('.', 1)[-1])
-                results['snmp_interfaces'][ifIndex]['cpfcIfIndications'] = current_val
-            if v.requestsPerPriority in current_oid:
-                ifIndex = int(current_oid.split('.')[-2])
-                prio = int(current_oid.split('.')[-1])
-                results['snmp_interfaces'][ifIndex]['requestsPerPriority'][prio] = current_val
-            if v.indicationsPerPriority in current_oid:
-                ifIndex = int(current_oid.split('.')[-2])
-                prio = int(current_oid.split('.')[-1])
-                results['snmp_interfaces'][ifIndex]['indicationsPerPriority'][prio] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.csqIfQosGroupStats,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying QoS stats')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.csqIfQosGroupStats in current_oid:
-                ifIndex = int(current_oid.split('.')[-4])
-                ifDirection = int(current_oid.split('.')[-3])
-                queueId = int(current_oid.split('.')[-2])
-                counterId = int(current_oid.split('.')[-1])
-                results['snmp_interfaces'][ifIndex]['queues'][ifDirection][queueId][counterId] = current_val
-
-    errorIndication, errorStatus, errorIndex, varTable = cmdGen.nextCmd(
-        snmp_auth,
-        cmdgen.UdpTransportTarget((m_args['host'], 161)),
-        cmdgen.MibVariable(p.cefcFRUPowerOperStatus,),
-    )
-
-    if errorIndication:
-        module.fail_json(msg=str(errorIndication) + ' querying FRU')
-
-    for varBinds in varTable:
-        for oid, val in varBinds:
-            current_oid = oid.prettyPrint()
-            current_val = val.prettyPrint()
-            if v.cefcFRUPowerOperStatus in current_oid:
-                psuIndex = int(current_oid.split('.')[-1])
-                results['snmp_psu'][psuIndex]['operstatus'] = current_val
-
-    module.exit_json(ansible_facts=results)
+            module.fail_json(msg=str(errorIndication) + ' ' + request.description)
+        facts.update(request, varTable)
+
+    module.exit_json(ansible_facts=facts.finalize(groups))
 
 main()
@@ -1,24 +1,56 @@
 #!/usr/bin/env python
+"""
+Sends exabgp commands to the control API (see http_api.py) of the local exabgp instances.
 
-import cPickle
-import os
-import time
+Usage: announce_routes.py <commands file>
+Every line of the file is '<exabgp command>;<API port>'. The commands of a port are streamed over
+one connection, all the ports at the same time. A 'flush route' is sent after the commands, and the
+script returns when every exabgp instance has read all of its commands.
+"""
+
+import socket
 import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def stream_commands(port, commands, results, host='localhost'):
+    start = time.time()
+    sock = socket.create_connection((host, port))
+    try:
+        sock.sendall('stream\n' + ''.join('%s\n' % cmd for cmd in commands) + 'flush route\nsync\n')
+        reply = sock.makefile('rb').readline().strip()
+    finally:
+        sock.close()
+    results[port] = (reply, time.time() - start)
+
+
+def main():
+    commands = OrderedDict()
+    with open(sys.argv[1]) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            command, port = line.rsplit(';', 1)
+            commands.setdefault(int(port), []).append(command.strip())
 
-with open(sys.argv[1]) as f:
-    routes = f.readlines()
+    results = {}
+    threads = [threading.Thread(target=stream_commands, args=(port, cmds, results)) for port, cmds in commands.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
-routes=[x.strip() for x in routes]
-ports = set()
+    failed = False
+    for port, cmds in commands.items():
+        reply, duration = results.get(port, ('FAILED', 0))
+        failed |= not reply.startswith('OK')
+        print 'port %d: %d commands in %.2f seconds, %.0f commands/s, %s' % \
+              (port, len(cmds), duration, len(cmds) / duration if duration else 0, reply)
 
-for route in routes:
-   [command, port] = route.split(";")
-   port = port.strip()
-   ports.add(port)
-   os.system('curl -s --form "command=%s" http://localhost:%s/' % (command, port))
+    sys.exit(1 if failed else 0)
 
-for n in range(0, 20):
-    time.sleep(10)
-    for port in ports:
-        os.system('curl -s --form "command=flush route" http://localhost:%s/' % port)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Comparison and benchmark of the text and JSON modes of the bgp_facts module, no DUT needed.
+
+The module runs on recorded FRR outputs (bgp_facts_samples/) instead of vtysh:
+    show_ip_bgp_summary.txt, show_ip_bgp_neighbors.txt - parsed by the default text mode
+    show_bgp_summary.json, show_ip_bgp_neighbors.json  - collected by use_json and state_only
+
+The facts of use_json must be the ones of the text mode, except for two facts the text parser gets wrong:
+    accepted prefixes - the text regex keeps only the last digit of the count
+    graceful restart  - the text regex keeps only the first word ('advertised and received' -> 'advertised')
+These two are checked to differ only that way. The facts of state_only must be the same subset of them.
+
+With --scale N the neighbors of the samples are repeated N times with other addresses, to time the modes
+on a large number of neighbors. With --reference-module the text mode facts are also compared to the ones
+of another version of the module, e.g.
+    git show <commit>:ansible/library/bgp_facts.py > /tmp/bgp_facts_old.py
+
+Example: bgp_facts_bench.py --scale 500 --reference-module /tmp/bgp_facts_old.py
+Exits with 1 if the facts don't match.
+"""
+
+import argparse
+import copy
+import imp
+import json
+import os
+import re
+import socket
+import struct
+import sys
+import time
+
+HELPERS = os.path.dirname(os.path.abspath(__file__))
+MODULE = os.path.join(HELPERS, '..', '..', '..', '..', 'library', 'bgp_facts.py')
+SAMPLES = os.path.join(HELPERS, 'bgp_facts_samples')
+
+
+class ModuleExit(Exception):
+    pass
+
+
+class RecordedModule(object):
+    """
+    Stand-in of AnsibleModule, runs the vtysh commands on the recorded outputs
+    """
+    outputs = {}
+    params_in = {}
+    # decoded 'show ip bgp neighbors json', for the outputs of single neighbors
+    neighbors = None
+
+    def __init__(self, argument_spec, **kwargs):
+        self.params = dict((name, spec.get('default')) for name, spec in argument_spec.items())
+        self.params.update(self.params_in)
+
+    def run_command(self, cmd, **kwargs):
+        out = ''
+        for command in re.findall(r'-c "([^"]*)"', cmd):
+            match = re.match(r'show ip bgp neighbors (\S+) json$', command)
+            if match:
+                if self.neighbors is None:
+                    RecordedModule.neighbors = json.loads(self.outputs['show ip bgp neighbors json'])
+                out += json.dumps({match.group(1): self.neighbors.get(match.group(1), {'bgpNoSuchNeighbor': True})})
+            else:
+                out += self.outputs[command]
+        return 0, out, ''
+
+    def fail_json(self, **kwargs):
+        raise RuntimeError(kwargs['msg'])
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+
+def load_outputs(scale):
+    def read(name):
+        with open(os.path.join(SAMPLES, name)) as f:
+            return f.read()
+
+    text = read('show_ip_bgp_neighbors.txt')
+    summary = json.loads(read('show_bgp_summary.json'))
+    neighbors = json.loads(read('show_ip_bgp_neighbors.json'))
+
+    blocks = ['BGP neighbor is' + block for block in text.split('BGP neighbor is')[1:]]
+    scaled_blocks = []
+    scaled_summary = copy.deepcopy(summary)
+    scaled_neighbors = {}
+    for i in range(scale):
+        for block in blocks:
+            ip = block.split()[3].rstrip(',')
+            new_ip = shift_address(ip, i)
+            scaled_blocks.append(re.sub(re.escape(ip) + r'(?![0-9a-fA-F:.])', new_ip, block))
+            neighbor = copy.deepcopy(neighbors[ip])
+            neighbor['hostForeign'] = new_ip
+            scaled_neighbors[new_ip] = neighbor
+            for af_summary in scaled_summary.values():
+                if ip in af_summary.get('peers', {}):
+                    af_summary['peers'][new_ip] = copy.deepcopy(summary_peer(summary, ip))
+
+    return {
+        'show ip bgp summary': read('show_ip_bgp_summary.txt'),
+        'show ip bgp neighbor': ''.join(scaled_blocks),
+        'show bgp summary json': json.dumps(scaled_summary),
+        'show ip bgp neighbors json': json.dumps(scaled_neighbors),
+    }
+
+
+def summary_peer(summary, ip):
+    for af_summary in summary.values():
+        if ip in af_summary.get('peers', {}):
+            return af_summary['peers'][ip]
+
+
+def shift_address(ip, i):
+    """
+    Address of the i-th copy of the neighbor, the copy 0 keeps the address
+    """
+    if ':' in ip:
+        high, low = struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, ip))
+        return socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', high, (low + (i << 16)) & (1 << 64) - 1))
+    value = struct.unpack('!I', socket.inet_aton(ip))[0]
+    return socket.inet_ntoa(struct.pack('!I', (value + (i << 8)) & 0xffffffff))
+
+
+def run_module(path, outputs, params):
+    module = imp.load_source('bgp_facts_%d' % abs(hash(path)), path)
+    module.AnsibleModule = RecordedModule
+    RecordedModule.outputs = outputs
+    RecordedModule.neighbors = None
+    RecordedModule.params_in = params
+    start = time.time()
+    try:
+        module.main()
+    except ModuleExit as e:
+        # The same types as the facts have after the JSON round trip to ansible
+        return json.loads(json.dumps(e.args[0]['ansible_facts'])), time.time() - start
+    raise RuntimeError('%s did not exit with facts' % path)
+
+
+class Checker(object):
+    def __init__(self):
+        self.failed = False
+        self.reported = 0
+
+    def check(self, what, expected, actual):
+        if expected == actual:
+            return True
+        self.failed = True
+        self.reported += 1
+        if self.reported <= 20:
+            print '    MISMATCH %s: %s != %s' % (what, expected, actual)
+        return False
+
+
+def compare_text_json(checker, text_facts, json_facts):
+    checker.check('bgp_localasn', text_facts['bgp_localasn'], json_facts['bgp_localasn'])
+    checker.check('bgp_statistics', text_facts['bgp_statistics'], json_facts['bgp_statistics'])
+    checker.check('neighbors', sorted(text_facts['bgp_neighbors']), sorted(json_facts['bgp_neighbors']))
+
+    for ip in set(text_facts['bgp_neighbors']) & set(json_facts['bgp_neighbors']):
+        text_neighbor = copy.deepcopy(text_facts['bgp_neighbors'][ip])
+        json_neighbor = copy.deepcopy(json_facts['bgp_neighbors'][ip])
+
+        text_accepted = text_neighbor.pop('accepted prefixes')
+        json_accepted = json_neighbor.pop('accepted prefixes')
+        checker.check('%s accepted prefixes, last digit' % ip, text_accepted, json_accepted % 10)
+
+        text_restart = text_neighbor.get('capabilities', {}).pop('graceful restart', None)
+        json_restart = json_neighbor.get('capabilities', {}).pop('graceful restart', None)
+        checker.check('%s graceful restart, first word' % ip, text_restart,
+                      json_restart.split()[0] if json_restart else json_restart)
+
+        for key in set(text_neighbor) | set(json_neighbor):
+            checker.check('%s %s' % (ip, key), text_neighbor.get(key), json_neighbor.get(key))
+
+
+def compare_state_only(checker, json_facts, state_facts):
+    checker.check('bgp_localasn', json_facts['bgp_localasn'], state_facts['bgp_localasn'])
+    checker.check('bgp_statistics', json_facts['bgp_statistics'], state_facts['bgp_statistics'])
+    checker.check('neighbors', sorted(json_facts['bgp_neighbors']), sorted(state_facts['bgp_neighbors']))
+
+    for ip in set(json_facts['bgp_neighbors']) & set(state_facts['bgp_neighbors']):
+        for key, value in state_facts['bgp_neighbors'][ip].items():
+            checker.check('%s %s' % (ip, key), json_facts['bgp_neighbors'][ip].get(key), value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comparison and benchmark of the bgp_facts modes')
+    parser.add_argument('--module', default=MODULE, help='bgp_facts module to run')
+    parser.add_argument('--reference-module', help='another version of the module, compared in the text mode')
+    parser.add_argument('--scale', type=int, default=1, help='times to repeat the neighbors of the samples')
+    parser.add_argument('--filtered', type=int, default=4, help='neighbors to query with the neighbors option')
+    args = parser.parse_args()
+
+    outputs = load_outputs(args.scale)
+    checker = Checker()
+
+    text_facts, text_time = run_module(args.module, outputs, {})
+    json_facts, json_time = run_module(args.module, outputs, {'use_json': True})
+    state_facts, state_time = run_module(args.module, outputs, {'state_only': True})
+    print '%d neighbors' % len(text_facts['bgp_neighbors'])
+
+    print 'text mode vs use_json'
+    compare_text_json(checker, text_facts, json_facts)
+    print 'use_json vs state_only'
+    compare_state_only(checker, json_facts, state_facts)
+
+    if args.reference_module:
+        print 'text mode vs %s' % args.reference_module
+        reference_facts, reference_time = run_module(args.reference_module, outputs, {})
+        checker.check('facts', reference_facts, text_facts)
+        print '    reference text mode %.3f s' % reference_time
+
+    filtered = sorted(text_facts['bgp_neighbors'])[:args.filtered]
+    print 'use_json of %d neighbors' % len(filtered)
+    filtered_facts, filtered_time = run_module(args.module, outputs, {'use_json': True, 'neighbors': filtered})
+    checker.check('neighbors', filtered, sorted(filtered_facts['bgp_neighbors']))
+    for ip in filtered:
+        checker.check(ip, json_facts['bgp_neighbors'][ip], filtered_facts['bgp_neighbors'].get(ip))
+
+    print 'text mode %.3f s, use_json %.3f s, state_only %.3f s, use_json of %d neighbors %.4f s' % \
+          (text_time, json_time, state_time, len(filtered), filtered_time)
+    print 'FAILED' if checker.failed else 'PASSED'
+    sys.exit(1 if checker.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Equivalence check and benchmark of the conn_graph_facts module against a previous version of it, no lab needed.
+
+Both versions are run for every device of a lab connection graph, for no host (the whole graph) and for an unknown
+host, and their facts must be equal. Lists must be in the same order, e.g. device_vlan_list. The current version
+is run twice for every host: parsing the graph, with the index path not writable, and from the index, which is
+built by the first query.
+
+The graph is generated with --fanouts leaf fanouts, each connected to a DUT and to a root fanout, or read from
+--graph, e.g. ansible/files/lab_connection_graph.xml. The previous version of the module is taken from git, e.g.
+    git show <commit>:ansible/library/conn_graph_facts.py > /tmp/conn_graph_facts_old.py
+
+Example: conn_graph_facts_bench.py --reference-module /tmp/conn_graph_facts_old.py --fanouts 300
+Exits with 1 if the facts don't match.
+"""
+
+import argparse
+import imp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HELPERS = os.path.dirname(os.path.abspath(__file__))
+MODULE = os.path.join(HELPERS, '..', '..', '..', '..', 'library', 'conn_graph_facts.py')
+
+DUT_PORTS = 32
+LEAVES_PER_ROOT = 16
+
+
+# Not Exception, the module catches it, as AnsibleModule exits with SystemExit
+class ModuleExit(BaseException):
+    pass
+
+
+class ModuleFail(BaseException):
+    pass
+
+
+class StandInModule(object):
+    """
+    Stand-in of AnsibleModule with the given parameters
+    """
+    params_in = {}
+
+    def __init__(self, argument_spec, **kwargs):
+        self.params = dict((name, spec.get('default')) for name, spec in argument_spec.items())
+        self.params.update(self.params_in)
+
+    def fail_json(self, **kwargs):
+        raise ModuleFail(kwargs['msg'])
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+
+def generate_graph(fanouts):
+    """
+    Lab graph with a DUT behind every leaf fanout, leaf fanouts connected to root fanouts, a server behind every root
+    fanout. Every leaf fanout has its own range of VLANs, root fanout trunks carry the VLANs of their leaf fanouts.
+    """
+    devices = []
+    links = []
+    l3info = []
+    l2info = []
+
+    def add_device(hostname, hwsku, devtype):
+        devices.append('      <Device Hostname="%s" HwSku="%s" Type="%s"/>' % (hostname, hwsku, devtype))
+        l3info.append('    <DevicesL3Info Hostname="%s">\n'
+                      '      <ManagementIPInterface Name="ManagementIp" Prefix="10.%d.%d.%d/23"/>\n'
+                      '    </DevicesL3Info>' % (hostname, 250 + len(devices) / 65536, len(devices) / 256 % 256,
+                                                len(devices) % 256))
+
+    def add_link(start_device, start_port, end_device, end_port):
+        links.append('      <DeviceInterfaceLink BandWidth="40000" EndDevice="%s" EndPort="%s" StartDevice="%s" '
+                     'StartPort="%s"/>' % (end_device, end_port, start_device, start_port))
+
+    def add_vlans(hostname, ports):
+        l2info.append('    <DevicesL2Info Hostname="%s">\n%s\n    </DevicesL2Info>' % (hostname, '\n'.join(
+            '      <InterfaceVlan mode="%s" portname="%s" vlanids="%s"/>' % port for port in ports)))
+
+    roots = (fanouts + LEAVES_PER_ROOT - 1) / LEAVES_PER_ROOT
+    root_ports = [[] for _ in range(roots)]
+    for i in range(fanouts):
+        leaf = 'leaf-%03d' % i
+        dut = 'dut-%03d' % i
+        root = 'root-%02d' % (i / LEAVES_PER_ROOT)
+        first_vlan = 100 + i * DUT_PORTS % 3900
+        vlans = '%d-%d' % (first_vlan, first_vlan + DUT_PORTS - 1)
+        add_device(dut, 'Mellanox-2700', 'DevSonic')
+        add_device(leaf, 'Arista-7260QX-64', 'FanoutLeaf')
+        ports = []
+        for port in range(DUT_PORTS):
+            add_link(dut, 'Ethernet%d' % (port * 4), leaf, 'Ethernet%d' % (port + 1))
+            ports.append(('Access', 'Ethernet%d' % (port + 1), first_vlan + port))
+        add_link(leaf, 'Ethernet64', root, 'Ethernet%d' % (i % LEAVES_PER_ROOT + 1))
+        ports.append(('Trunk', 'Ethernet63', ''))
+        ports.append(('Trunk', 'Ethernet64', vlans))
+        add_vlans(leaf, ports)
+        root_ports[i / LEAVES_PER_ROOT].append(('Trunk', 'Ethernet%d' % (i % LEAVES_PER_ROOT + 1), vlans))
+
+    for i, ports in enumerate(root_ports):
+        root = 'root-%02d' % i
+        server = 'server-%02d' % i
+        add_device(root, 'Arista-7260QX-64', 'FanoutRoot')
+        add_device(server, 'TestServ', 'Server')
+        add_link(server, 'p4p1', root, 'Ethernet64')
+        # unsorted and overlapping ranges, as they are written by hand
+        server_vlans = ','.join(reversed([vlans for _, _, vlans in ports])) + ',%s' % ports[0][2].split('-')[0]
+        add_vlans(root, ports + [('Trunk', 'Ethernet64', server_vlans)])
+
+    return ('<LabConnectionGraph>\n'
+            '  <PhysicalNetworkGraphDeclaration>\n'
+            '    <Devices>\n%s\n    </Devices>\n'
+            '    <DeviceInterfaceLinks>\n%s\n    </DeviceInterfaceLinks>\n'
+            '  </PhysicalNetworkGraphDeclaration>\n'
+            '  <DataPlaneGraph>\n%s\n%s\n  </DataPlaneGraph>\n'
+            '</LabConnectionGraph>\n') % ('\n'.join(devices), '\n'.join(links), '\n'.join(l3info), '\n'.join(l2info))
+
+
+def load_module(path, name):
+    module = imp.load_source(name, path)
+    module.AnsibleModule = StandInModule
+    return module
+
+
+def run_module(module, graph, hostname):
+    """
+    @return: (facts or failure message, duration)
+    """
+    StandInModule.params_in = {'host': hostname, 'filename': graph}
+    start = time.time()
+    try:
+        module.main()
+    except ModuleExit as e:
+        # The same types as the facts have after the JSON round trip to ansible
+        return json.loads(json.dumps(e.args[0]['ansible_facts'])), time.time() - start
+    except ModuleFail as e:
+        # tracebacks differ in the file names and line numbers, compare the error only
+        return 'failed: %s' % str(e).strip().splitlines()[-1], time.time() - start
+    raise RuntimeError('%s did not exit' % module.__file__)
+
+
+def device_names(graph):
+    import lxml.etree as ET
+    return [dev.attrib['Hostname'] for dev in ET.parse(graph).iter('Device')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Equivalence check and benchmark of conn_graph_facts')
+    parser.add_argument('--reference-module', required=True, help='previous version of the module')
+    parser.add_argument('--module', default=MODULE, help='conn_graph_facts module to check')
+    parser.add_argument('--graph', help='lab connection graph file, generated if not given')
+    parser.add_argument('--fanouts', type=int, default=100, help='leaf fanouts of the generated graph')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='conn_graph_facts_')
+    try:
+        graph = args.graph
+        if graph is None:
+            graph = os.path.join(tmp_dir, 'lab_connection_graph.xml')
+            with open(graph, 'w') as f:
+                f.write(generate_graph(args.fanouts))
+
+        reference = load_module(args.reference_module, 'conn_graph_facts_reference')
+        module = load_module(args.module, 'conn_graph_facts_current')
+        index_paths = {
+            # a path under a file, the index can't be saved and every query parses the graph
+            'parsed': os.path.join(graph, 'index'),
+            'indexed': os.path.join(tmp_dir, 'index'),
+        }
+
+        hosts = device_names(graph)
+        print 'Graph %s: %d devices' % (graph, len(hosts))
+
+        module.LAB_GRAPH_INDEX_PATH = index_paths['indexed']
+        _, duration = run_module(module, graph, hosts[0])
+        print 'first query, the index is built: %.1f ms' % (1000 * duration)
+
+        failed = 0
+        timings = {'reference': [], 'parsed': [], 'indexed': []}
+        for hostname in hosts + [None, 'unknown-host']:
+            expected, duration = run_module(reference, graph, hostname)
+            if hostname in hosts:
+                timings['reference'].append(duration)
+            for run in ('parsed', 'indexed'):
+                module.LAB_GRAPH_INDEX_PATH = index_paths[run]
+                facts, duration = run_module(module, graph, hostname)
+                if hostname in hosts:
+                    timings[run].append(duration)
+                if facts != expected:
+                    failed += 1
+                    if failed <= 10:
+                        keys = sorted(k for k in set(expected) | set(facts) if expected.get(k) != facts.get(k)) \
+                            if isinstance(facts, dict) and isinstance(expected, dict) else [facts, expected]
+                        print '    MISMATCH %s, %s: %s' % (hostname, run, keys)
+
+        for run, durations in sorted(timings.items()):
+            print '%-9s %d queries, %.1f ms per query' % (run, len(durations), 1000 * sum(durations) / len(durations))
+        print 'FAILED' if failed else 'PASSED'
+        sys.exit(1 if failed else 0)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
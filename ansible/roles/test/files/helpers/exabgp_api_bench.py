@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Local benchmark of the exabgp control API (http_api.py), no exabgp and no DUT needed.
+
+Every peer is a stand-in of an exabgp instance: the API process is started with its stdout piped to
+a thread which reads and counts the commands, as exabgp does. Routes are sent to all the peers at the
+same time and the announce rate of every peer is reported, for each of the ways to send the routes:
+    single - one HTTP request per route
+    batch  - HTTP requests of --chunk-size routes over a keep-alive connection
+    stream - 'stream' line and newline-delimited routes over one connection, followed by 'sync'
+
+Example: exabgp_api_bench.py --peers 8 --routes 50000
+"""
+
+import argparse
+import httplib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+API = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http_api.py')
+
+
+class StandInPeer(object):
+    def __init__(self, port):
+        self.port = port
+        self.received = 0
+        self.proc = subprocess.Popen([sys.executable, API, str(port)], stdout=subprocess.PIPE)
+        self.reader = threading.Thread(target=self.read_commands)
+        self.reader.daemon = True
+        self.reader.start()
+        self.wait_listening()
+
+    def read_commands(self):
+        for _ in iter(self.proc.stdout.readline, ''):
+            self.received += 1
+
+    def wait_listening(self, timeout=10):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                socket.create_connection(('localhost', self.port)).close()
+                return
+            except socket.error:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def stop(self):
+        self.proc.kill()
+        self.proc.wait()
+
+
+def generate_routes(count, peer):
+    for i in xrange(count):
+        yield 'announce route 10.%d.%d.%d/32 next-hop 192.168.0.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff, peer)
+
+
+def send_single(port, routes, chunk_size):
+    conn = httplib.HTTPConnection('localhost', port)
+    for route in routes:
+        conn.request('POST', '/', json.dumps([route]), {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+    conn.close()
+
+
+def send_batch(port, routes, chunk_size):
+    conn = httplib.HTTPConnection('localhost', port)
+    for start in xrange(0, len(routes), chunk_size):
+        conn.request('POST', '/', json.dumps({'commands': routes[start:start + chunk_size]}),
+                     {'Content-Type': 'application/json'})
+        reply = conn.getresponse()
+        reply.read()
+        assert reply.status == 200, reply.status
+    conn.close()
+
+
+def send_stream(port, routes, chunk_size):
+    sock = socket.create_connection(('localhost', port))
+    sock.sendall('stream\n' + ''.join('%s\n' % route for route in routes) + 'sync\n')
+    reply = sock.makefile('rb').readline()
+    sock.close()
+    assert reply.startswith('OK'), reply
+
+
+SENDERS = [('single', send_single), ('batch', send_batch), ('stream', send_stream)]
+
+
+def run(mode, send, peers, routes, chunk_size):
+    durations = {}
+
+    def announce(peer):
+        start = time.time()
+        send(peer.port, routes[peer.port], chunk_size)
+        durations[peer.port] = time.time() - start
+
+    received = dict((peer.port, peer.received) for peer in peers)
+    threads = [threading.Thread(target=announce, args=(peer,)) for peer in peers]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.time() - start
+
+    for peer in peers:
+        count = len(routes[peer.port])
+        duration = durations[peer.port]
+        print '%-6s port %d: %d routes in %.2f s, %.0f routes/s, %d received' % \
+              (mode, peer.port, count, duration, count / duration, peer.received - received[peer.port])
+    count = sum(len(r) for r in routes.values())
+    print '%-6s all %d peers: %d routes in %.2f s, %.0f routes/s' % (mode, len(peers), count, total, count / total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the exabgp control API')
+    parser.add_argument('--peers', type=int, default=4, help='number of stand-in exabgp instances')
+    parser.add_argument('--routes', type=int, default=20000, help='routes to announce to every peer')
+    parser.add_argument('--single-routes', type=int, default=1000,
+                        help='routes to announce to every peer one request per route')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='routes in one HTTP request of batch mode')
+    parser.add_argument('--port', type=int, default=15000, help='API port of the first peer')
+    parser.add_argument('--modes', default=','.join(mode for mode, _ in SENDERS),
+                        help='comma separated modes to run')
+    args = parser.parse_args()
+
+    peers = [StandInPeer(args.port + i) for i in range(args.peers)]
+    try:
+        for mode, send in SENDERS:
+            if mode not in args.modes.split(','):
+                continue
+            count = args.single_routes if mode == 'single' else args.routes
+            routes = dict((peer.port, list(generate_routes(count, i))) for i, peer in enumerate(peers))
+            run(mode, send, peers, routes, args.chunk_size)
+    finally:
+        for peer in peers:
+            peer.stop()
+
+
+if __name__ == '__main__':
+    main()
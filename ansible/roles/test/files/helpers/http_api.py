@@ -1,16 +1,165 @@
-from flask import Flask, request
+#!/usr/bin/env python
+"""
+Control API of an exabgp instance, started by exabgp as an API process with the TCP port to listen on.
+Every command written to stdout of this process is executed by exabgp.
+
+Two kinds of connections are accepted on the port:
+
+HTTP, any number of requests over a keep-alive connection:
+    POST / with the form field 'command', or 'commands' holding ';' separated commands,
+    or a JSON body {"commands": ["announce route ...", ...]}.
+    The reply is sent when exabgp has read all the commands of the request.
+    Other methods are answered with 405.
+
+Stream, the line 'stream' followed by newline-delimited commands:
+    stream
+    announce route 192.168.0.0/25 next-hop 10.0.0.1
+    announce route 192.168.0.128/25 next-hop 10.0.0.1
+    sync
+    The 'sync' line is answered with 'OK <count>' when exabgp has read all the commands received on
+    the connection so far, count is the number of those commands. 'TIMEOUT <count>' is sent instead
+    if exabgp didn't read them in SYNC_TIMEOUT seconds.
+
+Commands are passed to exabgp as they arrive. Writing to exabgp blocks while its pipe is full, which
+stops reading from the connection, so the client is slowed down to the rate exabgp takes the commands.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import cgi
+import fcntl
+import json
+import socket
+import struct
 import sys
+import termios
+import threading
+import time
 
-app = Flask(__name__)
+SYNC = 'sync'
+# First line of a stream connection, any other connection is HTTP
+STREAM_PREAMBLE = 'stream\n'
+SYNC_TIMEOUT = 60
+RECV_SIZE = 1 << 16
 
-# Setup a command route to listen for prefix advertisements
-@app.route('/', methods=['POST'])
-def run_command():
-    command = request.form['command']
-    sys.stdout.write('%s\n' % command)
-    sys.stdout.flush()
-    return 'OK\n'
+output_lock = threading.Lock()
+
+
+def write_commands(cmds):
+    if not cmds:
+        return
+    data = ''.join('%s\n' % cmd for cmd in cmds)
+    with output_lock:
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+
+def wait_commands_read(timeout=SYNC_TIMEOUT):
+    """
+    Waits until exabgp has read everything written to its pipe.
+    Returns False if it didn't in timeout seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            pending = struct.unpack('i', fcntl.ioctl(sys.stdout.fileno(), termios.FIONREAD, '\0' * 4))[0]
+        except IOError:
+            # Not a pipe, nothing to wait for.
+            return True
+        if pending == 0:
+            return True
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+
+
+class StreamHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        count = 0
+        data = ''
+        while True:
+            chunk = self.request.recv(RECV_SIZE)
+            if not chunk:
+                break
+            lines = (data + chunk).split('\n')
+            data = lines.pop()
+            cmds = []
+            for line in lines:
+                cmd = line.strip()
+                if cmd == SYNC:
+                    write_commands(cmds)
+                    cmds = []
+                    status = 'OK' if wait_commands_read() else 'TIMEOUT'
+                    self.request.sendall('%s %d\n' % (status, count))
+                elif cmd:
+                    cmds.append(cmd)
+                    count += 1
+            write_commands(cmds)
+        if data.strip():
+            write_commands([data.strip()])
 
-if __name__ == '__main__':
-    app.run(port=sys.argv[1])
 
+class HttpHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send the whole reply at once, it is flushed after every request.
+    wbufsize = -1
+
+    def do_POST(self):
+        content_type = self.headers.getheader('content-type', '')
+        if content_type.startswith('application/json'):
+            body = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+            cmds = body['commands'] if isinstance(body, dict) else body
+            cmds = [cmd.encode('utf-8') for cmd in cmds]
+        else:
+            form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                    environ={'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': content_type})
+            if 'commands' in form:
+                cmds = form.getfirst('commands').split(';')
+            else:
+                cmds = form.getlist('command')
+
+        write_commands(cmds)
+        if wait_commands_read():
+            self.reply(200, 'OK\n')
+        else:
+            self.reply(504, 'TIMEOUT\n')
+
+    def __getattr__(self, name):
+        # Handler of any other method than POST
+        if name.startswith('do_'):
+            return self.method_not_allowed
+        raise AttributeError(name)
+
+    def method_not_allowed(self):
+        self.reply(405, 'Method not allowed\n', allow='POST')
+
+    def reply(self, code, text, allow=None):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(text)))
+        if allow:
+            self.send_header('Allow', allow)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApiServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def finish_request(self, request, client_address):
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        head = request.recv(len(STREAM_PREAMBLE), socket.MSG_PEEK | socket.MSG_WAITALL)
+        if head == STREAM_PREAMBLE:
+            request.recv(len(STREAM_PREAMBLE))
+            StreamHandler(request, client_address, self)
+        else:
+            HttpHandler(request, client_address, self)
+
+
+if __name__ == '__main__':
+    ApiServer(('0.0.0.0', int(sys.argv[1])), StreamHandler).serve_forever()
@@ -63,9 +63,13 @@ import pickle
 from operator import itemgetter
 import scapy.all as scapyall
 import itertools
+import array
+import bisect
+import binascii
 
 from arista import Arista
 import sad_path as sp
+import packet_ring
 
 
 class StateMachine():
@@ -150,6 +154,8 @@ class ReloadTest(BaseTest):
         self.check_param('sniff_time_incr', 60, required = False)
         self.check_param('vnet', False, required = False)
         self.check_param('vnet_pkts', None, required = False)
+        self.check_param('packet_ring', False, required = False) # send and capture the flow through packet_ring engine
+        self.check_param('packet_ring_interval', 0.0005, required = False) # inter-packet interval for packet_ring sender
         if not self.test_params['preboot_oper'] or self.test_params['preboot_oper'] == 'None':
             self.test_params['preboot_oper'] = None
         if not self.test_params['inboot_oper'] or self.test_params['inboot_oper'] == 'None':
@@ -193,6 +199,10 @@ class ReloadTest(BaseTest):
         #   Improve this interval to gain more precision of disruptions.
         self.send_interval = 0.0035
         self.packets_to_send = min(int(self.time_to_listen / (self.send_interval + 0.0015)), 45000) # How many packets to be sent in send_in_background method
+        self.packet_ring = self.test_params['packet_ring'] and not self.vnet
+        if self.packet_ring:
+            # Neither sent nor captured packets are kept in memory, so the flow is not limited in size.
+            self.packets_to_send = int(self.time_to_listen / self.test_params['packet_ring_interval'])
 
         # Thread pool for background watching operations
         self.pool = ThreadPool(processes=3)
@@ -709,6 +719,10 @@ class ReloadTest(BaseTest):
         """
 
         self.send_interval = self.time_to_listen / self.packets_to_send
+        if self.packet_ring:
+            self.generate_flow_templates()
+            return
+
         self.packets_list = []
         from_t1_iter = itertools.cycle(self.from_t1)
 
@@ -725,6 +739,25 @@ class ReloadTest(BaseTest):
                 from_port = src_port
             self.packets_list.append((from_port, str(packet)))
 
+    def generate_flow_templates(self):
+        """
+        This method is used by generate_bidirectional() instead of pre-generating packets for packet_ring sender.
+        It builds a packet template for the packet from vlan and for every packet from T1,
+        and the flow schedule: index of the template for every packet, in the same order as generate_bidirectional().
+        Template payload is the packet ID zero-padded to a fixed width, so it is rewritten in place by the sender.
+        """
+        seq_width = len(str(self.packets_to_send - 1))
+        payload = '0' * (60 + seq_width)
+        self.flow_templates = []
+        for src_port, packet in [(self.from_server_src_port, self.from_vlan_packet)] + self.from_t1:
+            packet = scapyall.Ether(packet)
+            packet.load = payload
+            frame = str(packet)
+            self.flow_templates.append((src_port, packet_ring.PacketTemplate(frame, len(frame) - seq_width, seq_width)))
+
+        from_t1_iter = itertools.cycle(xrange(1, len(self.flow_templates)))
+        self.flow_schedule = array.array('I', (0 if i % 5 == 0 else next(from_t1_iter) for i in xrange(self.packets_to_send)))
+
     def runTest(self):
         self.reboot_start = None
         no_routing_start = None
@@ -831,7 +864,7 @@ class ReloadTest(BaseTest):
 
                 examine_start = datetime.datetime.now()
                 self.log("Packet flow examine started %s after the reboot" % str(examine_start - self.reboot_start))
-                self.examine_flow()
+                self.examine_flow(self.get_capture_filename() if self.packet_ring else None)
                 self.log("Packet flow examine finished after %s" % str(datetime.datetime.now() - examine_start))
 
                 if self.lost_packets:
@@ -1066,12 +1099,21 @@ class ReloadTest(BaseTest):
             self.apply_filter_all_ports('not (arp and ether src {}) and not tcp'.format(self.test_params['dut_mac']))
             sender_start = datetime.datetime.now()
             self.log("Sender started at %s" % str(sender_start))
-            for entry in packets_list:
-                time.sleep(interval)
-                if self.vnet:
-                    testutils.send_packet(self, entry[0], entry[1].decode("base64"))
-                else:
-                    testutils.send_packet(self, *entry)
+            if self.packet_ring:
+                port_map = dict((port, iface) for (device, port), iface in config['port_map'].items() if device == 0)
+                sender = packet_ring.FlowSender(port_map, self.flow_templates, self.flow_schedule)
+                try:
+                    max_lag = sender.send(interval)
+                finally:
+                    sender.close()
+                self.log("Sender was behind the schedule by %.4f seconds at most" % max_lag)
+            else:
+                for entry in packets_list:
+                    time.sleep(interval)
+                    if self.vnet:
+                        testutils.send_packet(self, entry[0], entry[1].decode("base64"))
+                    else:
+                        testutils.send_packet(self, *entry)
             self.log("Sender has been running for %s" % str(datetime.datetime.now() - sender_start))
             # Remove filter
             self.apply_filter_all_ports('')
@@ -1088,7 +1130,8 @@ class ReloadTest(BaseTest):
         sniffer_start = datetime.datetime.now()
         self.log("Sniffer started at %s" % str(sniffer_start))
         sniff_filter = "tcp and tcp dst port 5000 and tcp src port 1234 and not icmp"
-        scapy_sniffer = threading.Thread(target=self.scapy_sniff, kwargs={'wait': wait, 'sniff_filter': sniff_filter})
+        sniff = self.ring_capture if self.packet_ring else self.scapy_sniff
+        scapy_sniffer = threading.Thread(target=sniff, kwargs={'wait': wait, 'sniff_filter': sniff_filter})
         scapy_sniffer.start()
         time.sleep(2)               # Let the scapy sniff initialize completely.
         self.sniffer_started.set()  # Unblock waiter for the send_in_background.
@@ -1096,9 +1139,14 @@ class ReloadTest(BaseTest):
         self.log("Sniffer has been running for %s" % str(datetime.datetime.now() - sniffer_start))
         self.sniffer_started.clear()
 
+    def get_capture_filename(self):
+        return "/tmp/capture_%s.pcap" % self.sad_oper if self.sad_oper is not None else "/tmp/capture.pcap"
+
     def save_sniffed_packets(self):
-        filename = "/tmp/capture_%s.pcap" % self.sad_oper if self.sad_oper is not None else "/tmp/capture.pcap"
-        if self.packets:
+        filename = self.get_capture_filename()
+        if self.packet_ring:
+            self.log("Pcap file streamed to %s" % filename)
+        elif self.packets:
             scapyall.wrpcap(filename, self.packets)
             self.log("Pcap file dumped to %s" % filename)
         else:
@@ -1110,6 +1158,19 @@ class ReloadTest(BaseTest):
         """
         self.packets = scapyall.sniff(timeout = wait, filter = sniff_filter)
 
+    def ring_capture(self, wait = 180, sniff_filter = ''):
+        """
+        This method is used instead of scapy_sniff() with packet_ring enabled.
+        Captured packets are streamed to the capture pcap file instead of being kept in self.packets.
+        """
+        capture = packet_ring.RingCapture()
+        try:
+            capture.set_filter(sniff_filter)
+            captured, dropped = capture.capture(self.get_capture_filename(), wait)
+        finally:
+            capture.close()
+        self.log("Captured %d packets, %d packets dropped by kernel" % (captured, dropped))
+
     def send_and_sniff(self):
         """
         This method starts two background threads in parallel:
@@ -1123,30 +1184,58 @@ class ReloadTest(BaseTest):
         self.sniff_thr.join()
         self.sender_thr.join()
 
-    def check_tcp_payload(self, packet):
+    @staticmethod
+    def parse_l4(frame):
         """
-        This method is used by examine_flow() method.
-        It returns True if a packet is not corrupted and has a valid TCP sequential TCP Payload, as created by generate_bidirectional() method'.
+        This method is used by examine_flow() method instead of scapy dissection.
+        It returns (IP protocol, source port, destination port, L4 payload) of an Ethernet frame
+        carrying a non fragmented IPv4 or IPv6 TCP/UDP packet, or None for any other frame.
+        As str() of the scapy payload, L4 payload runs up to the end of the frame, regardless of IP length.
         """
-        try:
-            int(str(packet[scapyall.TCP].payload)) in range(self.packets_to_send)
-            return True
-        except Exception as err:
-            return False
+        offset = 12
+        ether_type = frame[offset:offset + 2]
+        while ether_type == '\x81\x00':     # Skip 802.1Q tags.
+            offset += 4
+            ether_type = frame[offset:offset + 2]
+        offset += 2
+        if ether_type == '\x08\x00' and len(frame) >= offset + 20:
+            header_length = (ord(frame[offset]) & 0x0f) * 4
+            fragment, = struct.unpack('!H', frame[offset + 6:offset + 8])
+            if fragment & 0x1fff:
+                return None
+            proto = ord(frame[offset + 9])
+            offset += header_length
+        elif ether_type == '\x86\xdd' and len(frame) >= offset + 40:
+            proto = ord(frame[offset + 6])
+            offset += 40
+        else:
+            return None
+        if proto == socket.IPPROTO_TCP and len(frame) >= offset + 20:
+            header_length = (ord(frame[offset + 12]) >> 4) * 4
+        elif proto == socket.IPPROTO_UDP and len(frame) >= offset + 8:
+            header_length = 8
+        else:
+            return None
+        sport, dport = struct.unpack('!HH', frame[offset:offset + 4])
+        return proto, sport, dport, frame[offset + header_length:]
 
-    def no_flood(self, packet):
+    def flow_frames(self, filename = None):
         """
-        This method filters packets which are unique (i.e. no floods).
+        This method yields (raw frame, timestamp) for every packet of pcap file (if given), or of self.packets.
+        Packets of pcap file are read raw, without scapy dissection.
         """
-        if (not int(str(packet[scapyall.TCP].payload)) in self.unique_id) and (packet[scapyall.Ether].src == self.dut_mac):
-            # This is a unique (no flooded) received packet.
-            self.unique_id.append(int(str(packet[scapyall.TCP].payload)))
-            return True
-        elif packet[scapyall.Ether].dst == self.dut_mac:
-            # This is a sent packet.
-            return True
-        else:
-            return False
+        if not filename:
+            for packet in self.packets:
+                yield getattr(packet, 'original', None) or str(packet), packet.time
+            return
+        reader = scapyall.RawPcapReader(filename)
+        # Same timestamp as scapy rdpcap() gives to the packet.
+        usec = 0.000000001 if getattr(reader, 'nano', False) else 0.000001
+        try:
+            for frame, meta in reader:
+                yield frame, meta[0] + usec * meta[1]
+        finally:
+            reader.close()
 
     def examine_flow(self, filename = None):
         """
@@ -1156,81 +1245,85 @@ class ReloadTest(BaseTest):
         All disruptions are saved to self.lost_packets dictionary, in format:
         disrupt_start_id = (missing_packets_count, disrupt_time, disrupt_start_timestamp, disrupt_stop_timestamp)
         """
-        if filename:
-            all_packets = scapyall.rdpcap(filename)
-        elif self.packets:
-            all_packets = self.packets
+        if filename or self.packets:
+            frames = self.flow_frames(filename)
         else:
             self.log("Filename and self.packets are not defined.")
             self.fails['dut'].add("Filename and self.packets are not defined")
             return None
-        # Filter out packets and remove floods:
-        self.unique_id = list()     # This list will contain all unique Payload ID, to filter out received floods.
-        filtered_packets = [ pkt for pkt in all_packets if
-            scapyall.TCP in pkt and
-            not scapyall.ICMP in pkt and
-            pkt[scapyall.TCP].sport == 1234 and
-            pkt[scapyall.TCP].dport == 5000 and
-            self.check_tcp_payload(pkt) and
-            self.no_flood(pkt)
-            ]
-
-        if self.vnet:
-            decap_packets = [ scapyall.Ether(str(pkt.payload.payload.payload)[8:]) for pkt in all_packets if
-                scapyall.UDP in pkt and
-                pkt[scapyall.UDP].sport == 1234
-                ]
-            filtered_decap_packets = [ pkt for pkt in decap_packets if
-                scapyall.TCP in pkt and
-                not scapyall.ICMP in pkt and
-                pkt[scapyall.TCP].sport == 1234 and
-                pkt[scapyall.TCP].dport == 5000 and
-                self.check_tcp_payload(pkt) and
-                self.no_flood(pkt)
-                ]
-            filtered_packets = filtered_packets + filtered_decap_packets
+        dut_mac = binascii.unhexlify(self.dut_mac.replace(':', ''))
+        # Every packet is parsed once into (payload_id, timestamp, position) of a sent or a received packet.
+        # Position is the index of the packet in filtered_frames, it keeps packets with the same
+        # payload ID and timestamp in capture order, as the sort of the packets themselves did.
+        seen_ids = set()        # Payload IDs of the received packets, to filter out received floods.
+        sent, received = [], []
+        filtered_frames = []
+        decap_frames = []
+
+        def filter_frame(frame, timestamp):
+            l4 = self.parse_l4(frame)
+            if l4 is None or l4[:3] != (socket.IPPROTO_TCP, 1234, 5000):
+                return
+            try:
+                payload_id = int(l4[3])
+            except ValueError:
+                return
+            if frame[6:12] == dut_mac and payload_id not in seen_ids:
+                # This is a unique (no flooded) received packet.
+                seen_ids.add(payload_id)
+            elif frame[0:6] != dut_mac:
+                return
+            flow = sent if frame[0:6] == dut_mac else received
+            flow.append((payload_id, timestamp, len(filtered_frames)))
+            filtered_frames.append((frame, timestamp))
+
+        for frame, timestamp in frames:
+            filter_frame(frame, timestamp)
+            if self.vnet:
+                l4 = self.parse_l4(frame)
+                if l4 is not None and l4[0] == socket.IPPROTO_UDP and l4[1] == 1234:
+                    decap_frames.append((l4[3][8:], timestamp))
+        for frame, timestamp in decap_frames:
+            filter_frame(frame, timestamp)
 
-        # Re-arrange packets, if delayed, by Payload ID and Timestamp:
-        packets = sorted(filtered_packets, key = lambda packet: (int(str(packet[scapyall.TCP].payload)), packet.time ))
         self.lost_packets = dict()
         self.max_disrupt, self.total_disruption = 0, 0
-        sent_packets = dict()
         self.fails['dut'].add("Sniffer failed to capture any traffic")
-        self.assertTrue(packets, "Sniffer failed to capture any traffic")
+        self.assertTrue(filtered_frames, "Sniffer failed to capture any traffic")
         self.fails['dut'].clear()
-        if packets:
-            prev_payload, prev_time = 0, 0
-            sent_payload = 0
-            received_counter = 0    # Counts packets from dut.
-            self.disruption_start, self.disruption_stop = None, None
-            for packet in packets:
-                if packet[scapyall.Ether].dst == self.dut_mac:
-                    # This is a sent packet - keep track of it as payload_id:timestamp.
-                    sent_payload = int(str(packet[scapyall.TCP].payload))
-                    sent_packets[sent_payload] = packet.time
-                    continue
-                if packet[scapyall.Ether].src == self.dut_mac:
-                    # This is a received packet.
-                    received_time = packet.time
-                    received_payload = int(str(packet[scapyall.TCP].payload))
-                    received_counter += 1
-                if not (received_payload and received_time):
-                    # This is the first valid received packet.
-                    prev_payload = received_payload
-                    prev_time = received_time
-                    continue
-                if received_payload - prev_payload > 1:
-                    # Packets in a row are missing, a disruption.
-                    lost_id = (received_payload -1) - prev_payload # How many packets lost in a row.
-                    disrupt = (sent_packets[received_payload] - sent_packets[prev_payload + 1]) # How long disrupt lasted.
-                    # Add disrupt to the dict:
-                    self.lost_packets[prev_payload] = (lost_id, disrupt, received_time - disrupt, received_time)
-                    self.log("Disruption between packet ID %d and %d. For %.4f " % (prev_payload, received_payload, disrupt))
-                    if not self.disruption_start:
-                        self.disruption_start = datetime.datetime.fromtimestamp(prev_time)
-                    self.disruption_stop = datetime.datetime.fromtimestamp(received_time)
-                prev_payload = received_payload
-                prev_time = received_time
+
+        # Re-arrange packets, if delayed, by Payload ID and Timestamp:
+        sent.sort()
+        received.sort()
+        received_counter = len(received)    # Counts packets from dut.
+        self.disruption_start, self.disruption_stop = None, None
+
+        def sent_time(key):
+            # Timestamp of the last sent packet with the payload ID of the key, which sorts before the key.
+            index = bisect.bisect_left(sent, key)
+            if not index or sent[index - 1][0] != key[0]:
+                raise KeyError(key[0])
+            return sent[index - 1][1]
+
+        if received:
+            received_ids, received_times, _ = zip(*received)
+            # The first received packet is compared with payload ID 0, unless it is 0 itself.
+            prev_ids = (0,) + received_ids[:-1]
+            prev_times = (0,) + received_times[:-1]
+            gaps = [index for index, (prev_payload, received_payload) in enumerate(itertools.izip(prev_ids, received_ids))
+                    if received_payload - prev_payload > 1 and received_payload and received_times[index]]
+            for index in gaps:
+                prev_payload, received_payload = prev_ids[index], received_ids[index]
+                received_time = received_times[index]
+                # Packets in a row are missing, a disruption.
+                lost_id = (received_payload -1) - prev_payload # How many packets lost in a row.
+                disrupt = sent_time(received[index]) - sent_time((prev_payload + 1, float('inf'))) # How long disrupt lasted.
+                # Add disrupt to the dict:
+                self.lost_packets[prev_payload] = (lost_id, disrupt, received_time - disrupt, received_time)
+                self.log("Disruption between packet ID %d and %d. For %.4f " % (prev_payload, received_payload, disrupt))
+            if gaps:
+                self.disruption_start = datetime.datetime.fromtimestamp(prev_times[gaps[0]])
+                self.disruption_stop = datetime.datetime.fromtimestamp(received_times[gaps[-1]])
         self.fails['dut'].add("Sniffer failed to filter any traffic from DUT")
         self.assertTrue(received_counter, "Sniffer failed to filter any traffic from DUT")
         self.fails['dut'].clear()
@@ -1250,10 +1343,15 @@ class ReloadTest(BaseTest):
             self.total_disrupt_time = 0
             self.log("Gaps in forwarding not found.")
         self.log("Total incoming packets captured %d" % received_counter)
-        if packets:
-            filename = '/tmp/capture_filtered.pcap' if self.sad_oper is None else "/tmp/capture_filtered_%s.pcap" % self.sad_oper
-            scapyall.wrpcap(filename, packets)
-            self.log("Filtered pcap dumped to %s" % filename)
+        filename = '/tmp/capture_filtered.pcap' if self.sad_oper is None else "/tmp/capture_filtered_%s.pcap" % self.sad_oper
+        filtered_packets = []
+        for _, _, position in sorted(sent + received):
+            frame, timestamp = filtered_frames[position]
+            packet = scapyall.Raw(frame)
+            packet.time = timestamp
+            filtered_packets.append(packet)
+        scapyall.wrpcap(filename, filtered_packets, linktype=1)     # DLT_EN10MB
+        self.log("Filtered pcap dumped to %s" % filename)
 
     def check_forwarding_stop(self):
         self.asic_start_recording_vlan_reachability()
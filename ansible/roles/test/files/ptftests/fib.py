@@ -1,5 +1,4 @@
 import re
-from ipaddress import ip_address, ip_network
 from lpm import LpmDict
 
 # These subnets are excluded from FIB test
@@ -53,23 +52,29 @@ class Fib():
         # filter out empty lines and lines starting with '#'
         pattern = re.compile("^#.*$|^[ \t]*$")
 
+        # routes share a few next hops, parse every next hop only once and share the NextHop object
+        next_hops = {}
+
         with open(file_path, 'r') as f:
-            for line in f.readlines():
+            for line in f:
                 if pattern.match(line): continue
                 entry = line.split(' ', 1)
-                prefix = ip_network(unicode(entry[0]))
-                next_hop = self.NextHop(entry[1])
-                if prefix.version is 4:
-                    self._ipv4_lpm_dict[str(prefix)] = next_hop
-                elif prefix.version is 6:
-                    self._ipv6_lpm_dict[str(prefix)] = next_hop
+                prefix = entry[0].strip()
+                next_hop_str = entry[1] if len(entry) > 1 else ''
+                next_hop = next_hops.get(next_hop_str)
+                if next_hop is None:
+                    next_hop = next_hops[next_hop_str] = self.NextHop(next_hop_str)
+                if ':' in prefix:
+                    self._ipv6_lpm_dict[prefix] = next_hop
+                else:
+                    self._ipv4_lpm_dict[prefix] = next_hop
 
     def __getitem__(self, ip):
-        ip = ip_address(unicode(ip))
-        if ip.version is 4:
-            return self._ipv4_lpm_dict[str(ip)]
-        elif ip.version is 6:
-            return self._ipv6_lpm_dict[str(ip)]
+        ip = str(ip)
+        if ':' in ip:
+            return self._ipv6_lpm_dict[ip]
+        else:
+            return self._ipv4_lpm_dict[ip]
 
     def ipv4_ranges(self):
         return self._ipv4_lpm_dict.ranges()
@@ -14,7 +14,9 @@ import ipaddress
 import logging
 import random
 import socket
+import struct
 import sys
+import time
 
 import ptf
 import ptf.packet as scapy
@@ -63,6 +65,10 @@ class FibTest(BaseTest):
     DEFAULT_BALANCING_TEST_RATIO = 0.0001
     ACTION_FWD = 'fwd'
     ACTION_DROP = 'drop'
+    DEFAULT_PIPELINE_TIMEOUT = 2
+    # Pipelined packets carry the tag and the packet sequence number at the end of the payload
+    PIPELINE_TAG = 'FIBT'
+    PIPELINE_TAG_FORMAT = '!4sI'
 
     _required_params = [
         'fib_info',
@@ -98,6 +104,10 @@ class FibTest(BaseTest):
          - ip_options       enable ip option header in ipv4 pkts. Default: False(disable)
          - src_vid          vlan tag id of src pkts. Default: None(untag)
          - dst_vid          vlan tag id of dst pkts. Default: None(untag)
+         - pipeline_window  number of packets sent back to back before the received packets are
+                            matched to them. Default: 0(disable, every packet is verified before
+                            the next one is sent)
+         - pipeline_timeout time in seconds to wait for the packets of one window. Default: 2
 
         TODO: Have a separate line in fib_info/file to indicate all UP ports
         '''
@@ -121,6 +131,10 @@ class FibTest(BaseTest):
         self.src_vid = self.test_params.get('src_vid', None)
         self.dst_vid = self.test_params.get('dst_vid', None)
 
+        self.pipeline_window = self.test_params.get('pipeline_window', 0)
+        self.pipeline_timeout = self.test_params.get('pipeline_timeout', self.DEFAULT_PIPELINE_TIMEOUT)
+        self.pipeline_seq = 0
+
         self.src_ports = self.test_params.get('src_ports', None)
         if self.src_ports is None:
             # Provide the list of all UP interfaces with index in sequence order starting from 0
@@ -150,11 +164,134 @@ class FibTest(BaseTest):
             ip_ranges = self.fib.ipv4_ranges()
         else:
             ip_ranges = self.fib.ipv6_ranges()
-        
+
+        if self.pipeline_window:
+            self.check_ip_ranges_pipelined(((ip_range, self.fib[ip_range.get_first_ip()]) for ip_range in ip_ranges),
+                                           ipv4)
+            return
+
         for ip_range in ip_ranges:
             next_hop = self.fib[ip_range.get_first_ip()]
             self.check_ip_range(ip_range, next_hop, ipv4)
 
+    def check_ip_ranges_pipelined(self, entries, ipv4=True):
+        '''
+        @summary: Check IP ranges like check_ip_range() does, but send the packets of up to pipeline_window
+                  checks back to back and match the received packets to the sent ones afterwards.
+                  Failures are collected and reported per range after all the ranges are checked.
+        @param entries: iterable of (ip_range, next_hop) tuples
+        '''
+        failures = []
+        balancing_checks = []
+
+        def probes():
+            for ip_range, next_hop in entries:
+                exp_port_list = next_hop.get_next_hop_list()
+                src_port = random.choice([port for port in self.src_ports if port not in exp_port_list])
+
+                if not exp_port_list:
+                    continue
+
+                logging.info("Check IP range:" + str(ip_range) + " on " + str(exp_port_list) + "...")
+
+                yield ip_range, src_port, ip_range.get_first_ip(), exp_port_list, None
+                if ip_range.length() > 1:
+                    yield ip_range, src_port, ip_range.get_last_ip(), exp_port_list, None
+                if ip_range.length() > 2:
+                    yield ip_range, src_port, ip_range.get_random_ip(), exp_port_list, None
+
+                if (self.test_balancing and self.pkt_action == self.ACTION_FWD
+                        and len(exp_port_list) > 1
+                        and random.random() < self.balancing_test_ratio):
+                    dst_ip = ip_range.get_random_ip()
+                    hit_count_map = {}
+                    balancing_checks.append((ip_range, next_hop, hit_count_map))
+                    for i in range(0, self.balancing_test_times):
+                        yield ip_range, src_port, dst_ip, exp_port_list, hit_count_map
+
+        window = []
+        for probe in probes():
+            window.append(probe)
+            if len(window) == self.pipeline_window:
+                failures.extend(self.check_ip_routes_window(window, ipv4))
+                window = []
+        if window:
+            failures.extend(self.check_ip_routes_window(window, ipv4))
+
+        failed_ranges = {}
+        for ip_range, dst_ip, reason in failures:
+            failed_ranges.setdefault(str(ip_range), []).append("{} {}".format(dst_ip, reason))
+        for ip_range, errors in failed_ranges.items():
+            logging.error("Check IP range:" + ip_range + " failed: " + "; ".join(errors))
+        assert not failed_ranges, "{} IP ranges failed: {}".format(len(failed_ranges), ", ".join(failed_ranges.keys()[:10]))
+
+        for ip_range, next_hop, hit_count_map in balancing_checks:
+            logging.info("Check IP range balancing:" + str(ip_range) + "...")
+            self.check_balancing(next_hop.get_next_hop(), hit_count_map)
+
+    def check_ip_routes_window(self, window, ipv4=True):
+        '''
+        @summary: Send the packets for a window of checks back to back, then match the received packets to them
+                  by the sequence number in the payload.
+        @param window: list of (ip_range, src_port, dst_ip, exp_port_list, hit_count_map) tuples, hit_count_map is
+                       updated with the port which received the packet if it is not None
+        @return list of (ip_range, dst_ip, reason) tuples for the failed checks
+        '''
+        failures = []
+        pending = {}
+        packets = []
+        for probe in window:
+            self.pipeline_seq = (self.pipeline_seq + 1) % 2**32
+            tag = struct.pack(self.PIPELINE_TAG_FORMAT, self.PIPELINE_TAG, self.pipeline_seq)
+            if ipv4:
+                pkt, masked_exp_pkt = self.create_ipv4_packets(probe[2], tag)
+            else:
+                pkt, masked_exp_pkt = self.create_ipv6_packets(probe[2], tag)
+            pending[self.pipeline_seq] = (probe, masked_exp_pkt)
+            packets.append((probe[1], pkt))
+
+        for src_port, pkt in packets:
+            send_packet(self, src_port, pkt)
+        logging.debug("Sent {} packets, waiting for them".format(len(packets)))
+
+        tag_len = struct.calcsize(self.PIPELINE_TAG_FORMAT)
+        deadline = time.time() + self.pipeline_timeout
+        while pending:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            result = self.dataplane.poll(device_number=0, timeout=timeout)
+            if not isinstance(result, self.dataplane.PollSuccess):
+                break
+            data = str(result.packet)
+            tag, seq = struct.unpack(self.PIPELINE_TAG_FORMAT, data[-tag_len:]) if len(data) >= tag_len else (None, None)
+            if tag != self.PIPELINE_TAG or seq not in pending:
+                continue
+
+            (ip_range, src_port, dst_ip, exp_port_list, hit_count_map), masked_exp_pkt = pending.pop(seq)
+            if self.pkt_action == self.ACTION_DROP:
+                failures.append((ip_range, dst_ip, "received on port " + str(result.port)))
+            elif result.port not in exp_port_list:
+                failures.append((ip_range, dst_ip, "received on unexpected port " + str(result.port)))
+            elif not masked_exp_pkt.pkt_match(result.packet):
+                failures.append((ip_range, dst_ip, "received unexpected packet on port " + str(result.port)))
+            elif hit_count_map is not None:
+                hit_count_map[result.port] = hit_count_map.get(result.port, 0) + 1
+
+        if self.pkt_action == self.ACTION_FWD:
+            for (ip_range, src_port, dst_ip, exp_port_list, hit_count_map), _ in pending.values():
+                failures.append((ip_range, dst_ip, "not received on any of " + str(exp_port_list)))
+
+        return failures
+
+    def tag_packet(self, pkt, tag):
+        '''
+        @summary: Replace the end of the packet payload with the tag
+        '''
+        payload = pkt[scapy.TCP].payload
+        assert len(getattr(payload, 'load', '')) >= len(tag), "Packet is too short to be tagged"
+        payload.load = payload.load[:-len(tag)] + tag
+
     def check_ip_range(self, ip_range, next_hop, ipv4=True):
         # Get the expected list of ports that would receive the packets
         exp_port_list = next_hop.get_next_hop_list()
@@ -212,6 +349,23 @@ class FibTest(BaseTest):
         @param dest_ip_addr: destination IP to build packet with.
         @param dst_port_list: list of ports on which to expect packet to come back from the switch
         '''
+        pkt, masked_exp_pkt = self.create_ipv4_packets(dst_ip_addr)
+
+        send_packet(self, src_port, pkt)
+        logging.info("Sending packet from port " + str(src_port) + " to " + dst_ip_addr)
+
+        if self.pkt_action == self.ACTION_FWD:
+            return verify_packet_any_port(self, masked_exp_pkt, dst_port_list)
+        elif self.pkt_action == self.ACTION_DROP:
+            return verify_no_packet_any(self, masked_exp_pkt, dst_port_list)
+
+    def create_ipv4_packets(self, dst_ip_addr, tag=None):
+        '''
+        @summary: Build IPv4 packet to send to the switch and the packet expected to come back.
+        @param dest_ip_addr: destination IP to build packet with.
+        @param tag: if not None, the end of the payload of both packets is replaced with the tag
+        @return (pkt, masked_exp_pkt)
+        '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
         ip_src = "10.0.0.1"
@@ -241,16 +395,13 @@ class FibTest(BaseTest):
                             ip_options=self.ip_options,
                             dl_vlan_enable=self.dst_vid is not None,
                             vlan_vid=self.dst_vid or 0)
+        if tag is not None:
+            self.tag_packet(pkt, tag)
+            self.tag_packet(exp_pkt, tag)
         masked_exp_pkt = Mask(exp_pkt)
         masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "dst")
 
-        send_packet(self, src_port, pkt)
-        logging.info("Sending packet from port " + str(src_port) + " to " + ip_dst)
-
-        if self.pkt_action == self.ACTION_FWD:
-            return verify_packet_any_port(self, masked_exp_pkt, dst_port_list)
-        elif self.pkt_action == self.ACTION_DROP:
-            return verify_no_packet_any(self, masked_exp_pkt, dst_port_list)
+        return pkt, masked_exp_pkt
     #---------------------------------------------------------------------
 
     def check_ipv6_route(self, src_port, dst_ip_addr, dst_port_list):
@@ -261,6 +412,23 @@ class FibTest(BaseTest):
         @param dst_port_list: list of ports on which to expect packet to come back from the switch
         @return Boolean
         '''
+        pkt, masked_exp_pkt = self.create_ipv6_packets(dst_ip_addr)
+
+        send_packet(self, src_port, pkt)
+        logging.info("Sending packet from port " + str(src_port) + " to " + dst_ip_addr)
+
+        if self.pkt_action == self.ACTION_FWD:
+            return verify_packet_any_port(self, masked_exp_pkt, dst_port_list)
+        elif self.pkt_action == self.ACTION_DROP:
+            return verify_no_packet_any(self, masked_exp_pkt, dst_port_list)
+
+    def create_ipv6_packets(self, dst_ip_addr, tag=None):
+        '''
+        @summary: Build IPv6 packet to send to the switch and the packet expected to come back.
+        @param dest_ip_addr: destination IP to build packet with.
+        @param tag: if not None, the end of the payload of both packets is replaced with the tag
+        @return (pkt, masked_exp_pkt)
+        '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
         ip_src = '2000::1'
@@ -288,16 +456,13 @@ class FibTest(BaseTest):
                                 ipv6_hlim=max(self.ttl-1, 0),
                                 dl_vlan_enable=self.dst_vid is not None,
                                 vlan_vid=self.dst_vid or 0)
+        if tag is not None:
+            self.tag_packet(pkt, tag)
+            self.tag_packet(exp_pkt, tag)
         masked_exp_pkt = Mask(exp_pkt)
         masked_exp_pkt.set_do_not_care_scapy(scapy.Ether,"dst")
 
-        send_packet(self, src_port, pkt)
-        logging.info("Sending packet from port " + str(src_port) + " to " + ip_dst)
-
-        if self.pkt_action == self.ACTION_FWD:
-            return verify_packet_any_port(self, masked_exp_pkt, dst_port_list)
-        elif self.pkt_action == self.ACTION_DROP:
-            return verify_no_packet_any(self, masked_exp_pkt, dst_port_list)
+        return pkt, masked_exp_pkt
     #---------------------------------------------------------------------
     def check_within_expected_range(self, actual, expected):
         '''
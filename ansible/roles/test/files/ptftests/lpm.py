@@ -1,6 +1,9 @@
 import random
+import socket
+import struct
 
-from ipaddress import ip_address, ip_network
+from array import array
+from ipaddress import IPv4Address, IPv6Address, ip_address
 from SubnetTree import SubnetTree
 
 '''
@@ -12,94 +15,124 @@ have IP segmentation functionality: segment the whole IP space into different
 segments from start to end according to the prefixes (networks) it reads.
 
 Initially, the whole IP space contains only one range. After inserting
-prefixes, the IP space is segmented into multiple ranges. The ranges()
-function returns all ranges in the LpmDict with a list of IpIntervals. The
-sub-class IpInterval then could be used to get the first/last/random IP within
-this range. It could also check the length of the range and if an IP is within
-this range.
+prefixes, the IP space is segmented into multiple ranges. The sub-class
+IpInterval could be used to get the first/last/random IP within a range. It
+could also check the length of the range and if an IP is within this range.
 
 To achieve the LPM functionality, use the LpmDict as a dictionary and use
 [] operator to get the corresponding value using the key (IP).
 
+Boundaries are kept as integers and sorted into a flat buffer (an array of
+unsigned longs for IPv4) only when the prefixes change. The ranges() function
+yields the IpIntervals one by one, the IP addresses of an IpInterval are
+converted to strings only when they are requested.
+
 Please check the test_lpm.py file to see the details of how this class works.
 '''
 class LpmDict():
     class IpInterval:
-        def __init__(self, s):
-            self._start = s
-            self._end = s
-
-        def __init__(self, s, e):
+        def __init__(self, s, e, ipv4=None):
             assert s <= e
-            self._start = s
-            self._end = e
+            if ipv4 is None:
+                ipv4 = s.version == 4
+            self._ipv4 = ipv4
+            self._start = int(s)
+            self._end = int(e)
+
+        def _to_str(self, ip):
+            return str(IPv4Address(ip)) if self._ipv4 else str(IPv6Address(ip))
 
         # __len__ has hard limit on returning long int
         def length(self):
-            return int(self._end) - int(self._start)
+            return self._end - self._start
 
         def contains(self, ip):
-            return ip >= self._start and ip <= self._end
+            if isinstance(ip, basestring):
+                ip = ip_address(unicode(ip))
+            return int(ip) >= self._start and int(ip) <= self._end
 
         def get_first_ip(self):
-            return str(self._start)
+            return self._to_str(self._start)
 
         def get_last_ip(self):
-            return str(self._end)
+            return self._to_str(self._end)
 
         def get_random_ip(self):
             diff = self.length()
-            return str(self._start + random.randint(0, diff))
+            return self._to_str(self._start + random.randint(0, diff))
 
         def __str__(self):
-            return str(self._start) + ' - ' + str(self._end)
+            return self.get_first_ip() + ' - ' + self.get_last_ip()
 
     def __init__(self, ipv4=True):
         self._ipv4 = ipv4
         self._prefix_set = set()
         self._subnet_tree = SubnetTree()
+        self._max_ip = (1 << 32) - 1 if ipv4 else (1 << 128) - 1
         # 0.0.0.0 is a non-routable meta-address that needs to be skipped
-        self._boundaries = { ip_address(u'0.0.0.0') : 1} if ipv4 else { ip_address(u'::') : 1}
+        self._boundaries = { 0 : 1 }
+        self._sorted_boundaries = None
+
+    def _parse_prefix(self, key):
+        """
+        Convert prefix string to tuple of integers (first IP, last IP, prefix length)
+        """
+        addr, _, prefixlen = key.partition('/')
+        try:
+            if self._ipv4:
+                ip, = struct.unpack('!I', socket.inet_pton(socket.AF_INET, addr))
+                prefixlen = int(prefixlen) if prefixlen else 32
+                hostmask = (1 << (32 - prefixlen)) - 1
+            else:
+                high, low = struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, addr))
+                ip = (high << 64) | low
+                prefixlen = int(prefixlen) if prefixlen else 128
+                hostmask = (1 << (128 - prefixlen)) - 1
+        except (socket.error, struct.error, ValueError):
+            raise ValueError('%s does not appear to be an IPv%d network' % (key, 4 if self._ipv4 else 6))
+        if hostmask < 0 or ip & hostmask:
+            raise ValueError('%s has host bits set' % key)
+        return ip, ip | hostmask, prefixlen
+
+    def _add_boundary(self, boundary, count):
+        count += self._boundaries.get(boundary, 0)
+        if count:
+            self._boundaries[boundary] = count
+        else:
+            del self._boundaries[boundary]
+        self._sorted_boundaries = None
 
     def __setitem__(self, key, value):
-        prefix = ip_network(unicode(key))
-        # add the current key to self._prefix_set only when it is not the default route and it is not a duplicate key
-        if prefix.prefixlen and key not in self._prefix_set:
-            boundary = prefix[0]
-            self._boundaries[boundary] = self._boundaries.get(boundary, 0) + 1
-            if prefix[-1] != ip_address(u'255.255.255.255') and prefix[-1] != ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'):
-                next_boundary = prefix[-1] + 1
-                self._boundaries[next_boundary] = self._boundaries.get(next_boundary, 0) + 1
-            self._prefix_set.add(key)
+        first, last, prefixlen = self._parse_prefix(key)
+        # add the current prefix to self._prefix_set only when it is not the default route and it is not a duplicate
+        if prefixlen and (first, prefixlen) not in self._prefix_set:
+            self._add_boundary(first, 1)
+            if last != self._max_ip:
+                self._add_boundary(last + 1, 1)
+            self._prefix_set.add((first, prefixlen))
         self._subnet_tree.__setitem__(key, value)
 
     def __getitem__(self, key):
         return self._subnet_tree[key]
 
     def __delitem__(self, key):
-        if '/0' not in key:
-            prefix = ip_network(unicode(key))
-            boundary = prefix[0]
-            next_boundary = prefix[-1] + 1
-            self._boundaries[boundary] = self._boundaries.get(boundary) - 1
-            if not self._boundaries[boundary]:
-                del self._boundaries[boundary]
-            self._boundaries[next_boundary] = self._boundaries.get(next_boundary) - 1
-            if not self._boundaries[next_boundary]:
-                del self._boundaries[next_boundary]
-            self._prefix_set.remove(key)
+        first, last, prefixlen = self._parse_prefix(key)
+        if prefixlen:
+            self._add_boundary(first, -1)
+            if last != self._max_ip:
+                self._add_boundary(last + 1, -1)
+            self._prefix_set.remove((first, prefixlen))
         self._subnet_tree.__delitem__(key)
 
     def ranges(self):
-        sorted_boundaries = sorted(self._boundaries.keys())
-        ranges = []
-        for index, boundary in enumerate(sorted_boundaries):
-            if index != len(sorted_boundaries) - 1:
-                interval = self.IpInterval(sorted_boundaries[index], sorted_boundaries[index + 1] - 1)
+        if self._sorted_boundaries is None:
+            # IPv6 addresses don't fit to the array item, they are kept in a list
+            self._sorted_boundaries = sorted(self._boundaries)
+            if self._ipv4:
+                self._sorted_boundaries = array('L', self._sorted_boundaries)
+        boundaries = self._sorted_boundaries
+        for index in xrange(len(boundaries)):
+            if index != len(boundaries) - 1:
+                yield self.IpInterval(boundaries[index], boundaries[index + 1] - 1, self._ipv4)
             else:
-                if self._ipv4:
-                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'255.255.255.255'))
-                else:
-                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'))
-            ranges.append(interval)
-        return ranges
+                yield self.IpInterval(boundaries[index], self._max_ip, self._ipv4)
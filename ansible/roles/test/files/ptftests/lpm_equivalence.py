@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+'''
+Equivalence check of LpmDict (lpm.py) against the reference implementation it replaced, which parsed every
+prefix into an ip_network object and sorted ipaddress objects into a list of IpIntervals.
+
+A prefix file with random IPv4 and IPv6 prefixes is generated (or an existing one is used, one prefix per line
+with optional next hops after it), the prefixes are inserted to both implementations and compared are:
+    - ranges(): range strings, lengths, first and last IPs
+    - random IPs of the ranges with the same random seed
+    - LPM lookups of random IPs
+    - ranges() after sequences of prefix deletions and insertions
+
+Usage: python lpm_equivalence.py [--v4 50000] [--v6 50000] [--seed 1] [--prefix-file FILE]
+Exits with 1 if the implementations don't match.
+'''
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network
+from SubnetTree import SubnetTree
+
+from lpm import LpmDict
+
+
+class ReferenceLpmDict():
+    '''
+    LpmDict as it was before the boundaries were kept as integers
+    '''
+    class IpInterval:
+        def __init__(self, s, e):
+            assert s <= e
+            self._start = s
+            self._end = e
+
+        def length(self):
+            return int(self._end) - int(self._start)
+
+        def contains(self, ip):
+            return ip >= self._start and ip <= self._end
+
+        def get_first_ip(self):
+            return str(self._start)
+
+        def get_last_ip(self):
+            return str(self._end)
+
+        def get_random_ip(self):
+            diff = self.length()
+            return str(self._start + random.randint(0, diff))
+
+        def __str__(self):
+            return str(self._start) + ' - ' + str(self._end)
+
+    def __init__(self, ipv4=True):
+        self._ipv4 = ipv4
+        self._prefix_set = set()
+        self._subnet_tree = SubnetTree()
+        self._boundaries = { ip_address(u'0.0.0.0') : 1} if ipv4 else { ip_address(u'::') : 1}
+
+    def __setitem__(self, key, value):
+        prefix = ip_network(unicode(key))
+        if prefix.prefixlen and key not in self._prefix_set:
+            boundary = prefix[0]
+            self._boundaries[boundary] = self._boundaries.get(boundary, 0) + 1
+            if prefix[-1] != ip_address(u'255.255.255.255') and prefix[-1] != ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'):
+                next_boundary = prefix[-1] + 1
+                self._boundaries[next_boundary] = self._boundaries.get(next_boundary, 0) + 1
+            self._prefix_set.add(key)
+        self._subnet_tree.__setitem__(key, value)
+
+    def __getitem__(self, key):
+        return self._subnet_tree[key]
+
+    def __delitem__(self, key):
+        if '/0' not in key:
+            prefix = ip_network(unicode(key))
+            boundary = prefix[0]
+            next_boundary = prefix[-1] + 1
+            self._boundaries[boundary] = self._boundaries.get(boundary) - 1
+            if not self._boundaries[boundary]:
+                del self._boundaries[boundary]
+            self._boundaries[next_boundary] = self._boundaries.get(next_boundary) - 1
+            if not self._boundaries[next_boundary]:
+                del self._boundaries[next_boundary]
+            self._prefix_set.remove(key)
+        self._subnet_tree.__delitem__(key)
+
+    def ranges(self):
+        sorted_boundaries = sorted(self._boundaries.keys())
+        ranges = []
+        for index, boundary in enumerate(sorted_boundaries):
+            if index != len(sorted_boundaries) - 1:
+                interval = self.IpInterval(sorted_boundaries[index], sorted_boundaries[index + 1] - 1)
+            else:
+                if self._ipv4:
+                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'255.255.255.255'))
+                else:
+                    interval = self.IpInterval(sorted_boundaries[index], ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'))
+            ranges.append(interval)
+        return ranges
+
+
+def random_prefix(ipv4):
+    bits = 32 if ipv4 else 128
+    prefixlen = random.randint(8, 32) if ipv4 else random.choice([32, 48, 56, 64, 64, 64, 96, 128])
+    ip = random.getrandbits(bits) >> (bits - prefixlen) << (bits - prefixlen)
+    return '%s/%d' % (IPv4Address(ip) if ipv4 else IPv6Address(ip), prefixlen)
+
+
+def generate_prefix_file(v4, v6):
+    f = tempfile.NamedTemporaryFile(prefix='lpm_prefixes_', suffix='.txt', delete=False)
+    f.write('0.0.0.0/0 10.0.0.1\n::/0 fc00::1\n')
+    # Prefixes at both ends of the address space
+    f.write('0.0.0.0/8 10.0.0.1\n255.255.255.0/24 10.0.0.1\n::/16 fc00::1\nffff::/16 fc00::1\n')
+    for count, ipv4, nexthop in ((v4, True, '10.0.0.1'), (v6, False, 'fc00::1')):
+        for _ in xrange(count):
+            f.write('%s %s\n' % (random_prefix(ipv4), nexthop))
+    f.close()
+    return f.name
+
+
+def read_prefixes(filename):
+    prefixes = {4: [], 6: []}
+    seen = set()
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0] in seen:
+                continue
+            seen.add(fields[0])
+            prefixes[6 if ':' in fields[0] else 4].append(fields[0])
+    return prefixes
+
+
+def range_items(lpm):
+    return [(str(r), r.length(), r.get_first_ip(), r.get_last_ip()) for r in lpm.ranges()]
+
+
+def random_ips(lpm, seed):
+    random.seed(seed)
+    return [r.get_random_ip() for r in lpm.ranges()]
+
+
+class Checker(object):
+    def __init__(self):
+        self.failed = False
+
+    def check(self, what, reference, new):
+        if reference == new:
+            print '    %-40s OK' % what
+            return
+        self.failed = True
+        mismatch = next((i for i, (a, b) in enumerate(zip(reference, new)) if a != b), min(len(reference), len(new)))
+        print '    %-40s MISMATCH at %d of %d/%d: %s != %s' % (what, mismatch, len(reference), len(new),
+                                                          reference[mismatch:mismatch + 1], new[mismatch:mismatch + 1])
+
+
+def check_family(checker, ipv4, prefixes, seed):
+    print 'IPv%d: %d prefixes' % (4 if ipv4 else 6, len(prefixes))
+    timings = []
+    dicts = []
+    for cls in (ReferenceLpmDict, LpmDict):
+        start = time.time()
+        lpm = cls(ipv4)
+        for prefix in prefixes:
+            lpm[prefix] = prefix
+        setup = time.time() - start
+        start = time.time()
+        for _ in lpm.ranges():
+            pass
+        iteration = time.time() - start
+        start = time.time()
+        ranges = range_items(lpm)
+        timings.append((setup, iteration, time.time() - start))
+        dicts.append((lpm, ranges))
+    (reference, reference_ranges), (new, new_ranges) = dicts
+
+    checker.check('ranges', reference_ranges, new_ranges)
+    checker.check('random IPs', random_ips(reference, seed), random_ips(new, seed))
+    random.seed(seed)
+    ips = [r.get_random_ip() for r in random.sample(reference.ranges(), min(10000, len(reference_ranges)))]
+    checker.check('LPM lookups', [reference[ip] for ip in ips], [new[ip] for ip in ips])
+
+    # The reference fails to delete a prefix ending at the last address
+    max_ip = ip_address(u'255.255.255.255' if ipv4 else u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')
+    deletable = [p for p in prefixes if ip_network(unicode(p)).prefixlen and ip_network(unicode(p))[-1] != max_ip]
+    random.seed(seed)
+    for step in range(3):
+        deleted = random.sample(deletable, len(deletable) / 4)
+        for lpm in (reference, new):
+            for prefix in deleted:
+                del lpm[prefix]
+        checker.check('ranges after deleting %d prefixes' % len(deleted), range_items(reference), range_items(new))
+        inserted = random.sample(deleted, len(deleted) / 2)
+        for lpm in (reference, new):
+            for prefix in inserted:
+                lpm[prefix] = prefix
+        checker.check('ranges after inserting %d prefixes' % len(inserted), range_items(reference), range_items(new))
+        deletable = list(set(deletable) - set(deleted) | set(inserted))
+
+    for what, reference_time, new_time in zip(('setup', 'ranges() iteration', 'ranges() with strings and lengths'),
+                                              timings[0], timings[1]):
+        print '    %-40s %.2f s -> %.2f s' % (what, reference_time, new_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Equivalence check of LpmDict against the reference implementation')
+    parser.add_argument('--v4', type=int, default=50000, help='number of generated IPv4 prefixes')
+    parser.add_argument('--v6', type=int, default=50000, help='number of generated IPv6 prefixes')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--prefix-file', help='use the prefixes of this file instead of generated ones')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    filename = args.prefix_file or generate_prefix_file(args.v4, args.v6)
+    print 'Prefix file: %s' % filename
+    prefixes = read_prefixes(filename)
+
+    checker = Checker()
+    check_family(checker, True, prefixes[4], args.seed)
+    check_family(checker, False, prefixes[6], args.seed)
+
+    print 'FAILED' if checker.failed else 'PASSED'
+    sys.exit(1 if checker.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
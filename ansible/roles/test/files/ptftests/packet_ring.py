@@ -0,0 +1,186 @@
+"""
+High rate packet capture and send engine for the data plane disruption measurement.
+
+RingCapture receives packets through an AF_PACKET socket with a TPACKET_V3 (PACKET_MMAP)
+ring buffer and streams them to a pcap file, so the captured packets are never held in memory.
+FlowSender sends packets built from a few prebuilt templates, rewriting the sequence number
+of the template in place for every packet.
+"""
+
+import mmap
+import select
+import socket
+import struct
+import time
+
+import scapy.all as scapyall
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+ETH_P_ALL = 0x0003
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TP_STATUS_VLAN_VALID = 0x10
+TP_STATUS_VLAN_TPID_VALID = 0x40
+
+# struct tpacket_block_desc: version, offset_to_priv, then struct tpacket_hdr_v1
+BLOCK_STATUS_OFFSET = 8
+BLOCK_HEADER = struct.Struct('=III')            # block_status, num_pkts, offset_to_first_pkt
+# struct tpacket3_hdr up to and including struct tpacket_hdr_variant1
+PACKET_HEADER = struct.Struct('=IIIIIIHHIIH')   # tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status,
+                                                # tp_mac, tp_net, tp_rxhash, tp_vlan_tci, tp_vlan_tpid
+PCAP_HEADER = struct.pack('=IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)    # DLT_EN10MB
+PCAP_RECORD = struct.Struct('=IIII')            # ts_sec, ts_usec, incl_len, orig_len
+
+
+class RingCapture(object):
+    """
+    Captures packets of all interfaces (or of the given one) through a TPACKET_V3 ring buffer.
+    The kernel fills whole blocks of the ring, and a block is handed back to the kernel
+    as soon as its packets are written to the pcap file.
+    """
+    def __init__(self, iface=None, block_size=1 << 22, block_nr=64, frame_size=1 << 11, block_timeout_ms=10):
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self.socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # struct tpacket_req3
+        self.socket.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                               struct.pack('=IIIIIII', block_size, block_nr, frame_size,
+                                           block_size * block_nr / frame_size, block_timeout_ms, 0, 0))
+        self.ring = mmap.mmap(self.socket.fileno(), block_size * block_nr,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        if iface:
+            self.socket.bind((iface, ETH_P_ALL))
+        self.block = 0
+
+    def set_filter(self, filter_expression):
+        scapyall.attach_filter(self.socket, filter_expression)
+
+    def close(self):
+        self.ring.close()
+        self.socket.close()
+
+    def get_stats(self):
+        """
+        Returns (packets, drops) counted by the kernel since the previous call.
+        """
+        packets, drops, _ = struct.unpack('=III', self.socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+        return packets, drops
+
+    def read_block(self):
+        """
+        Returns pcap records of the packets of the current block, or None if the kernel still owns the block.
+        """
+        start = self.block * self.block_size
+        status, num_pkts, offset = BLOCK_HEADER.unpack_from(self.ring, start + BLOCK_STATUS_OFFSET)
+        if not status & TP_STATUS_USER:
+            return None
+        ring = self.ring
+        records = []
+        offset += start
+        for _ in xrange(num_pkts):
+            next_offset, sec, nsec, snaplen, length, status, mac, _, _, vlan_tci, vlan_tpid = \
+                PACKET_HEADER.unpack_from(ring, offset)
+            frame = ring[offset + mac:offset + mac + snaplen]
+            if status & TP_STATUS_VLAN_VALID:
+                # The kernel strips the VLAN tag off the received frame, put it back.
+                tpid = vlan_tpid if status & TP_STATUS_VLAN_TPID_VALID else 0x8100
+                frame = frame[:12] + struct.pack('!HH', tpid, vlan_tci) + frame[12:]
+                snaplen += 4
+                length += 4
+            records.append(PCAP_RECORD.pack(sec, nsec / 1000, snaplen, length))
+            records.append(frame)
+            offset += next_offset
+        # Hand the block back to the kernel.
+        struct.pack_into('=I', ring, start + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % self.block_nr
+        return records
+
+    def capture(self, filename, timeout):
+        """
+        Streams the captured packets to the pcap file for timeout seconds.
+        Returns (captured, dropped) packets count.
+        """
+        poller = select.poll()
+        poller.register(self.socket.fileno(), select.POLLIN | select.POLLERR)
+        self.get_stats()    # Reset the kernel counters.
+        captured, dropped = 0, 0
+        deadline = time.time() + timeout
+        with open(filename, 'wb') as fp:
+            fp.write(PCAP_HEADER)
+            while True:
+                records = self.read_block()
+                if records is not None:
+                    captured += len(records) / 2
+                    fp.write(''.join(records))
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                poller.poll(min(remaining, 0.1) * 1000)
+            packets, dropped = self.get_stats()
+        return captured, dropped
+
+
+class PacketTemplate(object):
+    """
+    Frame with a fixed width decimal sequence number, as the TCP payload generated by
+    advanced-reboot has, which is rewritten in place for every packet sent.
+    """
+    def __init__(self, frame, seq_offset, seq_width):
+        self.frame = bytearray(frame)
+        self.seq_offset = seq_offset
+        self.seq_width = seq_width
+        self.seq_format = '%0{}d'.format(seq_width)
+
+    def set_seq(self, seq):
+        self.frame[self.seq_offset:self.seq_offset + self.seq_width] = self.seq_format % seq
+        return self.frame
+
+
+class FlowSender(object):
+    """
+    Sends the flow of packets built from templates on the PTF interfaces at a fixed rate.
+    Packet N of the flow is templates[schedule[N]] with sequence number N. Packets are paced
+    against the start time, so a late packet doesn't delay the following ones.
+    """
+    def __init__(self, port_map, templates, schedule):
+        """
+        @param port_map: dict of PTF port index to interface name
+        @param templates: list of (PTF port index, PacketTemplate)
+        @param schedule: sequence of templates indices, one per packet to send
+        """
+        sockets = {}
+        for port, _ in templates:
+            if port not in sockets:
+                sockets[port] = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                sockets[port].bind((port_map[port], 0))
+        self.sockets = sockets.values()
+        self.templates = [(sockets[port], template) for port, template in templates]
+        self.schedule = schedule
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def send(self, interval):
+        """
+        Returns the time in seconds the sender was behind the schedule at most.
+        """
+        templates = self.templates
+        start = time.time()
+        max_lag = 0
+        for seq, index in enumerate(self.schedule):
+            sock, template = templates[index]
+            delay = start + seq * interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > max_lag:
+                max_lag = -delay
+            sock.send(template.set_seq(seq))
+        return max_lag
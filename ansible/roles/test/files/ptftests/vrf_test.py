@@ -85,6 +85,10 @@ class FwdTest(FibTest):
         else:
             entries = self.fwd_dict.ipv6
 
+        if self.pipeline_window:
+            self.check_ip_ranges_pipelined(entries.iteritems(), ipv4)
+            return
+
         for ip_range, next_hop in entries.iteritems():
             self.check_ip_range(ip_range, next_hop, ipv4)
 
@@ -16,10 +16,14 @@ Usage:          Examples of how to use log analyzer
 #---------------------------------------------------------------------
 # Global imports
 #---------------------------------------------------------------------
+import os
 import sys
 import getopt
 import re
+import sre_parse
+import sre_constants
 import csv
+import json
 import pprint
 import logging
 import logging.handlers
@@ -31,6 +35,8 @@ from __builtin__ import True
 tokenizer = ','
 comment_key = '#'
 system_log_file = '/var/log/syslog'
+#-- Size of the block read from the end of the log file when scanning it backwards
+read_block_size = 64 * 1024
 
 #-- List of ERROR codes to be returned by AnsibleLogAnalyzer
 err_duplicate_start_marker = -1
@@ -40,6 +46,174 @@ err_no_start_marker = -4
 err_invalid_string_format = -5
 err_invalid_input = -6
 
+def get_longest_literal(items):
+    '''
+    @summary: Find the longest run of literal characters in a sequence of
+              parsed regular expression items.
+
+    @param items: List of (opcode, value) items produced by sre_parse.
+
+    @return: The longest literal string, empty if there is no literal.
+    '''
+    longest = ''
+    current = ''
+    for opcode, value in items:
+        if opcode == sre_constants.LITERAL and value < 256:
+            current += chr(value)
+            continue
+        if len(current) > len(longest):
+            longest = current
+        current = ''
+
+    return current if len(current) > len(longest) else longest
+#---------------------------------------------------------------------
+
+def get_required_literals(messages_regex):
+    '''
+    @summary: Build a list of literal strings, one of which is present in
+              every string matching the regular expression.
+              Used to reject lines without running the regex engine on them.
+
+    @param messages_regex: Regular expression string.
+
+    @return: List of literal strings, or None if the list can't be built
+             (regex without literals, case insensitive regex, etc.).
+    '''
+    try:
+        parsed = sre_parse.parse(messages_regex)
+    except sre_constants.error:
+        return None
+
+    if parsed.pattern.flags & re.IGNORECASE:
+        return None
+
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] == sre_constants.BRANCH:
+        branches = [list(branch) for branch in items[0][1][1]]
+    else:
+        branches = [items]
+
+    literals = []
+    for branch in branches:
+        literal = get_longest_literal(branch)
+        if not literal:
+            return None
+        literals.append(literal)
+
+    return literals
+#---------------------------------------------------------------------
+
+class MessageRegexSet:
+    '''
+    @summary: Set of regular expressions, which are matched against a string at once.
+
+    Lines are prefiltered by the literals required by the regular expressions,
+    so most of the lines are rejected with plain substring search.
+    '''
+
+    def __init__(self, messages_regex):
+        self.messages_regex = list(messages_regex or [])
+        self.regex = None
+        self.literals = None
+
+        if not self.messages_regex:
+            return
+
+        self.regex = re.compile('|'.join(self.messages_regex))
+
+        literals = []
+        for regex in self.messages_regex:
+            required_literals = get_required_literals(regex)
+            if required_literals is None:
+                literals = None
+                break
+            literals.extend(required_literals)
+
+        #-- Inline flags are global for the combined regex, prefiltering is not valid then
+        if literals is not None and not (self.regex.flags & re.IGNORECASE):
+            self.literals = list(set(literals))
+    #---------------------------------------------------------------------
+
+    def search(self, str):
+        '''
+        @summary: Check whether given string matches any of the regular expressions.
+
+        @return: True if str matches, otherwise False.
+        '''
+        if self.regex is None:
+            return False
+
+        if self.literals is not None:
+            for literal in self.literals:
+                if literal in str:
+                    break
+            else:
+                return False
+
+        return self.regex.search(str) is not None
+    #---------------------------------------------------------------------
+
+class LogMessageMatcher:
+    '''
+    @summary: Classify log lines against 'match', 'ignore' and 'expect' sets
+              of regular expressions in one pass.
+
+    A line which matches the 'expect' set is expected. Otherwise a line which
+    matches the 'match' set is a match, unless it also matches the 'ignore' set.
+    The matcher keeps track of the 'expect' regular expressions which were hit,
+    so the ones not found in the logs are known once analysis is done.
+    '''
+
+    MATCH = 'match'
+    IGNORE = 'ignore'
+    EXPECT = 'expect'
+
+    def __init__(self, messages_regex_m, messages_regex_i, messages_regex_e):
+        self.match_set = MessageRegexSet(messages_regex_m)
+        self.ignore_set = MessageRegexSet(messages_regex_i)
+        self.expect_set = MessageRegexSet(messages_regex_e)
+        self.expect_regex_list = [(regex, MessageRegexSet([regex])) for regex in messages_regex_e or []]
+        self.used_expect_regex = set()
+    #---------------------------------------------------------------------
+
+    def classify(self, str):
+        '''
+        @summary: Classify given string.
+
+        @param str: string to match against 'match', 'ignore' and 'expect' regex expressions.
+
+        @return: Tuple (line type, expect regex). Line type is one of MATCH, IGNORE,
+                 EXPECT or None if the string is not matched by any set. Expect regex
+                 is the first 'expect' regular expression matching expected string.
+        '''
+        if self.expect_set.search(str):
+            hit_regex = None
+            for index, (regex, regex_set) in enumerate(self.expect_regex_list):
+                #-- Once the hit is known, check only the regexes not used yet
+                if hit_regex is not None and index in self.used_expect_regex:
+                    continue
+                if regex_set.search(str):
+                    if hit_regex is None:
+                        hit_regex = regex
+                    self.used_expect_regex.add(index)
+            return self.EXPECT, hit_regex
+
+        if self.match_set.search(str):
+            if self.ignore_set.search(str):
+                return self.IGNORE, None
+            return self.MATCH, None
+
+        return None, None
+    #---------------------------------------------------------------------
+
+    def get_unused_expect_regex(self):
+        '''
+        @summary: Get 'expect' regular expressions, which didn't match any classified string.
+        '''
+        return [regex for index, (regex, _) in enumerate(self.expect_regex_list)
+                if index not in self.used_expect_regex]
+    #---------------------------------------------------------------------
+
 class AnsibleLogAnalyzer:
     '''
     @summary: Overview of functionality
@@ -109,6 +283,22 @@ class AnsibleLogAnalyzer:
         return self.end_marker_prefix + "-" + self.run_id
     #---------------------------------------------------------------------
 
+    def get_log_position(self, log_file):
+        '''
+        @summary: Get current position of the log file, i.e. the position
+                  where next message will be written to.
+        @param log_file : File path.
+        @return: Dict with the log file inode and offset, or None if file doesn't exist.
+        '''
+        try:
+            stat = os.stat(log_file)
+        except OSError:
+            self.print_diagnostic_message('Log file {} not found. Skip getting position.'.format(log_file))
+            return None
+
+        return {'inode': stat.st_ino, 'offset': stat.st_size}
+    #---------------------------------------------------------------------
+
     def place_marker_to_file(self, log_file, marker):
         '''
         @summary: Place marker into each log file specified.
@@ -243,67 +433,52 @@ class AnsibleLogAnalyzer:
         return regex, messages_regex
     #---------------------------------------------------------------------
 
-    def line_matches(self, str, match_messages_regex, ignore_messages_regex):
+    def reverse_readlines(self, log_file, block_size=read_block_size):
         '''
-        @summary: This method checks whether given string matches against the
-                  set of regular expressions.
-
-        @param str: string to match against 'match' and 'ignore' regex expressions.
-            A string which matched to the 'match' set will be reported.
-            A string which matches to 'match' set, but also matches to
-            'ignore' set - will not be reported (will be ignored)
+        @summary: Generator which yields lines of the file starting from the last one.
+                  The file is read backwards in blocks of fixed size, so memory usage
+                  does not depend on the size of the log file.
 
-        @param match_messages_regex:
-            regex class instance containing messages to match against.
+        @param log_file: File object opened in binary mode, must support seek().
 
-        @param ignore_messages_regex:
-            regex class instance containing messages to ignore match against.
+        @param block_size: Size of the block read from the file at once.
 
-        @return: True is str matches regex criteria, otherwise False.
+        @return: Lines of the file in reverse order, with line endings preserved.
         '''
-
-        ret_code = False
-
-        if ((match_messages_regex is not None) and (match_messages_regex.findall(str))):
-            if (ignore_messages_regex is None):
-                ret_code = True
-
-            elif (not ignore_messages_regex.findall(str)):
-                self.print_diagnostic_message('matching line: %s' % str)
-                ret_code = True
-
-        return ret_code
+        log_file.seek(0, os.SEEK_END)
+        position = log_file.tell()
+        pending = ''
+
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            log_file.seek(position)
+            chunk = log_file.read(read_size) + pending
+
+            #-- Skip the line ending of the last line in the chunk while looking for line start
+            end = len(chunk)
+            index = chunk.rfind('\n', 0, end - 1)
+            while index != -1:
+                yield chunk[index + 1:end]
+                end = index + 1
+                index = chunk.rfind('\n', 0, end - 1)
+
+            #-- First line in the chunk might be incomplete, keep it for the next block
+            pending = chunk[:end]
+
+        if pending:
+            yield pending
     #---------------------------------------------------------------------
 
-    def line_is_expected(self, str, expect_messages_regex):
-        '''
-        @summary: This method checks whether given string matches against the
-                  set of "expected" regular expressions.
-        '''
-
-        ret_code = False
-        if (expect_messages_regex is not None) and (expect_messages_regex.findall(str)):
-            ret_code = True
-
-        return ret_code
-
-    def analyze_file(self, log_file_path, match_messages_regex, ignore_messages_regex, expect_messages_regex):
+    def analyze_file(self, log_file_path, matcher):
         '''
         @summary: Analyze input file content for messages matching input regex
-                  expressions. See line_matches() for details on matching criteria.
+                  expressions. See LogMessageMatcher for details on matching criteria.
 
         @param log_file_path: Patch to the log file.
 
-        @param match_messages_regex:
-            regex class instance containing messages to match against.
-
-        @param ignore_messages_regex:
-            regex class instance containing messages to ignore match against.
-
-        @param expect_messages_regex:
-            regex class instance containing messages that are expected to appear in logfile.
-
-        @param end_marker_regex - end marker
+        @param matcher:
+            LogMessageMatcher instance containing messages to match, ignore and expect.
 
         @return: List of strings match search criteria.
         '''
@@ -320,14 +495,18 @@ class AnsibleLogAnalyzer:
         found_start_marker = False
         found_end_marker = False
         if stdin_as_input:
+            #-- stdin can't be read backwards, all input is in analysis range,
+            #-- so read it forward and reverse the results at the end
             log_file = sys.stdin
+            log_lines = log_file
         else:
-            log_file = open(log_file_path, 'r')
+            log_file = open(log_file_path, 'rb')
+            log_lines = self.reverse_readlines(log_file)
 
         start_marker = self.create_start_marker()
         end_marker = self.create_end_marker()
 
-        for rev_line in reversed(log_file.readlines()):
+        for rev_line in log_lines:
             if stdin_as_input:
                 in_analysis_range = True
             else:
@@ -355,12 +534,21 @@ class AnsibleLogAnalyzer:
                     break
 
             if in_analysis_range :
-                if self.line_is_expected(rev_line, expect_messages_regex):
+                line_type, _ = matcher.classify(rev_line)
+                if line_type == LogMessageMatcher.EXPECT:
                     expected_lines.append(rev_line)
 
-                elif self.line_matches(rev_line, match_messages_regex, ignore_messages_regex):
+                elif line_type == LogMessageMatcher.MATCH:
+                    self.print_diagnostic_message('matching line: %s' % rev_line)
                     matching_lines.append(rev_line)
 
+        if stdin_as_input:
+            #-- keep the same (reversed) order of lines as for regular files
+            matching_lines.reverse()
+            expected_lines.reverse()
+        else:
+            log_file.close()
+
         # care about the markers only if input is not stdin
         if not stdin_as_input:
             if (not found_start_marker):
@@ -374,21 +562,15 @@ class AnsibleLogAnalyzer:
         return matching_lines, expected_lines
     #---------------------------------------------------------------------
 
-    def analyze_file_list(self, log_file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex):
+    def analyze_file_list(self, log_file_list, matcher):
         '''
         @summary: Analyze input files messages matching input regex expressions.
-            See line_matches() for details on matching criteria.
+            See LogMessageMatcher for details on matching criteria.
 
         @param log_file_list: List of paths to the log files.
 
-        @param match_messages_regex:
-            regex class instance containing messages to match against.
-
-        @param ignore_messages_regex:
-            regex class instance containing messages to ignore match against.
-
-        @param expect_messages_regex:
-            regex class instance containing messages that are expected to appear in logfile.
+        @param matcher:
+            LogMessageMatcher instance containing messages to match, ignore and expect.
 
         @return: Returns map <file_name, list_of_matching_strings>
         '''
@@ -397,7 +579,7 @@ class AnsibleLogAnalyzer:
         for log_file in log_file_list:
             if not len(log_file):
                 continue
-            match_strings, expect_strings = self.analyze_file(log_file, match_messages_regex, ignore_messages_regex, expect_messages_regex)
+            match_strings, expect_strings = self.analyze_file(log_file, matcher)
 
             match_strings.reverse()
             expect_strings.reverse()
@@ -413,8 +595,12 @@ def usage():
     print '--action                         init|analyze - action to perform.'
     print '                                 init - initialize analysis by placing start-marker'
     print '                                 to all log files specified in --logs parameter.'
+    print '                                 Position of system log file before start-marker is printed'
+    print '                                 in JSON to stdout, to be passed to extract_log module.'
     print '                                 analyze - perform log analysis of files specified in --logs parameter.'
     print '                                 add_end_marker - add end marker to all log files specified in --logs parameter.'
+    print '                                 analyze_json - perform log analysis of files specified in --logs parameter'
+    print '                                 using regular expressions from --regex_file, print results in JSON to stdout.'
     print '--out_dir path                   Directory path where to place output files, '
     print '                                 must be present when --action == analyze'
     print '--logs path{,path}               List of full paths to log files to be analyzed.'
@@ -433,10 +619,13 @@ def usage():
     print '                                 All the strings from these files will be expected to present'
     print '                                 in one of specified log files during the analysis. Must be present'
     print '                                 when action == analyze.'
+    print '--regex_file path                Path to JSON file with lists of regular expressions under'
+    print '                                 "match", "ignore" and "expect" keys. Must be present'
+    print '                                 when action == analyze_json.'
 
 #---------------------------------------------------------------------
 
-def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in):
+def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in, regex_file):
     '''
     @summary: This function validates command line parameter 'action' and
         other related parameters.
@@ -459,6 +648,10 @@ def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in,
             print 'ERROR: missing required match_files_in for analyze action'
             ret_code = False
 
+    elif (action == 'analyze_json'):
+        if regex_file is None or len(regex_file) == 0:
+            print 'ERROR: missing required regex_file for analyze_json action'
+            ret_code = False
 
     else:
         ret_code = False
@@ -485,7 +678,7 @@ def check_run_id(run_id):
     return ret_code
 #---------------------------------------------------------------------
 
-def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_e, unused_regex_messages):
+def write_result_file(run_id, out_dir, analysis_result_per_file, unused_regex_messages):
     '''
     @summary: Write results of analysis into a file.
 
@@ -495,12 +688,13 @@ def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_
 
     @param analysis_result_per_file: map file_name: [list of found matching strings]
 
+    @param unused_regex_messages: list of expected regular expressions not found in the logs
+
     @return: void
     '''
 
     match_cnt = 0
     expected_cnt = 0
-    expected_lines_total = []
 
     with open(out_dir + "/result.loganalysis." + run_id + ".log", 'w') as out_file:
         for key, val in analysis_result_per_file.iteritems():
@@ -516,20 +710,11 @@ def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_
 
             for i in expected_lines:
                 out_file.write(i)
-                expected_lines_total.append(i)
             out_file.write('\nExpected and found matches:%d\n' % len(expected_lines))
             expected_cnt += len(expected_lines)
 
         out_file.write("\n-------------------------------------------------\n\n")
         out_file.write('Total matches:%d\n' % match_cnt)
-        # Find unused regex matches
-        for regex in messages_regex_e:
-            for line in expected_lines_total:
-                if re.search(regex, line):
-                    break
-            else:
-                unused_regex_messages.append(regex)
-
         out_file.write('Total expected and found matches:%d\n' % expected_cnt)
         out_file.write('Total expected but not found matches: %d\n\n' % len(unused_regex_messages))
         for regex in unused_regex_messages:
@@ -576,6 +761,41 @@ def write_summary_file(run_id, out_dir, analysis_result_per_file, unused_regex_m
     out_file.close()
 #---------------------------------------------------------------------
 
+def load_regex_file(regex_file):
+    '''
+    @summary: Load lists of regular expressions from JSON file.
+
+    @param regex_file: Path to JSON file with "match", "ignore" and "expect" lists.
+
+    @return: Tuple of 'match', 'ignore' and 'expect' lists of regular expressions.
+    '''
+    with open(regex_file) as fp:
+        regex = json.load(fp)
+
+    return tuple([item.encode('utf-8') for item in regex.get(key) or []]
+                 for key in ('match', 'ignore', 'expect'))
+#---------------------------------------------------------------------
+
+def write_json_result(analysis_result_per_file, unused_regex_messages):
+    '''
+    @summary: Print results of analysis to stdout in JSON format.
+
+    @param analysis_result_per_file: map file_name:[list of matching strings, list of expected strings]
+
+    @param unused_regex_messages: list of expected regular expressions not found in the logs
+
+    @return: void
+    '''
+    result = {"match_messages": {}, "expect_messages": {}, "unused_expected_regexp": unused_regex_messages}
+
+    for key, val in analysis_result_per_file.iteritems():
+        matching_lines, expected_lines = val
+        result["match_messages"][key] = [line.decode('utf-8', 'replace') for line in matching_lines]
+        result["expect_messages"][key] = [line.decode('utf-8', 'replace') for line in expected_lines]
+
+    print json.dumps(result)
+#---------------------------------------------------------------------
+
 def main(argv):
 
     action = None
@@ -586,10 +806,11 @@ def main(argv):
     match_files_in = None
     ignore_files_in = None
     expect_files_in = None
+    regex_file = None
     verbose = False
 
     try:
-        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh", ["action=", "run_id=", "start_marker=", "logs=", "out_dir=", "match_files_in=", "ignore_files_in=", "expect_files_in=", "verbose", "help"])
+        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh", ["action=", "run_id=", "start_marker=", "logs=", "out_dir=", "match_files_in=", "ignore_files_in=", "expect_files_in=", "regex_file=", "verbose", "help"])
 
     except getopt.GetoptError:
         print "Invalid option specified"
@@ -625,10 +846,13 @@ def main(argv):
         elif (opt in ("-e", "--expect_files_in")):
             expect_files_in = arg
 
+        elif (opt == "--regex_file"):
+            regex_file = arg
+
         elif (opt in ("-v", "--verbose")):
             verbose = True
 
-    if not (check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in) and check_run_id(run_id)):
+    if not (check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in, regex_file) and check_run_id(run_id)):
         usage()
         sys.exit(err_invalid_input)
 
@@ -638,7 +862,9 @@ def main(argv):
 
     result = {}
     if (action == "init"):
+        start_position = analyzer.get_log_position(system_log_file)
         analyzer.place_marker(log_file_list, analyzer.create_start_marker())
+        print json.dumps(start_position)
         return 0
     elif (action == "analyze"):
         match_file_list = match_files_in.split(tokenizer)
@@ -647,19 +873,30 @@ def main(argv):
 
         analyzer.place_marker(log_file_list, analyzer.create_end_marker())
 
-        match_messages_regex, messages_regex_m = analyzer.create_msg_regex(match_file_list)
-        ignore_messages_regex, messages_regex_i = analyzer.create_msg_regex(ignore_file_list)
-        expect_messages_regex, messages_regex_e = analyzer.create_msg_regex(expect_file_list)
+        messages_regex_m = analyzer.create_msg_regex(match_file_list)[1]
+        messages_regex_i = analyzer.create_msg_regex(ignore_file_list)[1]
+        messages_regex_e = analyzer.create_msg_regex(expect_file_list)[1]
 
         # if no log file specified - add system log
         if not log_file_list:
             log_file_list.append(system_log_file)
 
-        result = analyzer.analyze_file_list(log_file_list, match_messages_regex,
-                                            ignore_messages_regex, expect_messages_regex)
-        unused_regex_messages = []
-        write_result_file(run_id, out_dir, result, messages_regex_e, unused_regex_messages)
+        matcher = LogMessageMatcher(messages_regex_m, messages_regex_i, messages_regex_e)
+        result = analyzer.analyze_file_list(log_file_list, matcher)
+        unused_regex_messages = matcher.get_unused_expect_regex()
+        write_result_file(run_id, out_dir, result, unused_regex_messages)
         write_summary_file(run_id, out_dir, result, unused_regex_messages)
+    elif (action == "analyze_json"):
+        messages_regex_m, messages_regex_i, messages_regex_e = load_regex_file(regex_file)
+
+        # if no log file specified - add system log
+        if not log_file_list:
+            log_file_list.append(system_log_file)
+
+        matcher = LogMessageMatcher(messages_regex_m, messages_regex_i, messages_regex_e)
+        result = analyzer.analyze_file_list(log_file_list, matcher)
+        write_json_result(result, matcher.get_unused_expect_regex())
+        return 0
     elif (action == "add_end_marker"):
         analyzer.place_marker(log_file_list, analyzer.create_end_marker())
         return 0
@@ -5,6 +5,12 @@ import re
 import os
 import os.path
 import re
+import time
+import functools
+import csv
+import threading
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 import docker
 from ansible.module_utils.basic import *
 import traceback
@@ -58,6 +64,13 @@ Parameters:
     - dut_fp_ports: dut ports
     - dut_mgmt_port: dut mgmt port
     - fp_mtu: MTU for FP ports
+    - max_workers: number of VMs which are set up in parallel
+    Interface, OVS port and flow operations are batched: one ovs-vsctl transaction for ports of all bridges,
+    one ovs-ofctl replace-flows per bridge and one 'ip -batch' for links of the host and of the ptf docker.
+    Time and number of spawned commands of every phase are returned in 'phases'.
+    OVS bridges, ports and flows of different VMs are set up by max_workers threads in parallel, with time and number
+    of spawned commands of every VM in 'phases'. If it fails for some VMs, bridges and ports added by the phase are
+    removed. Operations in the ptf docker network namespace are always done by one thread.
 '''
 
 EXAMPLES = '''
@@ -83,6 +96,7 @@ EXAMPLES = '''
     dut_fp_ports: "{{ dut_fp_ports }}"
     fp_mtu: "{{ fp_mtu_size }}"
     max_fp_num: "{{ max_fp_num }}
+    max_workers: 8
 '''
 
 
@@ -108,17 +122,48 @@ RETRIES = 3
 
 cmd_debug_fname = None
 
+def phase(func):
+    """record time and number of spawned commands of VMTopology method in VMTopology.phases"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start_time, start_cmds = time.time(), VMTopology.cmd_count.total
+        ret = func(self, *args, **kwargs)
+        self.phases.append({'phase': func.__name__,
+                            'time': round(time.time() - start_time, 3),
+                            'commands': VMTopology.cmd_count.total - start_cmds})
+        return ret
+
+    return wrapper
+
+class CmdCount(threading.local):
+    """number of spawned commands, in total and by the current thread"""
+    lock = threading.Lock()
+    total = 0
+
+    def __init__(self):
+        self.thread = 0
+
+    def inc(self):
+        self.thread += 1
+        with CmdCount.lock:
+            CmdCount.total += 1
+
 class VMTopology(object):
 
-    def __init__(self, vm_names, fp_mtu, max_fp_num):
+    cmd_count = CmdCount()
+
+    def __init__(self, vm_names, fp_mtu, max_fp_num, max_workers=1):
         self.vm_names = vm_names
         self.fp_mtu = fp_mtu
         self.max_fp_num = max_fp_num
+        self.max_workers = max_workers
+        self.phases = []
 
         self.host_ifaces = VMTopology.ifconfig('ifconfig -a')
 
         return
 
+    @phase
     def init(self, vm_set_name, topo, vm_base, dut_fp_ports, ptf_exists=True):
         self.vm_set_name = vm_set_name
         if 'VMs' in topo:
@@ -165,7 +210,7 @@ class VMTopology(object):
                 if self.pid is not None:
                     self.cntr_ifaces = VMTopology.ifconfig('nsenter -t %s -n ifconfig -a' % self.pid)
                 else:
-                    self.cntr_ifaces = []
+                    self.cntr_ifaces = set()
                 break
             except Exception as error:
                 errmsg.append(str(error))
@@ -183,37 +228,47 @@ class VMTopology(object):
 
         return vlans
 
+    @phase
     def create_bridges(self):
-        for vm in self.vm_names:
-            for fp_num in xrange(self.max_fp_num):
-                fp_br_name = OVS_FP_BRIDGE_TEMPLATE % (vm, fp_num)
-                self.create_ovs_bridge(fp_br_name, self.fp_mtu)
+        created = []
 
-        return
+        def create_vm_bridges(vm):
+            bridges = [OVS_FP_BRIDGE_TEMPLATE % (vm, fp_num) for fp_num in xrange(self.max_fp_num)]
+            self.create_ovs_bridges(bridges, self.fp_mtu, created)
+
+        def rollback():
+            VMTopology.ovs_vsctl(['--if-exists del-br %s' % bridge_name for bridge_name in created])
 
-    def create_ovs_bridge(self, bridge_name, mtu):
-        if bridge_name not in self.host_ifaces:
-            VMTopology.cmd('ovs-vsctl add-br %s' % bridge_name)
+        self.run_per_vm('create_bridges', dict((vm, create_vm_bridges) for vm in self.vm_names), rollback)
+
+        return
 
-        if mtu != DEFAULT_MTU:
-            VMTopology.cmd('ifconfig %s mtu %d' % (bridge_name, mtu))
+    def create_ovs_bridges(self, bridges, mtu, created):
+        """create ovs bridges which don't exist yet, names of them are appended to created"""
+        new_bridges = [bridge_name for bridge_name in bridges if bridge_name not in self.host_ifaces]
+        created.extend(new_bridges)
+        VMTopology.ovs_vsctl(['add-br %s' % bridge_name for bridge_name in new_bridges])
 
-        VMTopology.cmd('ifconfig %s up' % bridge_name)
+        cmds = []
+        for bridge_name in bridges:
+            if mtu != DEFAULT_MTU:
+                cmds.append('link set dev %s mtu %d' % (bridge_name, mtu))
+            cmds.append('link set dev %s up' % bridge_name)
+        VMTopology.ip_batch(cmds)
 
         return
 
+    @phase
     def destroy_bridges(self):
-        for vm in self.vm_names:
-            for ifname in self.host_ifaces:
-                if re.compile(OVS_FP_BRIDGE_REGEX % vm).match(ifname):
-                    self.destroy_ovs_bridge(ifname)
+        self.run_per_vm('destroy_bridges', dict((vm, lambda vm: self.destroy_ovs_bridges(self.get_bridges(vm)))
+                                                for vm in self.vm_names))
 
         return
 
-    def destroy_ovs_bridge(self, bridge_name):
-        if bridge_name in self.host_ifaces:
-            VMTopology.cmd('ifconfig %s down' % bridge_name)
-            VMTopology.cmd('ovs-vsctl del-br %s' % bridge_name)
+    def destroy_ovs_bridges(self, bridges):
+        bridges = [bridge_name for bridge_name in bridges if bridge_name in self.host_ifaces]
+        VMTopology.ip_batch(['link set dev %s down' % bridge_name for bridge_name in bridges])
+        VMTopology.ovs_vsctl(['del-br %s' % bridge_name for bridge_name in bridges])
 
         return
 
@@ -225,20 +280,31 @@ class VMTopology(object):
 
         return brs
 
+    @phase
     def add_veth_ports_to_docker(self):
+        self.update()
+
+        host_cmds = []
+        cntr_cmds = []
         for vlan in self.injected_fp_ports:
             ext_if = INJECTED_INTERFACES_TEMPLATE % (self.vm_set_name, vlan)
             int_if = PTF_FP_IFACE_TEMPLATE % vlan
-            self.add_veth_if_to_docker(ext_if, int_if)
+            self.add_veth_if_to_docker(ext_if, int_if, host_cmds, cntr_cmds)
+
+        # host side commands move interfaces into the docker, so they go first
+        VMTopology.ip_batch(host_cmds)
+        VMTopology.ip_batch(cntr_cmds, self.pid)
 
         return
 
+    @phase
     def add_mgmt_port_to_docker(self, mgmt_bridge, mgmt_ip, mgmt_gw):
         self.add_br_if_to_docker(mgmt_bridge, PTF_MGMT_IF_TEMPLATE % self.vm_set_name, MGMT_PORT_NAME)
         self.add_ip_to_docker_if(MGMT_PORT_NAME, mgmt_ip, mgmt_gw=mgmt_gw)
 
         return
 
+    @phase
     def add_bp_port_to_docker(self, mgmt_ip, mgmt_ipv6):
         self.add_br_if_to_docker(self.bp_bridge, PTF_BP_IF_TEMPLATE % self.vm_set_name, BP_PORT_NAME)
         self.add_ip_to_docker_if(BP_PORT_NAME, mgmt_ip, mgmt_ipv6)
@@ -277,123 +343,197 @@ class VMTopology(object):
 
         return
 
-    def add_dut_if_to_docker(self, iface_name, dut_iface):
-
-        self.update()
+    def add_dut_if_to_docker(self, iface_name, dut_iface, host_cmds, cntr_cmds):
+        """
+        append 'ip' commands which move dut iface into the docker to host_cmds and cntr_cmds,
+        host_ifaces and cntr_ifaces are updated with the result of the commands
+        """
         if dut_iface in self.host_ifaces and dut_iface not in self.cntr_ifaces and iface_name not in self.cntr_ifaces:
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.pid, dut_iface))
+            host_cmds.append("link set netns %s dev %s" % (self.pid, dut_iface))
+            self.host_ifaces.discard(dut_iface)
+            self.cntr_ifaces.add(dut_iface)
 
-        self.update()
         if dut_iface in self.cntr_ifaces and iface_name not in self.cntr_ifaces:
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, dut_iface, iface_name))
+            cntr_cmds.append("link set dev %s name %s" % (dut_iface, iface_name))
+            self.cntr_ifaces.discard(dut_iface)
+            self.cntr_ifaces.add(iface_name)
 
-        VMTopology.iface_up(iface_name, self.pid)
+        cntr_cmds.append("link set %s up" % iface_name)
 
         return
 
-    def remove_dut_if_from_docker(self, iface_name, dut_iface):
-
-        if self.pid is None:
-            return
-
-        self.update()
+    def remove_dut_if_from_docker(self, iface_name, dut_iface, cntr_cmds):
+        """
+        append 'ip' commands which move dut iface out of the docker to cntr_cmds,
+        host_ifaces and cntr_ifaces are updated with the result of the commands
+        """
         if iface_name in self.cntr_ifaces:
-            VMTopology.iface_down(iface_name, self.pid)
+            cntr_cmds.append("link set %s down" % iface_name)
 
         if iface_name in self.cntr_ifaces and dut_iface not in self.cntr_ifaces:
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, iface_name, dut_iface))
+            cntr_cmds.append("link set dev %s name %s" % (iface_name, dut_iface))
+            self.cntr_ifaces.discard(iface_name)
+            self.cntr_ifaces.add(dut_iface)
 
-        self.update()
         if dut_iface not in self.host_ifaces and dut_iface in self.cntr_ifaces:
-            VMTopology.cmd("nsenter -t %s -n ip link set netns 1 dev %s" % (self.pid, dut_iface))
+            cntr_cmds.append("link set netns 1 dev %s" % dut_iface)
+            self.cntr_ifaces.discard(dut_iface)
+            self.host_ifaces.add(dut_iface)
 
         return
 
-    def add_veth_if_to_docker(self, ext_if, int_if):
-        self.update()
-
+    def add_veth_if_to_docker(self, ext_if, int_if, host_cmds, cntr_cmds):
+        """
+        append 'ip' commands which create veth pair and move one end of it into the docker to host_cmds and cntr_cmds,
+        host_ifaces and cntr_ifaces are updated with the result of the commands
+        """
         t_int_if = int_if + '_t'
         if ext_if not in self.host_ifaces:
-            VMTopology.cmd("ip link add %s type veth peer name %s" % (ext_if, t_int_if))
-
-        self.update()
+            host_cmds.append("link add %s type veth peer name %s" % (ext_if, t_int_if))
+            self.host_ifaces.update([ext_if, t_int_if])
 
         if self.fp_mtu != DEFAULT_MTU:
-            VMTopology.cmd("ip link set dev %s mtu %d" % (ext_if, self.fp_mtu))
+            host_cmds.append("link set dev %s mtu %d" % (ext_if, self.fp_mtu))
             if t_int_if in self.host_ifaces:
-                VMTopology.cmd("ip link set dev %s mtu %d" % (t_int_if, self.fp_mtu))
+                host_cmds.append("link set dev %s mtu %d" % (t_int_if, self.fp_mtu))
             elif t_int_if in self.cntr_ifaces:
-                VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, t_int_if, self.fp_mtu))
+                cntr_cmds.append("link set dev %s mtu %d" % (t_int_if, self.fp_mtu))
             elif int_if in self.cntr_ifaces:
-                VMTopology.cmd("nsenter -t %s -n ip link set dev %s mtu %d" % (self.pid, int_if, self.fp_mtu))
+                cntr_cmds.append("link set dev %s mtu %d" % (int_if, self.fp_mtu))
 
-        VMTopology.iface_up(ext_if)
-
-        self.update()
+        host_cmds.append("link set %s up" % ext_if)
 
         if t_int_if in self.host_ifaces and t_int_if not in self.cntr_ifaces and int_if not in self.cntr_ifaces:
-            VMTopology.cmd("ip link set netns %s dev %s" % (self.pid, t_int_if))
-
-        self.update()
+            host_cmds.append("link set netns %s dev %s" % (self.pid, t_int_if))
+            self.host_ifaces.discard(t_int_if)
+            self.cntr_ifaces.add(t_int_if)
 
         if t_int_if in self.cntr_ifaces and int_if not in self.cntr_ifaces:
-            VMTopology.cmd("nsenter -t %s -n ip link set dev %s name %s" % (self.pid, t_int_if, int_if))
+            cntr_cmds.append("link set dev %s name %s" % (t_int_if, int_if))
+            self.cntr_ifaces.discard(t_int_if)
+            self.cntr_ifaces.add(int_if)
 
-        VMTopology.iface_up(int_if, self.pid)
+        cntr_cmds.append("link set %s up" % int_if)
 
         return
 
+    @phase
     def bind_mgmt_port(self, br_name, mgmt_port):
         if mgmt_port not in self.host_if_to_br:
             VMTopology.cmd("brctl addif %s %s" % (br_name, mgmt_port))
 
         return
 
+    @phase
     def unbind_mgmt_port(self, mgmt_port):
         if mgmt_port in self.host_if_to_br:
             VMTopology.cmd("brctl delif %s %s" % (self.host_if_to_br[mgmt_port], mgmt_port))
 
         return
 
+    @phase
     def bind_fp_ports(self, disconnect_vm=False):
+        bridges = defaultdict(list)
         for attr in self.VMs.itervalues():
+            vm = self.vm_names[self.vm_base_index + attr['vm_offset']]
             for vlan_num, vlan in enumerate(attr['vlans']):
                injected_iface = INJECTED_INTERFACES_TEMPLATE % (self.vm_set_name, vlan)
-               br_name = OVS_FP_BRIDGE_TEMPLATE % (self.vm_names[self.vm_base_index + attr['vm_offset']], vlan_num)
-               vm_iface = OVS_FP_TAP_TEMPLATE % (self.vm_names[self.vm_base_index + attr['vm_offset']], vlan_num)
-               self.bind_ovs_ports(br_name, self.dut_fp_ports[vlan], injected_iface, vm_iface, disconnect_vm)
+               br_name = OVS_FP_BRIDGE_TEMPLATE % (vm, vlan_num)
+               vm_iface = OVS_FP_TAP_TEMPLATE % (vm, vlan_num)
+               bridges[vm].append((br_name, self.dut_fp_ports[vlan], injected_iface, vm_iface))
+
+        ports = VMTopology.get_ovs_ports()
+        added = []
+
+        def rollback():
+            VMTopology.ovs_vsctl(['--if-exists del-port %s %s' % port for port in added])
+
+        self.run_per_vm('bind_fp_ports', dict((vm, lambda vm: self.bind_ovs_ports(bridges[vm], ports, added, disconnect_vm))
+                                              for vm in bridges), rollback)
 
         return
 
+    @phase
     def unbind_fp_ports(self):
+        bridges = defaultdict(list)
         for attr in self.VMs.itervalues():
+            vm = self.vm_names[self.vm_base_index + attr['vm_offset']]
             for vlan_num, vlan in enumerate(attr['vlans']):
-               br_name = OVS_FP_BRIDGE_TEMPLATE % (self.vm_names[self.vm_base_index + attr['vm_offset']], vlan_num)
-               vm_iface = OVS_FP_TAP_TEMPLATE % (self.vm_names[self.vm_base_index + attr['vm_offset']], vlan_num)
-               self.unbind_ovs_ports(br_name, vm_iface)
+               br_name = OVS_FP_BRIDGE_TEMPLATE % (vm, vlan_num)
+               vm_iface = OVS_FP_TAP_TEMPLATE % (vm, vlan_num)
+               bridges[vm].append((br_name, vm_iface))
+
+        ports = VMTopology.get_ovs_ports()
+        self.run_per_vm('unbind_fp_ports', dict((vm, lambda vm: self.unbind_ovs_ports(bridges[vm], ports))
+                                                for vm in bridges))
 
         return
 
+    def run_per_vm(self, name, vm_tasks, rollback=None):
+        """
+        run vm_tasks, dict of vm name to function called with the vm name, by max_workers threads
+        and record time and number of spawned commands of every vm in phases.
+        When some of the tasks fail, rollback is called after all the tasks are done and exception is raised
+        """
+        def run(vm):
+            VMTopology.cmd_count.thread = 0
+            start_time = time.time()
+            try:
+                vm_tasks[vm](vm)
+                error = None
+            except Exception as e:
+                error = "%s: %s" % (vm, str(e))
+            return vm, round(time.time() - start_time, 3), VMTopology.cmd_count.thread, error
+
+        vms = sorted(vm_tasks)
+        if self.max_workers > 1 and len(vms) > 1:
+            pool = ThreadPool(min(self.max_workers, len(vms)))
+            try:
+                results = pool.map(run, vms)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(run, vms)
+
+        errors = []
+        for vm, duration, commands, error in results:
+            self.phases.append({'phase': name, 'vm': vm, 'time': duration, 'commands': commands})
+            if error is not None:
+                errors.append(error)
+
+        if errors:
+            if rollback is not None:
+                try:
+                    rollback()
+                except Exception as e:
+                    errors.append("rollback: %s" % str(e))
+            raise Exception("%s failed for %d VMs. %s" % (name, len(errors), "|".join(errors)))
+
+        return
+
+    @phase
     def bind_vm_backplane(self):
 
         if self.bp_bridge not in self.host_ifaces:
             VMTopology.cmd('brctl addbr %s' % self.bp_bridge)
 
-        VMTopology.iface_up(self.bp_bridge)
-
         self.update()
 
+        cmds = ["link set %s up" % self.bp_bridge]
         for attr in self.VMs.itervalues():
             vm_name = self.vm_names[self.vm_base_index + attr['vm_offset']]
             bp_port_name = OVS_BP_TAP_TEMPLATE % vm_name
 
             if bp_port_name not in self.host_br_to_ifs[self.bp_bridge]:
-                VMTopology.cmd("brctl addif %s %s" % (self.bp_bridge, bp_port_name))
+                cmds.append("link set dev %s master %s" % (bp_port_name, self.bp_bridge))
 
-            VMTopology.iface_up(bp_port_name)
+            cmds.append("link set %s up" % bp_port_name)
+        VMTopology.ip_batch(cmds)
 
         return
 
+    @phase
     def unbind_vm_backplane(self):
 
         if self.bp_bridge in self.host_ifaces:
@@ -402,75 +542,93 @@ class VMTopology(object):
 
         return
 
-    def bind_ovs_ports(self, br_name, dut_iface, injected_iface, vm_iface, disconnect_vm=False):
-        """bind dut/injected/vm ports under an ovs bridge"""
-        ports = VMTopology.get_ovs_br_ports(br_name)
-
-        if injected_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, injected_iface))
-
-        if dut_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, dut_iface))
-
-        bindings = VMTopology.get_ovs_port_bindings(br_name, dut_iface)
-        dut_iface_id = bindings[dut_iface]
-        injected_iface_id = bindings[injected_iface]
-        vm_iface_id = bindings[vm_iface]
-
-        # clear old bindings
-        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
-
-        if disconnect_vm:
-            # Drop packets from VM
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=drop" % (br_name, vm_iface_id))
-        else:
-            # Add flow from a VM to an external iface
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, vm_iface_id, dut_iface_id))
-
-        if disconnect_vm:
-            # Add flow from external iface to ptf container
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, dut_iface_id, injected_iface_id))
-        else:
-            # Add flow from external iface to a VM and a ptf container
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s,%s" % (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-
-        # Add flow from a ptf container to an external iface
-        VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" % (br_name, injected_iface_id, dut_iface_id))
+    def bind_ovs_ports(self, bridges, ports, added, disconnect_vm=False):
+        """
+        bind dut/injected/vm ports under ovs bridges, bridges is a list of (br_name, dut_iface, injected_iface, vm_iface),
+        ports is the result of get_ovs_ports(), (br_name, port) of added ports are appended to added
+        """
+        clauses = []
+        for br_name, dut_iface, injected_iface, vm_iface in bridges:
+            for iface in (injected_iface, dut_iface):
+                if iface not in ports.get(br_name, []):
+                    clauses.append('add-port %s %s' % (br_name, iface))
+                    added.append((br_name, iface))
+        VMTopology.ovs_vsctl(clauses)
+
+        bindings = VMTopology.get_ovs_port_bindings(set(iface for bridge in bridges for iface in bridge[1:]))
+
+        for br_name, dut_iface, injected_iface, vm_iface in bridges:
+            dut_iface_id = bindings[dut_iface]
+            injected_iface_id = bindings[injected_iface]
+            vm_iface_id = bindings[vm_iface]
+
+            flows = []
+            if disconnect_vm:
+                # Drop packets from VM
+                flows.append("table=0,in_port=%s,action=drop" % vm_iface_id)
+            else:
+                # Add flow from a VM to an external iface
+                flows.append("table=0,in_port=%s,action=output:%s" % (vm_iface_id, dut_iface_id))
 
-        return
+            if disconnect_vm:
+                # Add flow from external iface to ptf container
+                flows.append("table=0,in_port=%s,action=output:%s" % (dut_iface_id, injected_iface_id))
+            else:
+                # Add flow from external iface to a VM and a ptf container
+                flows.append("table=0,in_port=%s,action=output:%s,%s" % (dut_iface_id, vm_iface_id, injected_iface_id))
 
-    def unbind_ovs_ports(self, br_name, vm_port):
-        """unbind all ports except the vm port from an ovs bridge"""
-        ports = VMTopology.get_ovs_br_ports(br_name)
+            # Add flow from a ptf container to an external iface
+            flows.append("table=0,in_port=%s,action=output:%s" % (injected_iface_id, dut_iface_id))
 
-        for port in ports:
-            if port != vm_port:
-                VMTopology.cmd('ovs-vsctl del-port %s %s' % (br_name, port))
+            # replace old bindings
+            VMTopology.cmd('ovs-ofctl replace-flows %s -' % br_name, '\n'.join(flows) + '\n')
 
         return
 
-    def unbind_ovs_port(self, br_name, port):
-        """unbind a port from an ovs bridge"""
-        ports = VMTopology.get_ovs_br_ports(br_name)
-
-        if port in ports:
-            VMTopology.cmd('ovs-vsctl del-port %s %s' % (br_name, port))
+    def unbind_ovs_ports(self, bridges, ports):
+        """
+        unbind all ports except the vm port from ovs bridges, bridges is a list of (br_name, vm_port),
+        ports is the result of get_ovs_ports()
+        """
+        clauses = []
+        for br_name, vm_port in bridges:
+            for port in sorted(ports.get(br_name, [])):
+                if port != vm_port:
+                    clauses.append('del-port %s %s' % (br_name, port))
+        VMTopology.ovs_vsctl(clauses)
 
         return
 
+    @phase
     def inject_host_ports(self):
         """inject dut port into the ptf docker"""
         self.update()
+
+        host_cmds = []
+        cntr_cmds = []
         for vlan in self.host_interfaces:
-            self.add_dut_if_to_docker(PTF_FP_IFACE_TEMPLATE % vlan, self.dut_fp_ports[vlan])
+            self.add_dut_if_to_docker(PTF_FP_IFACE_TEMPLATE % vlan, self.dut_fp_ports[vlan], host_cmds, cntr_cmds)
+
+        VMTopology.ip_batch(host_cmds)
+        VMTopology.ip_batch(cntr_cmds, self.pid)
 
         return
 
+    @phase
     def deject_host_ports(self):
         """deject dut port from the ptf docker"""
+        if self.pid is None:
+            return
+
         self.update()
+
+        cntr_cmds = []
         for vlan in self.host_interfaces:
-            self.remove_dut_if_from_docker(PTF_FP_IFACE_TEMPLATE % vlan, self.dut_fp_ports[vlan])
+            self.remove_dut_if_from_docker(PTF_FP_IFACE_TEMPLATE % vlan, self.dut_fp_ports[vlan], cntr_cmds)
+
+        VMTopology.ip_batch(cntr_cmds, self.pid)
+
+        return
 
     @staticmethod
     def iface_up(iface_name, pid=None):
@@ -495,50 +653,74 @@ class VMTopology(object):
             return VMTopology.cmd('nsenter -t %s -n ethtool -K %s tx off' % (pid, iface_name))
 
     @staticmethod
-    def cmd(cmdline):
-        with open(cmd_debug_fname, 'a') as fp:
+    def cmd(cmdline, input=None):
+        with CmdCount.lock, open(cmd_debug_fname, 'a') as fp:
             pprint("CMD: %s" % cmdline, fp)
+            if input is not None:
+                pprint("INPUT: %s" % input, fp)
+        VMTopology.cmd_count.inc()
         cmd = cmdline.split(' ')
         process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        stdout, stderr = process.communicate(input)
         ret_code = process.returncode
 
         if ret_code != 0:
             raise Exception("ret_code=%d, error message=%s. cmd=%s" % (ret_code, stderr, cmdline))
 
-        with open(cmd_debug_fname, 'a') as fp:
+        with CmdCount.lock, open(cmd_debug_fname, 'a') as fp:
             pprint("OUTPUT: %s" % stdout, fp)
         return stdout
 
     @staticmethod
-    def get_ovs_br_ports(bridge):
-        out = VMTopology.cmd('ovs-vsctl list-ports %s' % bridge)
-        ports = set()
-        for port in out.split('\n'):
-            if port != "":
-                ports.add(port)
+    def ip_batch(cmds, pid=None):
+        """run 'ip' commands in one 'ip -batch' process, inside of the network namespace of pid if it is given"""
+        if not cmds:
+            return
+
+        if pid is None:
+            return VMTopology.cmd('ip -batch -', '\n'.join(cmds) + '\n')
+        else:
+            return VMTopology.cmd('nsenter -t %s -n ip -batch -' % pid, '\n'.join(cmds) + '\n')
+
+    @staticmethod
+    def ovs_vsctl(clauses):
+        """run ovs-vsctl commands in one ovs-vsctl transaction"""
+        if not clauses:
+            return
+
+        return VMTopology.cmd('ovs-vsctl -- ' + ' -- '.join(clauses))
+
+    @staticmethod
+    def ovs_vsctl_list(table, columns):
+        """return rows of ovs database table as lists of column values"""
+        out = VMTopology.cmd('ovs-vsctl --format=csv --data=bare --no-headings --columns=%s list %s' % (','.join(columns), table))
+        return [row for row in csv.reader(out.splitlines()) if row]
+
+    @staticmethod
+    def get_ovs_ports():
+        """return dict of ovs bridge name to the set of its ports, as 'ovs-vsctl list-ports' lists them"""
+        port_names = dict(VMTopology.ovs_vsctl_list('Port', ['_uuid', 'name']))
+        ports = {}
+        for bridge, port_uuids in VMTopology.ovs_vsctl_list('Bridge', ['name', 'ports']):
+            ports[bridge] = set(port_names[uuid] for uuid in port_uuids.split()) - set([bridge])
         return ports
 
     @staticmethod
-    def get_ovs_port_bindings(bridge, vlan_iface = None):
+    def get_ovs_port_bindings(ifaces):
+        """return dict of iface name to its openflow port number for all ifaces"""
         # Vlan interface addition may take few secs to reflect in OVS Command,
         # Let`s retry few times in that case.
         for retries in range(RETRIES):
-            out = VMTopology.cmd('ovs-ofctl show %s' % bridge)
-            lines = out.split('\n')
             result = {}
-            for line in lines:
-                matched = re.match(r'^\s+(\S+)\((\S+)\):\s+addr:.+$', line)
-                if matched:
-                    port_id = matched.group(1)
-                    iface_name = matched.group(2)
+            for iface_name, port_id in VMTopology.ovs_vsctl_list('Interface', ['name', 'ofport']):
+                if port_id.isdigit() and int(port_id) > 0:
                     result[iface_name] = port_id
-            # Check if we have vlan_iface populated
-            if vlan_iface is None or vlan_iface in result:
+            missing = set(ifaces) - set(result)
+            if not missing:
                 return result
             time.sleep(2*retries+1)
-        # Flow reaches here when vlan_iface not present in result 
-        raise Exception("Can't find vlan_iface_id")
+        # Flow reaches here when some ifaces are not bound to openflow ports
+        raise Exception("Can't find openflow port of %s" % ', '.join(sorted(missing)))
 
     @staticmethod
     def ifconfig(cmdline):
@@ -661,6 +843,7 @@ def main():
             dut_mgmt_port=dict(required=False, type='str'),
             fp_mtu=dict(required=False, type='int', default=DEFAULT_MTU),
             max_fp_num=dict(required=False, type='int', default=NUM_FP_VLANS_PER_FP),
+            max_workers=dict(required=False, type='int', default=1),
         ),
         supports_check_mode=False)
 
@@ -680,7 +863,7 @@ def main():
         if os.path.exists(cmd_debug_fname) and os.path.isfile(cmd_debug_fname):
             os.remove(cmd_debug_fname)
 
-        net = VMTopology(vm_names, fp_mtu, max_fp_num)
+        net = VMTopology(vm_names, fp_mtu, max_fp_num, module.params['max_workers'])
 
         if cmd == 'create':
             net.create_bridges()
@@ -839,7 +1022,7 @@ def main():
             traceback.print_exc(file=fp)
         module.fail_json(msg=str(error))
 
-    module.exit_json(changed=True)
+    module.exit_json(changed=True, phases=net.phases)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,215 @@
+"""
+Persistent command channel for running shell commands on a device.
+
+Running a command through an ansible module requires packaging the module, a new SSH session and starting a python
+interpreter on the device. For plain 'command' and 'shell' modules this overhead is much bigger than the command
+itself. The command channel keeps one SSH channel open to a small command server (command_server.py) running on the
+device, and sends commands to it one by one.
+"""
+import json
+import logging
+import os
+import threading
+
+import paramiko
+
+from errors import CommandChannelError, CommandChannelNoReply
+
+logger = logging.getLogger(__name__)
+
+COMMAND_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_server.py")
+DEVICE_COMMAND_SERVER = "/tmp/command_server.py"
+SSH_KEEPALIVE_INTERVAL = 15
+
+
+class CommandResult(dict):
+    """
+    @summary: Result of a command executed through the command channel.
+
+    Has the same keys as the result of ansible 'command' and 'shell' modules.
+    """
+    @property
+    def is_failed(self):
+        return self.get("failed", False)
+
+    @property
+    def is_successful(self):
+        return not self.is_failed
+
+
+def make_command_result(cmd, response):
+    """
+    @summary: Convert command server response to the format of ansible 'command' and 'shell' modules result.
+    @param cmd: Executed command line.
+    @param response: Dictionary returned by the command server for the command.
+    @return: CommandResult instance.
+    """
+    result = CommandResult(response)
+    result["cmd"] = cmd
+    result["changed"] = True
+    result["stdout"] = result["stdout"].rstrip("\r\n")
+    result["stderr"] = result["stderr"].rstrip("\r\n")
+    result["stdout_lines"] = result["stdout"].splitlines()
+    result["stderr_lines"] = result["stderr"].splitlines()
+    if result["rc"] != 0:
+        result["failed"] = True
+        result.setdefault("msg", "non-zero return code")
+
+    return result
+
+
+def make_failure_result(cmd, msg):
+    """
+    @summary: Build result of a command which couldn't be run through the command channel.
+    @param cmd: Command line.
+    @param msg: Error message.
+    @return: Failed CommandResult with the same keys as a result returned by the command server.
+    """
+    return make_command_result(cmd, {"rc": -1, "stdout": "", "stderr": msg, "msg": msg,
+                                     "start": None, "end": None, "delta": None})
+
+
+def make_batch_request(commands, shell=False, chdir=None):
+    """
+    @summary: Build command server batch request.
+    @param commands: List of command lines.
+    @param shell: Run the commands through the shell.
+    @param chdir: Change into this directory before running each command.
+    @return: Request serialized to one line of JSON.
+    """
+    return json.dumps({"batch": [{"cmd": cmd, "shell": shell, "chdir": chdir} for cmd in commands]}) + "\n"
+
+
+def parse_batch_response(commands, line):
+    """
+    @summary: Parse command server response to a batch request.
+    @param commands: List of command lines sent in the batch request.
+    @param line: Response line.
+    @return: List of CommandResult, one per command.
+    """
+    response = json.loads(line)
+    if "results" not in response:
+        # The batch failed in the middle, some of the commands may have been executed
+        raise CommandChannelNoReply("Failed to run batch of commands: {}".format(response.get("msg")))
+
+    return [make_command_result(cmd, item) for cmd, item in zip(commands, response["results"])]
+
+
+class CommandChannel(object):
+    """
+    @summary: Persistent SSH channel to the command server running on a device.
+
+    Connection is established on the first command and re-established on the next command if it was lost, e.g.
+    because of device reboot. Only one command is executed at a time, callers can check whether the channel is
+    busy and use another way to run the command.
+    """
+
+    def __init__(self, host, username, password):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.ssh = None
+        self.stdin = None
+        self.stdout = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        logger.debug("Starting command server on %s" % self.host)
+        self.ssh = paramiko.SSHClient()
+        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh.connect(self.host, username=self.username, password=self.password, timeout=10)
+        self.ssh.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
+
+        sftp = self.ssh.open_sftp()
+        try:
+            sftp.put(COMMAND_SERVER, DEVICE_COMMAND_SERVER)
+        finally:
+            sftp.close()
+
+        self.stdin, self.stdout, _ = self.ssh.exec_command("sudo python -u {}".format(DEVICE_COMMAND_SERVER))
+
+    def _is_connected(self):
+        return self.ssh is not None and self.ssh.get_transport() is not None and self.ssh.get_transport().is_active()
+
+    def close(self):
+        """
+        @summary: Stop the command server and close the SSH connection.
+        """
+        if self.ssh is not None:
+            self.ssh.close()
+        self.ssh = self.stdin = self.stdout = None
+
+    def run(self, cmd, shell=False, chdir=None, blocking=True):
+        """
+        @summary: Run a command on the device.
+        @param cmd: Command line to run.
+        @param shell: Run the command through the shell, like the ansible 'shell' module does.
+        @param chdir: Change into this directory before running the command.
+        @param blocking: Wait for the command currently running through the channel to finish. If False and the
+            channel is busy, None is returned and the command is not executed.
+        @return: CommandResult in the format of ansible 'command' and 'shell' modules result.
+        """
+        line = self._send(json.dumps({"cmd": cmd, "shell": shell, "chdir": chdir}) + "\n", blocking)
+        if line is None:
+            return None
+
+        return make_command_result(cmd, json.loads(line))
+
+    def run_batch(self, commands, shell=False, chdir=None, blocking=True):
+        """
+        @summary: Run several commands on the device in one round trip. The commands are executed one by one, failure
+            of a command doesn't stop execution of the next ones.
+        @param commands: List of command lines to run.
+        @param shell: Run the commands through the shell, like the ansible 'shell' module does.
+        @param chdir: Change into this directory before running each command.
+        @param blocking: See run().
+        @return: List of CommandResult, one per command.
+        """
+        line = self._send(make_batch_request(commands, shell, chdir), blocking)
+        if line is None:
+            return None
+
+        return parse_batch_response(commands, line)
+
+    def _write(self, request):
+        if not self._is_connected():
+            self.close()
+            self._connect()
+
+        self.stdin.write(request)
+        self.stdin.flush()
+
+    def _send(self, request, blocking):
+        """
+        @summary: Send request line to the command server and receive response line.
+        @return: Response line or None if the channel is busy and blocking is False.
+        @raise CommandChannelError: The request couldn't be sent, the command wasn't executed.
+        @raise CommandChannelNoReply: The request was sent, but no response came back.
+        """
+        if not self.lock.acquire(blocking):
+            return None
+
+        try:
+            try:
+                self._write(request)
+            except Exception as e:
+                # The transport may be stale, e.g. after device reboot, reconnect once and retry
+                logger.debug("Failed to send request to {}, reconnecting: {}".format(self.host, repr(e)))
+                self.close()
+                try:
+                    self._write(request)
+                except Exception as e:
+                    self.close()
+                    raise CommandChannelError("Failed to send request to {}: {}".format(self.host, repr(e)))
+
+            try:
+                line = self.stdout.readline()
+            except Exception as e:
+                self.close()
+                raise CommandChannelNoReply("Failed to receive response from {}: {}".format(self.host, repr(e)))
+            if not line:
+                self.close()
+                raise CommandChannelNoReply("Command server on {} closed the connection".format(self.host))
+            return line
+        finally:
+            self.lock.release()
@@ -0,0 +1,72 @@
+"""
+Command server, which is started on the device by the persistent command channel (see command_channel.py).
+
+The server reads requests from stdin and writes responses to stdout, one JSON document per line.
+Request: {"cmd": "show version", "shell": false, "chdir": null}
+Response: {"rc": 0, "stdout": "...", "stderr": "...", "start": "...", "end": "...", "delta": "..."}
+
+Several commands can be sent in one batch request, they are executed one by one:
+Request: {"batch": [{"cmd": "show version"}, {"cmd": "show uptime"}]}
+Response: {"results": [{"rc": 0, ...}, {"rc": 0, ...}]}
+"""
+import datetime
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+
+def run_command(request):
+    """
+    @summary: Run a command and collect its output.
+    @param request: Dictionary describing the command to run.
+    @return: Dictionary with the command results.
+    """
+    cmd = request["cmd"]
+    shell = request.get("shell", False)
+    args = cmd if shell else shlex.split(cmd)
+
+    start = datetime.datetime.now()
+    try:
+        with open(os.devnull) as devnull:
+            proc = subprocess.Popen(args, shell=shell, cwd=request.get("chdir"), stdin=devnull,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = proc.communicate()
+        rc = proc.returncode
+    except OSError as e:
+        stdout, stderr = b"", str(e).encode("utf-8")
+        rc = e.errno
+    end = datetime.datetime.now()
+
+    return {
+        "rc": rc,
+        "stdout": stdout.decode("utf-8", "replace"),
+        "stderr": stderr.decode("utf-8", "replace"),
+        "start": str(start),
+        "end": str(end),
+        "delta": str(end - start)
+    }
+
+
+def main():
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+
+        try:
+            request = json.loads(line)
+            if "batch" in request:
+                response = {"results": [run_command(item) for item in request["batch"]]}
+            else:
+                response = run_command(request)
+        except Exception as e:
+            response = {"rc": 1, "stdout": "", "stderr": "", "msg": repr(e)}
+
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-import time
 import logging
 
+from utilities import wait_until_all
+
 logger = logging.getLogger(__name__)
 
 config_sources = ['config_db', 'minigraph']
@@ -11,7 +12,7 @@ def config_reload(duthost, config_source='config_db', wait=120):
     reload SONiC configuration
     :param duthost: DUT host object
     :param config_source: configuration source either 'config_db' or 'minigraph'
-    :param wait: wait timeout for DUT to initialize after configuration reload
+    :param wait: maximum time to wait for DUT to initialize after configuration reload
     :return:
     """
 
@@ -30,4 +31,21 @@ def config_reload(duthost, config_source='config_db', wait=120):
     if config_source == 'config_db':
         duthost.command('config reload -y')
 
-    time.sleep(wait)
+    duthost.invalidate_facts()
+
+    wait_dut_ready(duthost, wait)
+
+
+def wait_dut_ready(duthost, timeout):
+    """
+    wait for critical services to start and BGP sessions to come up after configuration reload or reboot
+    :param duthost: DUT host object
+    :param timeout: maximum time to wait
+    :return: True if DUT is ready in time
+    """
+    logger.info('waiting up to {} seconds for DUT to initialize'.format(timeout))
+    ready = wait_until_all(timeout, [duthost.critical_services_fully_started, duthost.bgp_sessions_established],
+                           interval=5)
+    if not ready:
+        logger.warning('DUT is not fully initialized after {} seconds'.format(timeout))
+    return ready
@@ -7,13 +7,22 @@ modules, we have no other choice, at least for interacting with SONiC, localhost
 
 We can consider using netmiko for interacting with the VMs used in testing.
 """
+import copy
 import json
 import logging
 import os
-from multiprocessing.pool import ThreadPool
+import pipes
+import re
+import threading
 
 from errors import RunAnsibleModuleFail
 from errors import UnsupportedAnsibleModule
+from errors import CommandChannelError
+from errors import CommandChannelNoReply
+from command_channel import CommandChannel, COMMAND_SERVER
+from command_channel import make_failure_result
+from command_channel import make_batch_request, parse_batch_response
+from parallel import ParallelTask, submit
 
 class AnsibleHostBase(object):
     """
@@ -25,6 +34,10 @@ class AnsibleHostBase(object):
     """
 
     def __init__(self, ansible_adhoc, hostname):
+        self.command_channel = None
+        # Module selected by __getattr__ is stored per thread, the same object can be used by operations running in
+        # parallel, see common/parallel.py
+        self._selected = threading.local()
         if hostname == 'localhost':
             self.host = ansible_adhoc(inventory='localhost', connection='local', host_pattern=hostname)[hostname]
         else:
@@ -33,23 +46,107 @@ class AnsibleHostBase(object):
 
     def __getattr__(self, item):
         if self.host.has_module(item):
-            self.module_name = item
-            self.module = getattr(self.host, item)
+            self._selected.module_name = item
+            self._selected.module = getattr(self.host, item)
 
             return self._run
         else:
             raise UnsupportedAnsibleModule("Unsupported module")
 
+    @property
+    def module_name(self):
+        return self._selected.module_name
+
+    @property
+    def module(self):
+        return self._selected.module
+
+    def open_command_channel(self, username, password):
+        """
+        @summary: Run plain 'command' and 'shell' modules through a persistent command channel to the host instead of
+            executing ansible modules. Other modules and calls with module arguments not supported by the channel are
+            still executed by ansible.
+        @param username: SSH username.
+        @param password: SSH password.
+        """
+        host_vars = self.host.options["inventory_manager"].get_host(self.hostname).get_vars()
+        self.command_channel = CommandChannel(host_vars.get("ansible_host", self.hostname), username, password)
+
+    def close_command_channel(self):
+        """
+        @summary: Close the persistent command channel, all modules are executed by ansible after that.
+        """
+        if self.command_channel is not None:
+            self.command_channel.close()
+            self.command_channel = None
+
+    def _run_command_channel(self, module_args, complex_args):
+        """
+        @summary: Run 'command' or 'shell' module through the persistent command channel.
+        @return: Result in the format of the module result, or None if the command channel can't be used for the call
+            or the command couldn't be sent through it. A command which was sent is never run again, if its result
+            didn't come back, a failed result is returned.
+        """
+        if self.command_channel is None or self.module_name not in ("command", "shell"):
+            return None
+        if len(module_args) != 1 or set(complex_args) - set(["chdir"]):
+            return None
+
+        try:
+            # Don't wait for the channel if it is busy, e.g. with a command running in another thread
+            return self.command_channel.run(module_args[0], shell=(self.module_name == "shell"),
+                                            chdir=complex_args.get("chdir"), blocking=False)
+        except CommandChannelNoReply as e:
+            # The command may have been executed, e.g. reboot, running it again by ansible is not safe
+            logging.warning("Command channel to {} failed: {}".format(self.hostname, str(e)))
+            return make_failure_result(module_args[0], str(e))
+        except CommandChannelError as e:
+            logging.warning("Command channel to {} failed, running the command by ansible: {}".format(self.hostname, str(e)))
+            return None
+
+    def run_batch(self, commands, shell=True, chdir=None):
+        """
+        @summary: Run several commands on the host in one round trip. The commands are executed one by one, failure
+            of a command doesn't stop execution of the next ones and doesn't raise exception.
+        @param commands: List of command lines to run.
+        @param shell: Run the commands through the shell, like the ansible 'shell' module does.
+        @param chdir: Change into this directory before running each command.
+        @return: List of results in the format of ansible 'command' and 'shell' modules result, one per command.
+        """
+        if self.command_channel is not None:
+            try:
+                results = self.command_channel.run_batch(commands, shell=shell, chdir=chdir, blocking=False)
+            except CommandChannelNoReply as e:
+                # The commands may have been executed, don't run them again
+                raise RunAnsibleModuleFail("run batch of commands on {} failed, errmsg {}".format(self.hostname, str(e)))
+            except CommandChannelError as e:
+                logging.warning("Command channel to {} failed, running the commands by ansible: {}".format(self.hostname, str(e)))
+                results = None
+            if results is not None:
+                return results
+
+        # Without the command channel run the command server for one batch in one 'shell' module call
+        with open(COMMAND_SERVER) as f:
+            server = f.read()
+        res = self.shell("python -c {}".format(pipes.quote(server)), stdin=make_batch_request(commands, shell, chdir))
+        return parse_batch_response(commands, res["stdout"])
+
     def _run(self, *module_args, **complex_args):
         module_ignore_errors = complex_args.pop('module_ignore_errors', False)
         module_async = complex_args.pop('module_async', False)
 
+        res = None if module_async else self._run_command_channel(module_args, complex_args)
+        if res is not None:
+            if res.is_failed and not module_ignore_errors:
+                raise RunAnsibleModuleFail("run module {} failed, errmsg {}".format(self.module_name, res))
+            return res
+
         if module_async:
+            module = self.module
             def run_module(module_args, complex_args):
-                return self.module(*module_args, **complex_args)[self.hostname]
-            pool = ThreadPool()
-            result = pool.apply_async(run_module, (module_args, complex_args))
-            return pool, result
+                return module(*module_args, **complex_args)[self.hostname]
+            return submit(ParallelTask("{} {}".format(self.hostname, self.module_name), run_module,
+                                       (module_args, complex_args)))
 
         res = self.module(*module_args, **complex_args)[self.hostname]
         if res.is_failed and not module_ignore_errors:
@@ -88,11 +185,59 @@ class SonicHost(AnsibleHostBase):
     """
     CRITICAL_SERVICES = ["swss", "syncd", "database", "teamd", "bgp", "pmon", "lldp"]
 
+    # Results of these modules are cached, see _run()
+    CACHED_FACTS_MODULES = ["minigraph_facts", "config_facts", "setup", "interface_facts"]
+    # Commands which change DUT configuration or state, running them invalidates the cached facts
+    STATE_CHANGING_COMMANDS = re.compile(r"(^|[;&|(]\s*)(sudo\s+)?(config|reboot|fast-reboot|warm-reboot)(\s|$)|"
+                                         r"sonic-cfggen\s.*(-w\b|--write-to-db)|redis-cli\s.*-n\s*4\b|CONFIG_DB|"
+                                         r"config_db\.json")
+
+    # Cached facts are shared by all the instances during the test session, map hostname -> {key: result}
+    _facts_cache = {}
+
     def __init__(self, ansible_adhoc, hostname, gather_facts=False):
         AnsibleHostBase.__init__(self, ansible_adhoc, hostname)
         if gather_facts:
             self.gather_facts()
 
+    def _run(self, *module_args, **complex_args):
+        """
+        @summary: Run ansible module, results of the modules from CACHED_FACTS_MODULES are cached.
+
+        Cached result is returned if the module was already run with the same arguments. Pass
+        'module_refresh_facts=True' to run the module and update the cached result. All cached results are dropped
+        by invalidate_facts(), which is also called when a command from STATE_CHANGING_COMMANDS is run.
+        """
+        refresh_facts = complex_args.pop('module_refresh_facts', False)
+
+        if self.module_name in ("command", "shell") and module_args and \
+                self.STATE_CHANGING_COMMANDS.search(str(module_args[0])):
+            self.invalidate_facts()
+
+        if self.module_name not in self.CACHED_FACTS_MODULES or complex_args.get('module_async', False):
+            return AnsibleHostBase._run(self, *module_args, **complex_args)
+
+        key_args = dict((k, v) for k, v in complex_args.items() if k != 'module_ignore_errors')
+        key = json.dumps([self.module_name, module_args, key_args], sort_keys=True, default=str)
+        cache = self._facts_cache.setdefault(self.hostname, {})
+        if refresh_facts or key not in cache:
+            res = AnsibleHostBase._run(self, *module_args, **complex_args)
+            if res.is_failed:
+                return res
+            cache[key] = res
+        else:
+            logging.debug("Using cached result of module {} on {}".format(self.module_name, self.hostname))
+
+        return copy.deepcopy(cache[key])
+
+    def invalidate_facts(self):
+        """
+        @summary: Drop all cached facts of the SONiC switch. Should be called after operations changing the switch
+            configuration or state: config reload, reboot, port toggle, etc.
+        """
+        logging.debug("Invalidate cached facts of {}".format(self.hostname))
+        self._facts_cache.pop(self.hostname, None)
+
     def _platform_info(self):
         platform_info = self.command("show platform summary")["stdout_lines"]
         for line in platform_info:
@@ -103,12 +248,17 @@ class SonicHost(AnsibleHostBase):
             elif line.startswith("ASIC:"):
                 self.facts["asic_type"] = line.split(":")[1].strip()
 
-    def gather_facts(self):
+    def gather_facts(self, refresh=False):
         """
         @summary: Gather facts of the SONiC switch and store the gathered facts in the dict type 'facts' attribute.
+        @param refresh: Gather facts even if they are cached.
         """
-        self.facts = {}
-        self._platform_info()
+        cache = self._facts_cache.setdefault(self.hostname, {})
+        if refresh or "platform_info" not in cache:
+            self.facts = {}
+            self._platform_info()
+            cache["platform_info"] = self.facts
+        self.facts = dict(cache["platform_info"])
         logging.debug("SonicHost facts: %s" % json.dumps(self.facts))
 
     def get_service_props(self, service, props=["ActiveState", "SubState"]):
@@ -123,13 +273,26 @@ class SonicHost(AnsibleHostBase):
                 "SubState": "running"
             }
         """
+        return self.get_services_props([service], props)[service]
+
+    def get_services_props(self, services, props=["ActiveState", "SubState"]):
+        """
+        @summary: Get properties of several services in one round trip. See get_service_props().
+        @param services: List of service names.
+        @param props: Properties of the services to be shown.
+        @return: Returns a dictionary of service name to dictionary of its properties.
+        """
         props = " ".join(["-p %s" % prop for prop in props])
-        output = self.command("systemctl %s show %s" % (props, service))
+        outputs = self.run_batch(["systemctl %s show %s" % (props, service) for service in services])
         result = {}
-        for line in output["stdout_lines"]:
-            fields = line.split("=")
-            if len(fields) >= 2:
-                result[fields[0]] = fields[1]
+        for service, output in zip(services, outputs):
+            if output.is_failed:
+                raise RunAnsibleModuleFail("get properties of service {} failed, errmsg {}".format(service, output))
+            result[service] = {}
+            for line in output["stdout_lines"]:
+                fields = line.split("=")
+                if len(fields) >= 2:
+                    result[service][fields[0]] = fields[1]
         return result
 
     def is_service_fully_started(self, service):
@@ -155,13 +318,29 @@ class SonicHost(AnsibleHostBase):
         """
         @summary: Check whether all the SONiC critical services have started
         """
+        outputs = self.run_batch(["docker inspect -f \{\{.State.Running\}\} %s" % service
+                                  for service in self.CRITICAL_SERVICES])
         result = {}
-        for service in self.CRITICAL_SERVICES:
-            result[service] = self.is_service_fully_started(service)
+        for service, output in zip(self.CRITICAL_SERVICES, outputs):
+            result[service] = output["rc"] == 0 and output["stdout"].strip() == "true"
 
         logging.info("Status of critical services: %s" % str(result))
         return all(result.values())
 
+    def bgp_sessions_established(self):
+        """
+        @summary: Check whether BGP sessions with all the neighbors from running configuration, which are not admin
+            down, are established. Neighbors in VRFs other than default are not checked.
+        """
+        cfg_neighbors = self.config_facts(host=self.hostname, source="running")["ansible_facts"].get("BGP_NEIGHBOR", {})
+        bgp_neighbors = self.bgp_facts()["ansible_facts"]["bgp_neighbors"]
+
+        not_established = [ip for ip, attrs in cfg_neighbors.items()
+                           if "|" not in ip and attrs.get("admin_status", "up") != "down" and
+                           bgp_neighbors.get(ip.lower(), {}).get("state") != "established"]
+        logging.info("BGP sessions not established: %s" % str(not_established))
+        return len(not_established) == 0
+
 
     def get_crm_resources(self):
         """
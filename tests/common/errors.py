@@ -6,3 +6,16 @@ class UnsupportedAnsibleModule(Exception):
 
 class RunAnsibleModuleFail(Exception):
     pass
+
+class CommandChannelError(Exception):
+    pass
+
+class CommandChannelNoReply(CommandChannelError):
+    """
+    Request was sent through the command channel, but its result didn't come back. The command may have been
+    executed, so it must not be run again.
+    """
+    pass
+
+class ParallelRunError(Exception):
+    pass
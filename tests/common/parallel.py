@@ -0,0 +1,226 @@
+"""
+Shared executor for running operations on testbed hosts concurrently.
+
+Operations on DUT, PTF, localhost and fanout hosts are mostly waiting for the remote side, so running independent
+operations at the same time, e.g. pushing PTF configuration while DUT is being configured, saves a lot of time.
+All the operations are executed by one bounded pool of threads shared by the whole test session, so that tests
+don't need to create their own thread pools.
+
+Example:
+    ptf_task = run_async(ptfhost.shell, "/tmp/ptf_cfg.sh")
+    duthost.shell("/tmp/dut_cfg.sh")
+    ptf_task.get()
+
+    results = run_parallel([("ptf", ptfhost.command, ("supervisorctl update",), {}),
+                            ("dut", duthost.command, ("config save -y",), {})])
+    results["dut"].result["stdout"]
+"""
+import atexit
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from errors import ParallelRunError
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 16
+
+_pool = None
+_pool_lock = threading.Lock()
+_worker = threading.local()
+
+
+def _get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(MAX_WORKERS)
+            atexit.register(_close_pool)
+        return _pool
+
+
+def _close_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+class ParallelTask(object):
+    """
+    @summary: Operation submitted to the shared executor.
+
+    After the task is done, it holds either the result returned by the operation or the exception raised by it,
+    together with the time the operation took.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+    def __init__(self, name, func, args=(), kwargs=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.state = self.PENDING
+        self.result = None
+        self.exception = None
+        self.traceback = None
+        self.duration = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        """
+        @summary: Run the operation in the current thread, if the task was not cancelled.
+        """
+        with self._lock:
+            if self.state != self.PENDING:
+                return
+            self.state = self.RUNNING
+
+        start = time.time()
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.exception = e
+            self.traceback = "".join(traceback.format_exception(*sys.exc_info()))
+            logger.debug("Task '%s' failed: %s" % (self.name, self.traceback))
+        finally:
+            self.duration = time.time() - start
+            self.state = self.DONE
+            self._done.set()
+
+    def cancel(self):
+        """
+        @summary: Cancel the task. Operation which is already running can't be interrupted, it is left to finish
+            in background.
+        @return: True if the task was cancelled before it started.
+        """
+        with self._lock:
+            if self.state != self.PENDING:
+                return False
+            self.state = self.CANCELLED
+
+        self._done.set()
+        return True
+
+    def ready(self):
+        return self._done.is_set()
+
+    def successful(self):
+        return self.state == self.DONE and self.exception is None
+
+    def wait(self, timeout=None):
+        """
+        @summary: Wait for the task to finish or to be cancelled.
+        @return: True if the task is finished or cancelled, False on timeout.
+        """
+        # Event.wait() without timeout can't be interrupted by KeyboardInterrupt in python2
+        if timeout is None:
+            while not self._done.wait(1):
+                pass
+            return True
+        return self._done.wait(timeout)
+
+    def get(self, timeout=None):
+        """
+        @summary: Wait for the task and get the result of the operation.
+        @param timeout: Time in seconds to wait for the task, wait forever if None.
+        @return: Value returned by the operation. Exception raised by the operation is re-raised.
+        """
+        if not self.wait(timeout):
+            raise TimeoutError("Task '{}' is not finished in {} seconds".format(self.name, timeout))
+        if self.state == self.CANCELLED:
+            raise ParallelRunError("Task '{}' was cancelled".format(self.name))
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+def _run_task(task):
+    _worker.active = True
+    task.run()
+
+
+def submit(task):
+    """
+    @summary: Submit task to the shared executor.
+
+    If called from an operation which is running in the executor, the task is run in a separate thread. Waiting
+    in a worker for other tasks to be picked up by the same bounded pool could block forever.
+    @param task: ParallelTask instance.
+    @return: The submitted task.
+    """
+    if getattr(_worker, "active", False):
+        thread = threading.Thread(name=task.name, target=_run_task, args=(task,))
+        thread.daemon = True
+        thread.start()
+    else:
+        _get_pool().apply_async(_run_task, (task,))
+    return task
+
+
+def run_async(func, *args, **kwargs):
+    """
+    @summary: Run one operation in background.
+    @param func: Callable to run, e.g. duthost.shell.
+    @param args: Positional arguments for the callable.
+    @param kwargs: Keyword arguments for the callable.
+    @return: ParallelTask instance.
+    """
+    return submit(ParallelTask(getattr(func, "__name__", repr(func)), func, args, kwargs))
+
+
+def run_parallel(tasks, timeout=None, fail_fast=True, ignore_errors=False):
+    """
+    @summary: Run operations concurrently and wait for all of them.
+    @param tasks: List of tuples (name, func, args, kwargs), args and kwargs can be omitted.
+    @param timeout: Time in seconds to wait for all the operations, wait forever if None.
+    @param fail_fast: Cancel operations which are not started yet when an operation fails.
+    @param ignore_errors: Return results of all the operations instead of raising ParallelRunError when an
+        operation failed, was cancelled or didn't finish in time.
+    @return: OrderedDict of ParallelTask instances keyed by task name, in the order of the tasks list.
+    """
+    results = OrderedDict()
+    for item in tasks:
+        task = ParallelTask(*item)
+        if task.name in results:
+            raise ValueError("Duplicated task name '{}'".format(task.name))
+        results[task.name] = task
+
+    for task in results.values():
+        submit(task)
+
+    deadline = None if timeout is None else time.time() + timeout
+    for task in results.values():
+        remaining = None if deadline is None else max(deadline - time.time(), 0)
+        if not task.wait(remaining):
+            break
+        if fail_fast and task.exception is not None:
+            break
+
+    for task in results.values():
+        task.cancel()
+
+    if ignore_errors:
+        return results
+
+    failed = [task for task in results.values() if not task.successful()]
+    if failed:
+        msg = ["{}: {}".format(task.name, repr(task.exception) if task.exception is not None else task.state)
+               for task in failed]
+        raise ParallelRunError("Parallel run failed for {} of {} tasks: {}".format(len(failed), len(results),
+                                                                                  "; ".join(msg)))
+
+    return results
@@ -1,7 +1,8 @@
-import time
 import logging
 import pprint
 
+from utilities import wait_until_all
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,7 +12,7 @@ def port_toggle(duthost, ports=None, wait=60, wait_after_ports_up=60):
     :param duthost: DUT host object
     :param ports: specify list of ports, None if toggle all ports
     :param wait: time to wait for interface to become up
-    :param wait_after_ports_up: time to wait after interfaces become up
+    :param wait_after_ports_up: time to wait for BGP sessions after interfaces become up
     :return:
     """
 
@@ -24,25 +25,25 @@ def port_toggle(duthost, ports=None, wait=60, wait_after_ports_up=60):
 
     for port in ports:
         duthost.command('config interface shutdown {}'.format(port))
+    duthost.invalidate_facts()
 
     # verify all interfaces are up
-    ports_down = duthost.interface_facts(up_ports=ports)['ansible_facts']['ansible_interface_link_down_ports']
+    ports_down = duthost.interface_facts(up_ports=ports, module_refresh_facts=True)['ansible_facts']['ansible_interface_link_down_ports']
     assert len(ports_down) == len(ports)
 
     for port in ports:
         duthost.command('config interface startup {}'.format(port))
+    duthost.invalidate_facts()
 
     logger.info('waiting for ports to become up')
 
-    start = time.time()
-    ports_down = duthost.interface_facts(up_ports=ports)['ansible_facts']['ansible_interface_link_down_ports']
-    while time.time() - start < wait:
-        ports_down = duthost.interface_facts(up_ports=ports)['ansible_facts']['ansible_interface_link_down_ports']
-        logger.info('retry, down ports:\n{}'.format(pprint.pformat(ports_down)))
-        if len(ports_down) == 0:
-            break
+    def all_ports_up():
+        ports_down = duthost.interface_facts(up_ports=ports, module_refresh_facts=True)['ansible_facts']['ansible_interface_link_down_ports']
+        logger.info('down ports:\n{}'.format(pprint.pformat(ports_down)))
+        return len(ports_down) == 0
 
-    assert len(ports_down) == 0
+    assert wait_until_all(wait, [all_ports_up], interval=1, max_interval=10), 'Not all ports are up'
 
-    logger.info('wait {} seconds for system to startup'.format(wait_after_ports_up))
-    time.sleep(wait_after_ports_up)
+    logger.info('wait up to {} seconds for BGP sessions to come up'.format(wait_after_ports_up))
+    if not wait_until_all(wait_after_ports_up, [duthost.bgp_sessions_established]):
+        logger.warning('Not all BGP sessions are established after {} seconds'.format(wait_after_ports_up))
@@ -1,7 +1,7 @@
-import time
 import logging
-from multiprocessing.pool import ThreadPool, TimeoutError
-from ansible_host import AnsibleModuleException
+from parallel import run_async
+from utilities import wait_until
+from config_reload import wait_dut_ready
 
 logger = logging.getLogger(__name__)
 
@@ -26,12 +26,10 @@ def reboot(duthost, localhost, reboot_type='cold', delay=10, timeout=180, wait=1
     :param reboot_type: reboot type (cold, fast, warm)
     :param delay: delay between ssh availability checks
     :param timeout: timeout for waiting ssh port state change
-    :param wait: time to wait for DUT to initialize
+    :param wait: maximum time to wait for DUT to initialize
     :return:
     """
 
-    # pool for executing tasks asynchronously
-    pool = ThreadPool()
     dut_ip = duthost.setup()['ansible_facts']['ansible_eth0']['ipv4']['address']
 
     try:
@@ -43,7 +41,8 @@ def reboot(duthost, localhost, reboot_type='cold', delay=10, timeout=180, wait=1
         logger.info('rebooting with command "{}"'.format(reboot_command))
         return duthost.command(reboot_command)
 
-    reboot_res = pool.apply_async(execute_reboot)
+    reboot_res = run_async(execute_reboot)
+    duthost.invalidate_facts()
 
     logger.info('waiting for ssh to drop')
     res = localhost.wait_for(host=dut_ip,
@@ -75,28 +74,20 @@ def reboot(duthost, localhost, reboot_type='cold', delay=10, timeout=180, wait=1
 
     logger.info('ssh has started up')
 
-    logger.info('waiting for switch to initialize')
-    time.sleep(wait)
+    wait_dut_ready(duthost, wait)
 
     if reboot_type == 'warm':
         logger.info('waiting for warmboot-finalizer service to finish')
         res = duthost.command('systemctl is-active warmboot-finalizer.service',module_ignore_errors=True)
         finalizer_state = res['stdout'].strip()
         assert finalizer_state == 'activating'
-        count = 0
-        while finalizer_state == 'activating':
-            try:
-                res = duthost.command('systemctl is-active warmboot-finalizer.service')
-            except AnsibleModuleException as err:
-                res = err.module_result
-
-            finalizer_state = res['stdout'].strip()
-            time.sleep(delay)
-            if count * delay > timeout:
-                raise Exception('warmboot-finalizer.service did not finish')
-            count += 1
+
+        def finalizer_finished():
+            res = duthost.command('systemctl is-active warmboot-finalizer.service', module_ignore_errors=True)
+            return res['stdout'].strip() != 'activating'
+
+        if not wait_until(timeout, delay, finalizer_finished):
+            raise Exception('warmboot-finalizer.service did not finish')
         logger.info('warmboot-finalizer service finished')
 
     logger.info('{} reboot finished'.format(reboot_type))
-
-    pool.terminate()
@@ -1,19 +1,31 @@
+import json
+
 def verify_port(host_facts, ports):
     for port in ports:
         ans_ifname = "ansible_%s" % port
         assert host_facts[ans_ifname]['active'], "Port {} is down!".format(port)
 
 def check_critical_services(duthost):
-    syncd_res = duthost.shell("docker exec -i syncd ps aux | grep /usr/bin/syncd")
-    orchagent_res = duthost.shell("pgrep orchagent -a")
+    syncd_res, orchagent_res = duthost.run_batch(["docker exec -i syncd ps aux | grep /usr/bin/syncd",
+                                                  "pgrep orchagent -a"])
 
     assert syncd_res[u'rc'] == 0, "Syncd is not running!"
     assert orchagent_res[u'rc'] == 0, "Orchagent is not running!"
 
 def check_links_up(duthost):
-    config_facts = duthost.config_facts(host=duthost.hostname, source="persistent")['ansible_facts']
-    host_facts = duthost.setup()['ansible_facts']
+    # Get persistent PORT configuration and operational state of interfaces in one round trip, instead of
+    # running 'config_facts' and 'setup' modules
+    port_res, operstate_res = duthost.run_batch(["sonic-cfggen -j /etc/sonic/config_db.json --var-json PORT",
+                                                 "grep -H . /sys/class/net/*/operstate"])
+    assert port_res[u'rc'] == 0, "Failed to get PORT configuration: {}".format(port_res)
+    port_config = json.loads(port_res['stdout'])
+
+    # Interface is active in host facts if its operstate is not 'down', same check is done here
+    host_facts = {}
+    for line in operstate_res['stdout_lines']:
+        path, operstate = line.rsplit(':', 1)
+        host_facts["ansible_%s" % path.split('/')[-2]] = {'active': operstate != 'down'}
 
-    admin_up_ports = { key:value for (key,value) in config_facts['PORT'].items() if value.get('admin_status', 'down') == 'up' }
+    admin_up_ports = { key:value for (key,value) in port_config.items() if value.get('admin_status', 'down') == 'up' }
     ports = admin_up_ports.keys()
     verify_port(host_facts, ports)
@@ -3,6 +3,11 @@ Utility functions can re-used in testing scripts.
 """
 import time
 import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+
+from parallel import run_parallel
 
 
 def wait(seconds, msg=""):
@@ -13,6 +18,103 @@ def wait(seconds, msg=""):
     """
     logging.debug("Pause %d seconds, reason: %s" % (seconds, msg))
     time.sleep(seconds)
+    _wait_records.append(WaitRecord("pause: %s" % msg, seconds, seconds, True))
+
+
+class Deadline(object):
+    """
+    @summary: Time budget shared by several waits.
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.time() + budget
+
+    def remaining(self):
+        return max(self.expires - time.time(), 0)
+
+    def expired(self):
+        return self.remaining() == 0
+
+
+# Budgets entered with wait_budget(), every wait is limited by all of them
+_budgets = []
+
+# Durations of all the waits done during the test session, see get_wait_records()
+_wait_records = []
+
+WaitRecord = namedtuple("WaitRecord", ["name", "timeout", "duration", "result"])
+
+
+@contextmanager
+def wait_budget(budget):
+    """
+    @summary: Limit total time of all the waits done in the context, e.g. by a test and the helpers called by it.
+        Wait which would exceed the budget is shortened, it returns False if its condition is not met in time.
+    @param budget: Time budget in seconds.
+    """
+    deadline = Deadline(budget)
+    _budgets.append(deadline)
+    try:
+        yield deadline
+    finally:
+        _budgets.remove(deadline)
+
+
+def get_wait_records():
+    """
+    @summary: Get durations of the waits done so far.
+    @return: List of WaitRecord, in the order the waits were done.
+    """
+    return list(_wait_records)
+
+
+def _condition_name(condition):
+    name = getattr(condition, "__name__", None)
+    if name is None and isinstance(condition, partial):
+        name = getattr(condition.func, "__name__", None)
+    return name if name is not None else repr(condition)
+
+
+def _check(condition, *args, **kwargs):
+    try:
+        return condition(*args, **kwargs)
+    except Exception as e:
+        logging.debug("Exception caught while checking %s: %s" % (_condition_name(condition), repr(e)))
+        return False
+
+
+def _poll(name, timeout, interval, check, backoff=1, max_interval=None, deadline=None):
+    """
+    @summary: Call check function until it returns True or timeout. The last check is done at the timeout, the
+        interval between checks is multiplied by backoff after every check, up to max_interval.
+    @return: Tuple (result, duration).
+    """
+    start_time = time.time()
+    for budget in _budgets + ([deadline] if deadline is not None else []):
+        timeout = min(timeout, budget.remaining())
+    end_time = start_time + timeout
+
+    while True:
+        result = check()
+        now = time.time()
+        if result or now >= end_time:
+            break
+
+        sleep_time = min(interval, end_time - now)
+        logging.debug("%s is False, wait %.1f seconds and check again" % (name, sleep_time))
+        time.sleep(sleep_time)
+        interval *= backoff
+        if max_interval is not None:
+            interval = min(interval, max_interval)
+
+    duration = time.time() - start_time
+    _wait_records.append(WaitRecord(name, timeout, duration, bool(result)))
+    if result:
+        logging.info("%s is True after %.1f seconds" % (name, duration))
+    else:
+        logging.info("%s is still False after %.1f seconds" % (name, duration))
+
+    return result, duration
 
 
 def wait_until(timeout, interval, condition, *args, **kwargs):
@@ -26,27 +128,70 @@ def wait_until(timeout, interval, condition, *args, **kwargs):
     @return: If the condition function returns True before timeout, return True. If the condition function raises an
         exception, log the error and keep waiting and polling.
     """
-    logging.debug("Wait until %s is True, timeout is %s seconds, checking interval is %s" % \
-        (condition.__name__, timeout, interval))
-    start_time = time.time()
-    elapsed_time = 0
-    while elapsed_time < timeout:
-        logging.debug("Time elapsed: %f seconds" % elapsed_time)
-
-        try:
-            check_result = condition(*args, **kwargs)
-        except Exception as e:
-            logging.debug("Exception caught while checking %s: %s" % (condition.__name__, repr(e)))
-            check_result = False
-
-        if check_result:
-            logging.debug("%s is True, exit early with True" % condition.__name__)
-            return True
+    name = _condition_name(condition)
+    logging.debug("Wait until %s is True, timeout is %s seconds, checking interval is %s" % (name, timeout, interval))
+
+    result, _ = _poll(name, timeout, interval, lambda: _check(condition, *args, **kwargs))
+    return bool(result)
+
+
+def _wait_for_conditions(conditions, wait_all, timeout, interval, backoff, max_interval, deadline):
+    """
+    @summary: Check the conditions concurrently until all or any of them are True, see wait_until_all() and
+        wait_until_any().
+    """
+    pending = list(conditions)
+    satisfied = []
+
+    def check():
+        if len(pending) == 1:
+            results = [_check(pending[0])]
         else:
-            logging.debug("%s is False, wait %d seconds and check again" % (condition.__name__, interval))
-            time.sleep(interval)
-            elapsed_time = time.time() - start_time
+            tasks = run_parallel([(str(i), _check, (condition,)) for i, condition in enumerate(pending)],
+                                 ignore_errors=True, fail_fast=False)
+            results = [task.result for task in tasks.values()]
 
-    if elapsed_time >= timeout:
-        logging.debug("%s is still False after %d seconds, exit with False" % (condition.__name__, timeout))
-        return False
+        for condition, result in zip(list(pending), results):
+            if result:
+                pending.remove(condition)
+                satisfied.append(condition)
+
+        if wait_all:
+            logging.debug("Conditions still False: %s" % ", ".join(_condition_name(c) for c in pending))
+            return not pending
+        return len(satisfied) > 0
+
+    name = (" and " if wait_all else " or ").join(_condition_name(c) for c in conditions)
+    result, _ = _poll(name, timeout, interval, check, backoff, max_interval, deadline)
+    return result, satisfied
+
+
+def wait_until_all(timeout, conditions, interval=1, backoff=2, max_interval=20, deadline=None):
+    """
+    @summary: Wait until all the conditions are True or timeout. The conditions are checked concurrently, condition
+        which has become True is not checked again.
+    @param timeout: Maximum time to wait
+    @param conditions: List of functions that return False or True, use functools.partial to pass arguments.
+    @param interval: Initial poll interval
+    @param backoff: Poll interval is multiplied by this factor after every check
+    @param max_interval: Maximum poll interval
+    @param deadline: Optional Deadline, the wait is limited by its remaining time.
+    @return: True if all the conditions are True before timeout.
+    """
+    result, _ = _wait_for_conditions(conditions, True, timeout, interval, backoff, max_interval, deadline)
+    return result
+
+
+def wait_until_any(timeout, conditions, interval=1, backoff=2, max_interval=20, deadline=None):
+    """
+    @summary: Wait until any of the conditions is True or timeout. The conditions are checked concurrently.
+    @param timeout: Maximum time to wait
+    @param conditions: List of functions that return False or True, use functools.partial to pass arguments.
+    @param interval: Initial poll interval
+    @param backoff: Poll interval is multiplied by this factor after every check
+    @param max_interval: Maximum poll interval
+    @param deadline: Optional Deadline, the wait is limited by its remaining time.
+    @return: The first condition which is True, None if no condition is True before timeout.
+    """
+    result, satisfied = _wait_for_conditions(conditions, False, timeout, interval, backoff, max_interval, deadline)
+    return satisfied[0] if result else None
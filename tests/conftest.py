@@ -15,6 +15,7 @@ from loganalyzer import LogAnalyzer
 from common.sanity_check import check_critical_services, check_links_up
 
 from common.devices import SonicHost, Localhost, PTFHost
+from common.utilities import wait_budget, get_wait_records
 
 logger = logging.getLogger(__name__)
 pytest_plugins = ('ptf_fixtures',
@@ -67,6 +68,12 @@ def pytest_addoption(parser):
     parser.addoption("--testbed_file", action="store", default=None, help="testbed file name")
     parser.addoption("--disable_loganalyzer", action="store_true", default=False,
                      help="disable loganalyzer analysis for 'loganalyzer' fixture")
+    parser.addoption("--disable_command_channel", action="store_true", default=False,
+                     help="run all DUT commands as ansible modules instead of the persistent command channel")
+    parser.addoption("--wait_budget", action="store", default=None, type=int,
+                     help="maximum total time in seconds a test can spend in waits for conditions")
+    parser.addoption("--fib_wait_established", action="store_true", default=False,
+                     help="wait for the BGP sessions of the exabgp peers in the fib_t0 fixture before announcing routes")
 
     # test_vrf options
     parser.addoption("--vrf_capacity", action="store", default=None, type=int, help="vrf capacity of dut (4-1000)")
@@ -87,13 +94,14 @@ def testbed(request):
 
 
 @pytest.fixture(scope="module")
-def testbed_devices(ansible_adhoc, testbed):
+def testbed_devices(ansible_adhoc, testbed, creds, request):
     """
     @summary: Fixture for creating dut, localhost and other necessary objects for testing. These objects provide
         interfaces for interacting with the devices used in testing.
     @param ansible_adhoc: Fixture provided by the pytest-ansible package. Source of the various device objects. It is
         mandatory argument for the class constructors.
     @param testbed: Fixture for parsing testbed configuration file.
+    @param creds: Fixture for reading lab credentials, used for the DUT command channel.
     @return: Return the created device objects in a dictionary
     """
 
@@ -101,6 +109,9 @@ def testbed_devices(ansible_adhoc, testbed):
         "localhost": Localhost(ansible_adhoc),
         "dut": SonicHost(ansible_adhoc, testbed["dut"], gather_facts=True)}
 
+    if not request.config.getoption("--disable_command_channel"):
+        devices["dut"].open_command_channel(creds["sonicadmin_user"], creds["sonicadmin_password"])
+
     if "ptf" in testbed:
         devices["ptf"] = PTFHost(ansible_adhoc, testbed["ptf"])
     else:
@@ -116,7 +127,9 @@ def testbed_devices(ansible_adhoc, testbed):
     #       from common.devices import FanoutHost
     #       devices["fanout"] = FanoutHost(ansible_adhoc, testbed["dut"])
 
-    return devices
+    yield devices
+
+    devices["dut"].close_command_channel()
 
 def disable_ssh_timout(dut):
     '''
@@ -228,6 +241,32 @@ def pytest_runtest_makereport(item, call):
 
     setattr(item, "rep_" + rep.when, rep)
 
+@pytest.fixture(autouse=True)
+def test_wait_budget(request):
+    """
+    @summary: Limit total time of the waits done by a test, if --wait_budget option is specified.
+    """
+    budget = request.config.getoption("--wait_budget")
+    if budget is None:
+        yield
+    else:
+        with wait_budget(budget):
+            yield
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    @summary: Report the waits which took most of the time.
+    """
+    records = get_wait_records()
+    if not records:
+        return
+
+    terminalreporter.section("wait durations")
+    terminalreporter.write_line("total %.1f seconds in %d waits" % (sum(r.duration for r in records), len(records)))
+    for record in sorted(records, key=lambda r: r.duration, reverse=True)[:10]:
+        terminalreporter.write_line("%8.1fs %s%s" % (record.duration, record.name,
+                                                      "" if record.result else " (not met)"))
+
 def fetch_dbs(duthost, testname):
     dbs = [[0, "appdb"], [1, "asicdb"], [2, "counterdb"], [4, "configdb"]]
     for db in dbs:
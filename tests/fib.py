@@ -1,21 +1,30 @@
 import sys
 import time
 import math
-import requests
+import socket
+import logging
 import pytest
 import ipaddr as ipaddress
 
-def announce_routes(ptfip, port, family, podset_number, tor_number, tor_subnet_number, 
-                    spine_asn, leaf_asn_start, tor_asn_start, 
+from common.parallel import run_parallel
+
+logger = logging.getLogger(__name__)
+
+# Number of routes sent to exabgp between two syncs of the exabgp API stream
+ANNOUNCE_CHUNK_SIZE = 1000
+
+def generate_routes(family, podset_number, tor_number, tor_subnet_number,
+                    spine_asn, leaf_asn_start, tor_asn_start,
                     nexthop, nexthop_v6,
                     tor_subnet_size = 128, max_tor_subnet_number = 16):
-    messages = []
-
+    """
+    @summary: Generate exabgp 'announce route' commands of the t0 fib routes one by one.
+    """
     # default route
     if family in ["v4", "both"]:
-        messages.append("announce route 0.0.0.0/0 next-hop {} as-path [ {} ]".format(nexthop, spine_asn))
+        yield "announce route 0.0.0.0/0 next-hop {} as-path [ {} ]".format(nexthop, spine_asn)
     if family in ["v6", "both"]:
-        messages.append("announce route ::/0 next-hop {} as-path [ {} ]".format(nexthop_v6, spine_asn))
+        yield "announce route ::/0 next-hop {} as-path [ {} ]".format(nexthop_v6, spine_asn)
 
     # NOTE: Using large enough values (e.g., podset_number = 200,
     # us to overflow the 192.168.0.0/16 private address space here.
@@ -47,18 +56,54 @@ def announce_routes(ptfip, port, family, podset_number, tor_number, tor_subnet_n
                     aspath = "{} {} {}".format(spine_asn, leaf_asn, tor_asn)
 
                 if family in ["v4", "both"]:
-                    messages.append("announce route {} next-hop {} as-path [ {} ]".format(prefix, nexthop, aspath))
+                    yield "announce route {} next-hop {} as-path [ {} ]".format(prefix, nexthop, aspath)
                 if family in ["v6", "both"]:
-                    messages.append("announce route {} next-hop {} as-path [ {} ]".format(prefix_v6, nexthop_v6, aspath))
+                    yield "announce route {} next-hop {} as-path [ {} ]".format(prefix_v6, nexthop_v6, aspath)
 
-    url = "http://%s:%d" % (ptfip, port)
-    data = { "commands": ";".join(messages) }
-    r = requests.post(url, data=data)
-    print r
-    assert r.status_code == 200
+def announce_routes(ptfip, port, family, podset_number, tor_number, tor_subnet_number, 
+                    spine_asn, leaf_asn_start, tor_asn_start, 
+                    nexthop, nexthop_v6,
+                    tor_subnet_size = 128, max_tor_subnet_number = 16,
+                    chunk_size = ANNOUNCE_CHUNK_SIZE):
+    """
+    @summary: Announce the t0 fib routes through the exabgp API listening on the port.
+              Routes are generated lazily and streamed over one connection in chunks of chunk_size routes,
+              the next chunk is sent when exabgp has read the previous one.
+    @return: Number of announced routes
+    """
+    routes = generate_routes(family, podset_number, tor_number, tor_subnet_number,
+                             spine_asn, leaf_asn_start, tor_asn_start,
+                             nexthop, nexthop_v6,
+                             tor_subnet_size, max_tor_subnet_number)
+
+    url = "%s:%d" % (ptfip, port)
+    sock = socket.create_connection((ptfip, port))
+    # Stream mode of the exabgp control API, see helpers/http_api.py
+    sock.sendall("stream\n")
+    reply_file = sock.makefile('rb')
+    count = 0
+    start = time.time()
+    try:
+        while True:
+            chunk = [route for _, route in zip(range(chunk_size), routes)]
+            if not chunk:
+                break
+            sock.sendall("".join("%s\n" % route for route in chunk) + "sync\n")
+            count += len(chunk)
+            reply = reply_file.readline().strip()
+            assert reply == "OK %d" % count, "Failed to announce routes to {}: {}".format(url, reply)
+            logger.debug("Announced {} routes to {}".format(count, url))
+    finally:
+        reply_file.close()
+        sock.close()
+
+    duration = time.time() - start
+    logger.info("Announced {} routes to {} in {:.1f} seconds, {:.0f} routes/s".format(
+                count, url, duration, count / duration if duration else 0))
+    return count
 
 @pytest.fixture(scope='module')
-def fib_t0(ptfhost, testbed):
+def fib_t0(ptfhost, testbed, request):
 
     podset_number = 200
     tor_number = 16
@@ -76,6 +121,7 @@ def fib_t0(ptfhost, testbed):
 
     local_ip = ipaddress.IPAddress("10.10.246.254")
     local_ipv6 = ipaddress.IPAddress("fc0a::ff")
+    peers = []
     for k, v in testbed['topo']['properties']['configuration'].items():
         vm_offset = testbed['topo']['properties']['topology']['VMs'][k]['vm_offset']
         peer_ip = ipaddress.IPNetwork(v['bp_interface']['ipv4'])
@@ -84,33 +130,50 @@ def fib_t0(ptfhost, testbed):
         port = 5000 + vm_offset
         port6 = 6000 + vm_offset
 
-        ptfhost.exabgp(name=k,
-                       state="started", \
-                       router_id = str(local_ip), \
-                       local_ip  = str(local_ip), \
-                       peer_ip   = str(peer_ip.ip), \
-                       local_asn = asn, \
-                       peer_asn  = asn, \
-                       port = port)
-
-        ptfhost.exabgp(name="%s-v6" % k,
-                       state="started", \
-                       router_id = str(local_ip), \
-                       local_ip  = str(local_ipv6), \
-                       peer_ip   = str(peer_ipv6.ip), \
-                       local_asn = asn, \
-                       peer_asn  = asn, \
-                       port = port6)
-
+        peers.append(dict(name      = k, \
+                          local_ip  = str(local_ip), \
+                          peer_ip   = str(peer_ip.ip), \
+                          local_asn = asn, \
+                          peer_asn  = asn, \
+                          port      = port))
+
+        peers.append(dict(name      = "%s-v6" % k, \
+                          local_ip  = str(local_ipv6), \
+                          peer_ip   = str(peer_ipv6.ip), \
+                          local_asn = asn, \
+                          peer_asn  = asn, \
+                          port      = port6))
+
+    # start exabgp instances of all peers at once, optionally wait for their BGP sessions
+    wait_established = request.config.getoption("--fib_wait_established")
+    res = ptfhost.exabgp(state="started", \
+                         router_id = str(local_ip), \
+                         peers = peers, \
+                         wait_established = wait_established, \
+                         timeout = 120)
+    for name, peer in sorted(res['peers'].items()):
+        logger.info("exabgp {}: {}, running in {}s{}".format(
+                    name, peer['status'], peer['time_to_running'],
+                    ", established in {}s".format(peer['time_to_established']) if wait_established else ""))
+
+    # every peer has its own exabgp instance, announce routes to all of them at the same time
+    tasks = []
     for k, v in testbed['topo']['properties']['configuration'].items():
         vm_offset = testbed['topo']['properties']['topology']['VMs'][k]['vm_offset']
         port = 5000 + vm_offset
         port6 = 6000 + vm_offset
 
-        announce_routes(ptfip, port, "v4", podset_number, tor_number, tor_subnet_number,
-                        spine_asn, leaf_asn_start, tor_asn_start,
-                        local_ip, local_ipv6)
+        tasks.append((k, announce_routes, (ptfip, port, "v4", podset_number, tor_number, tor_subnet_number,
+                                           spine_asn, leaf_asn_start, tor_asn_start,
+                                           local_ip, local_ipv6)))
+
+        tasks.append(("%s-v6" % k, announce_routes, (ptfip, port6, "v6", podset_number, tor_number, tor_subnet_number,
+                                                     spine_asn, leaf_asn_start, tor_asn_start,
+                                                     local_ip, local_ipv6)))
 
-        announce_routes(ptfip, port6, "v6", podset_number, tor_number, tor_subnet_number,
-                        spine_asn, leaf_asn_start, tor_asn_start,
-                        local_ip, local_ipv6)
+    start = time.time()
+    results = run_parallel(tasks)
+    duration = time.time() - start
+    count = sum(task.result for task in results.values())
+    logger.info("Announced {} routes to {} peers in {:.1f} seconds, {:.0f} routes/s".format(
+                count, len(results), duration, count / duration if duration else 0))
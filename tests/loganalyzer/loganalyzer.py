@@ -1,4 +1,5 @@
 import sys
+import json
 import logging
 import os
 import re
@@ -24,10 +25,12 @@ class LogAnalyzerError(Exception):
 
 
 class LogAnalyzer:
-    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp"):
+    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp", analyze_on_dut=True):
         self.ansible_host = ansible_host
         self.dut_run_dir = dut_run_dir
         self.extracted_syslog = os.path.join(self.dut_run_dir, "syslog")
+        self.regex_file = os.path.join(self.dut_run_dir, "loganalyzer.regex.json")
+        self.analyze_on_dut = analyze_on_dut
         self.marker_prefix = marker_prefix
         self.ansible_loganalyzer = ansible_loganalyzer(self.marker_prefix, False)
 
@@ -35,6 +38,7 @@ class LogAnalyzer:
         self.expect_regex = []
         self.ignore_regex = []
         self._markers = []
+        self._start_positions = {}
 
     def _add_end_marker(self, marker):
         """
@@ -131,12 +135,56 @@ class LogAnalyzer:
         cmd = "python {run_dir}/loganalyzer.py --action init --run_id {start_marker}".format(run_dir=self.dut_run_dir, start_marker=start_marker)
 
         logging.debug("Adding start marker '{}'".format(start_marker))
-        self.ansible_host.command(cmd)
+        # Syslog position before the start marker is used to extract syslog without scanning all rotated files
+        self._start_positions[start_marker] = json.loads(self.ansible_host.command(cmd)["stdout"])
         return start_marker
 
+    def _analyze_on_dut(self, marker):
+        """
+        @summary: Analyze extracted syslog on the DUT. Only regular expressions are sent to the DUT
+                  and only matching lines are sent back, the syslog itself is not downloaded.
+
+        @param marker: Marker obtained from "init" method.
+
+        @return: Tuple of map <file_name, [matching lines, expected lines]> and list of unused expected regexp.
+        """
+        regex = {"match": self.match_regex, "ignore": self.ignore_regex, "expect": self.expect_regex}
+        self.ansible_host.copy(content=json.dumps(regex), dest=self.regex_file)
+
+        cmd = "python {run_dir}/loganalyzer.py --action analyze_json --run_id {marker} --logs {logs} --regex_file {regex_file}".format(
+            run_dir=self.dut_run_dir, marker=marker, logs=self.extracted_syslog, regex_file=self.regex_file)
+        result = json.loads(self.ansible_host.command(cmd)["stdout"])
+
+        analyzer_parse_result = {}
+        for key, matching_lines in result["match_messages"].iteritems():
+            analyzer_parse_result[key] = [matching_lines, result["expect_messages"][key]]
+
+        return analyzer_parse_result, result["unused_expected_regexp"]
+
+    def _analyze_locally(self):
+        """
+        @summary: Download extracted syslog from the DUT and analyze it on the test server.
+
+        @return: Tuple of map <file_name, [matching lines, expected lines]> and list of unused expected regexp.
+        """
+        tmp_folder = ".".join((SYSLOG_TMP_FOLDER, time.strftime("%Y-%m-%d-%H:%M:%S", time.gmtime())))
+        # Download extracted logs from the DUT to the temporal folder defined in SYSLOG_TMP_FOLDER
+        self.save_extracted_log(dest=tmp_folder)
+
+        matcher = system_msg_handler.LogMessageMatcher(self.match_regex, self.ignore_regex, self.expect_regex)
+
+        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list([tmp_folder], matcher)
+        # Print syslog file content and remove the file
+        with open(tmp_folder) as fo:
+            logging.debug("Syslog content:\n\n{}".format(fo.read()))
+        os.remove(tmp_folder)
+
+        return analyzer_parse_result, matcher.get_unused_expect_regex()
+
     def analyze(self, marker, fail=True):
         """
-        @summary: Extract syslog logs based on the start/stop markers and compose one file. Download composed file, analyze file based on defined regular expressions.
+        @summary: Extract syslog logs based on the start/stop markers and compose one file. Analyze composed file based on defined regular expressions,
+                  either on the DUT or on the test server after downloading it (see "analyze_on_dut").
 
         @param marker: Marker obtained from "init" method.
         @param fail: Flag to enable/disable raising exception when loganalyzer find error messages.
@@ -150,54 +198,20 @@ class LogAnalyzer:
                             "expect_messages": {},
                             "unused_expected_regexp": []
                             }
-        tmp_folder = ".".join((SYSLOG_TMP_FOLDER, time.strftime("%Y-%m-%d-%H:%M:%S", time.gmtime())))
         self.ansible_loganalyzer.run_id = marker
 
         # Add end marker into DUT syslog
         self._add_end_marker(marker)
 
-        try:
-            # Disable logrotate cron task
-            self.ansible_host.command("sed -i 's/^/#/g' /etc/cron.d/logrotate")
-
-            logging.debug("Waiting for logrotate from previous cron task run to finish")
-            # Wait for logrotate from previous cron task run to finish
-            end = time.time() + 60
-            while time.time() < end:
-                # Verify for exception because self.ansible_host automatically handle command return codes and raise exception for none zero code
-                try:
-                    self.ansible_host.command("pgrep -f logrotate")
-                except Exception:
-                    break
-                else:
-                    time.sleep(5)
-                    continue
-            else:
-                logging.error("Logrotate from previous task was not finished during 60 seconds")
-
-            # On DUT extract syslog files from /var/log/ and create one file by location - /tmp/syslog
-            self.ansible_host.extract_log(directory='/var/log', file_prefix='syslog', start_string='start-LogAnalyzer-{}'.format(marker), target_filename=self.extracted_syslog)
-        finally:
-            # Enable logrotate cron task back
-            self.ansible_host.command("sed -i 's/^#//g' /etc/cron.d/logrotate")
-
-        # Download extracted logs from the DUT to the temporal folder defined in SYSLOG_TMP_FOLDER
-        self.save_extracted_log(dest=tmp_folder)
-
-        match_messages_regex = re.compile('|'.join(self.match_regex)) if len(self.match_regex) else None
-        ignore_messages_regex = re.compile('|'.join(self.ignore_regex)) if len(self.ignore_regex) else None
-        expect_messages_regex = re.compile('|'.join(self.expect_regex)) if len(self.expect_regex) else None
+        # On DUT extract syslog files from /var/log/ and create one file by location - /tmp/syslog
+        # Extraction is safe against logrotate running in parallel, so logrotate is not disabled
+        self.ansible_host.extract_log(directory='/var/log', file_prefix='syslog', start_string='start-LogAnalyzer-{}'.format(marker),
+                                      target_filename=self.extracted_syslog, start_position=self._start_positions.pop(marker, None))
 
-        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list([tmp_folder], match_messages_regex, ignore_messages_regex, expect_messages_regex)
-        # Print syslog file content and remove the file
-        with open(tmp_folder) as fo:
-            logging.debug("Syslog content:\n\n{}".format(fo.read()))
-        os.remove(tmp_folder)
-
-        total_match_cnt = 0
-        total_expect_cnt = 0
-        expected_lines_total = []
-        unused_regex_messages = []
+        if self.analyze_on_dut:
+            analyzer_parse_result, unused_regex_messages = self._analyze_on_dut(marker)
+        else:
+            analyzer_parse_result, unused_regex_messages = self._analyze_locally()
 
         for key, value in analyzer_parse_result.iteritems():
             matching_lines, expecting_lines = value
@@ -206,15 +220,7 @@ class LogAnalyzer:
             analyzer_summary["match_files"][key] = {"match": len(matching_lines), "expected_match": len(expecting_lines)}
             analyzer_summary["match_messages"][key] = matching_lines
             analyzer_summary["expect_messages"][key] = expecting_lines
-            expected_lines_total.extend(expecting_lines)
-
-        # Find unused regex matches
-        for regex in self.expect_regex:
-            for line in expected_lines_total:
-                if re.search(regex, line):
-                    break
-            else:
-                unused_regex_messages.append(regex)
+
         analyzer_summary["total"]["expected_missing_match"] = len(unused_regex_messages)
         analyzer_summary["unused_expected_regexp"] = unused_regex_messages
 
@@ -15,8 +15,9 @@ def _all_critical_services_fully_started(dut):
         logging.info("dut.critical_services_fully_started is False")
         return False
 
+    services_props = dut.get_services_props(dut.CRITICAL_SERVICES)
     for service in dut.CRITICAL_SERVICES:
-        status = dut.get_service_props(service)
+        status = services_props[service]
         if status["ActiveState"] != "active":
             logging.info("ActiveState of %s is %s, expected: active" % (service, status["ActiveState"]))
             return False
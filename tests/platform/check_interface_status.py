@@ -64,7 +64,7 @@ def check_interface_status(dut, interfaces):
         assert 'Present' in presence_list, "Status is not expected, presence status: %s" % str(presence_list)
 
     logging.info("Check interface status using the interface_facts module")
-    intf_facts = dut.interface_facts(up_ports=mg_ports)["ansible_facts"]
+    intf_facts = dut.interface_facts(up_ports=mg_ports, module_refresh_facts=True)["ansible_facts"]
     down_ports = intf_facts["ansible_interface_link_down_ports"]
     if len(down_ports) != 0:
         logging.info("Some interfaces are down: %s" % str(down_ports))
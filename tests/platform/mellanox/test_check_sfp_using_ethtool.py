@@ -33,7 +33,7 @@ def test_check_sfp_using_ethtool(testbed_devices, conn_graph_facts):
 
     logging.info("Check interface status")
     mg_facts = ans_host.minigraph_facts(host=ans_host.hostname)["ansible_facts"]
-    intf_facts = ans_host.interface_facts(up_ports=mg_facts["minigraph_ports"])["ansible_facts"]
+    intf_facts = ans_host.interface_facts(up_ports=mg_facts["minigraph_ports"], module_refresh_facts=True)["ansible_facts"]
     assert len(intf_facts["ansible_interface_link_down_ports"]) == 0, \
         "Some interfaces are down: %s" % str(intf_facts["ansible_interface_link_down_ports"])
 
@@ -119,7 +119,7 @@ def reboot_and_check(localhost, dut, interfaces, reboot_type=REBOOT_TYPE_COLD, r
         localhost.wait_for(host=dut.hostname, port=22, state="stopped", delay=10, timeout=120)
     else:
         reboot_cmd = reboot_ctrl_dict[reboot_type]["command"]
-        reboot_task, reboot_res = dut.command(reboot_cmd, module_ignore_errors=True, module_async=True)
+        reboot_task = dut.command(reboot_cmd, module_ignore_errors=True, module_async=True)
 
         logging.info("Wait for DUT to go down")
         res = localhost.wait_for(host=dut.hostname, port=22, state="stopped", timeout=180, module_ignore_errors=True)
@@ -128,8 +128,7 @@ def reboot_and_check(localhost, dut, interfaces, reboot_type=REBOOT_TYPE_COLD, r
                 logging.error("Wait for switch down failed, try to kill any possible stuck reboot task")
                 pid = dut.command("pgrep -f '%s'" % reboot_cmd)["stdout"]
                 dut.command("kill -9 %s" % pid)
-                reboot_task.terminate()
-                logging.error("Result of command '%s': " + str(reboot_res.get(timeout=0)))
+                logging.error("Result of command '%s': " + str(reboot_task.get(timeout=0)))
             except Exception as e:
                 logging.error("Exception raised while cleanup reboot task and get result: " + repr(e))
 
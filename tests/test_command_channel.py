@@ -0,0 +1,176 @@
+"""
+Failure handling of the DUT command channel, no testbed needed.
+
+A command which couldn't be sent through the channel is run by ansible instead. A command which was sent, but whose
+result didn't come back, may have been executed already (e.g. reboot) and must never be run again.
+"""
+import threading
+
+import pytest
+
+from common.command_channel import CommandChannel, make_command_result
+from common.devices import AnsibleHostBase
+from common.errors import CommandChannelError, CommandChannelNoReply, RunAnsibleModuleFail
+
+RESPONSE = '{"rc": 0, "stdout": "ok", "stderr": "", "start": "", "end": "", "delta": ""}\n'
+BATCH_RESPONSE = '{"results": [%s]}' % RESPONSE.strip()
+
+
+class FakeStdin(object):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+
+    def write(self, data):
+        if self.fail:
+            raise IOError("Socket is closed")
+        self.requests.append(data)
+
+    def flush(self):
+        pass
+
+
+class FakeStdout(object):
+    def __init__(self, lines):
+        self.lines = list(lines)
+
+    def readline(self):
+        return self.lines.pop(0) if self.lines else ""
+
+
+def make_channel(sessions):
+    """
+    @param sessions: List of (stdin, stdout) of the consecutive connections of the channel.
+    """
+    channel = CommandChannel("dut", "user", "password")
+    channel.sessions = list(sessions)
+    channel.connects = 0
+
+    def connect():
+        channel.connects += 1
+        channel.ssh = object()
+        channel.stdin, channel.stdout = channel.sessions.pop(0)
+
+    channel._connect = connect
+    channel._is_connected = lambda: channel.stdin is not None
+    channel.close = lambda: setattr(channel, "stdin", None)
+    return channel
+
+
+class FakeChannel(object):
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def run(self, *args, **kwargs):
+        self.calls += 1
+        raise self.error
+
+    def run_batch(self, *args, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+class FakeModule(object):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *module_args, **complex_args):
+        self.calls.append(module_args)
+        # The output of the command server running a batch, see AnsibleHostBase.run_batch()
+        return {"dut": make_command_result(module_args[0], {"rc": 0, "stdout": BATCH_RESPONSE, "stderr": ""})}
+
+
+class FakeAnsibleHost(object):
+    def __init__(self):
+        self.modules = {}
+
+    def has_module(self, name):
+        return True
+
+    def __getattr__(self, name):
+        return self.modules.setdefault(name, FakeModule())
+
+
+def make_host(channel):
+    host = AnsibleHostBase.__new__(AnsibleHostBase)
+    host._selected = threading.local()
+    host.host = FakeAnsibleHost()
+    host.hostname = "dut"
+    host.command_channel = channel
+    return host
+
+
+def ansible_calls(host):
+    return sum(len(module.calls) for module in host.host.modules.values())
+
+
+def test_no_reply_is_not_sent_again():
+    stdin = FakeStdin()
+    channel = make_channel([(stdin, FakeStdout([]))])
+
+    with pytest.raises(CommandChannelNoReply):
+        channel.run("sudo reboot")
+    assert len(stdin.requests) == 1
+    assert channel.connects == 1
+
+
+def test_stale_connection_is_reconnected():
+    stdin = FakeStdin()
+    channel = make_channel([(FakeStdin(fail=True), FakeStdout([])), (stdin, FakeStdout([RESPONSE]))])
+
+    result = channel.run("show version")
+    assert result.is_successful and result["stdout"] == "ok"
+    assert len(stdin.requests) == 1
+    assert channel.connects == 2
+
+
+def test_failed_batch_is_no_reply():
+    channel = make_channel([(FakeStdin(), FakeStdout(['{"rc": 1, "stdout": "", "stderr": "", "msg": "error"}\n']))])
+
+    with pytest.raises(CommandChannelNoReply):
+        channel.run_batch(["config save -y", "show version"])
+
+
+def test_command_without_reply_is_not_run_by_ansible():
+    channel = FakeChannel(CommandChannelNoReply("no reply"))
+    host = make_host(channel)
+
+    result = host.command("sudo reboot", module_ignore_errors=True)
+    assert result.is_failed
+    for key in ("rc", "stdout", "stderr", "stdout_lines"):
+        assert key in result
+    with pytest.raises(RunAnsibleModuleFail):
+        host.command("sudo reboot")
+    assert channel.calls == 2
+    assert ansible_calls(host) == 0
+
+
+def test_command_not_sent_is_run_by_ansible():
+    channel = FakeChannel(CommandChannelError("not sent"))
+    host = make_host(channel)
+
+    result = host.command("show version")
+    assert result.is_successful
+    assert channel.calls == 1
+    assert ansible_calls(host) == 1
+
+
+def test_batch_without_reply_is_not_run_by_ansible():
+    channel = FakeChannel(CommandChannelNoReply("no reply"))
+    host = make_host(channel)
+
+    with pytest.raises(RunAnsibleModuleFail):
+        host.run_batch(["config save -y", "show version"])
+    assert channel.calls == 1
+    assert ansible_calls(host) == 0
+
+
+def test_batch_not_sent_is_run_by_ansible():
+    channel = FakeChannel(CommandChannelError("not sent"))
+    host = make_host(channel)
+
+    results = host.run_batch(["show version"])
+    assert len(results) == 1
+    assert channel.calls == 1
+    assert ansible_calls(host) == 1
@@ -17,6 +17,7 @@ import pytest
 
 from ptf_runner import ptf_runner
 from common.utilities import wait_until
+from common.parallel import run_async
 
 
 """
@@ -184,7 +185,7 @@ def finalize_warmboot(duthost, comp_list=None, retry=30, interval=5):
     return  comp_list
 
 def check_interface_status(duthost, up_ports):
-    intf_facts = duthost.interface_facts(up_ports=up_ports)['ansible_facts']
+    intf_facts = duthost.interface_facts(up_ports=up_ports, module_refresh_facts=True)['ansible_facts']
     if len(intf_facts['ansible_interface_link_down_ports']) != 0:
         logging.info("Some ports went down: {} ...".format(intf_facts['ansible_interface_link_down_ports']))
         return False
@@ -1080,6 +1081,26 @@ class TestVrfCapacity():
         }
         duthost.host.options['variable_manager'].extra_vars.update(dut_extra_vars)
 
+        # setup peer ip addresses on ptf, in background while dut is being configured
+        ptf_extra_vars = {
+            'vrf_count':        vrf_count,
+            'src_base_vid':     self.src_base_vid,
+            'dst_base_vid':     self.dst_base_vid,
+            'sub_if_name_tpl':  self.sub_if_name_tpl,
+            'ip1':              ip1,
+            'ip2':              ip2,
+            'ptf_port1':        ptf_port1,
+            'ptf_port2':        ptf_port2,
+            'random_vrf_list':  random_vrf_list
+        }
+        ptfhost.host.options['variable_manager'].extra_vars.update(ptf_extra_vars)
+
+        def setup_ptf():
+            ptfhost.template(src='vrf/vrf_capacity_ptf_cfg.j2', dest='/tmp/vrf_capacity_ptf_cfg.sh', mode="0755")
+            ptfhost.shell('/tmp/vrf_capacity_ptf_cfg.sh')
+
+        ptf_task = run_async(setup_ptf)
+
         cfg_attrs_map = OrderedDict()
         # In wrost case(1k vrfs, 2k rifs), remove a vlan could take 60~80ms
         # ("VlanMgr::removeHostVlan ip link del Vlan{{vlan_id}} && bridge vlan del vid {{vlan_id}} dev Bridge self" take most of the time)
@@ -1110,21 +1131,8 @@ class TestVrfCapacity():
         duthost.template(src='vrf/vrf_capacity_route_cfg.j2', dest='/tmp/vrf_capacity_route_cfg.sh', mode="0755")
         duthost.shell("/tmp/vrf_capacity_route_cfg.sh")
 
-        # setup peer ip addresses on ptf
-        ptf_extra_vars = {
-            'vrf_count':        vrf_count,
-            'src_base_vid':     self.src_base_vid,
-            'dst_base_vid':     self.dst_base_vid,
-            'sub_if_name_tpl':  self.sub_if_name_tpl,
-            'ip1':              ip1,
-            'ip2':              ip2,
-            'ptf_port1':        ptf_port1,
-            'ptf_port2':        ptf_port2,
-            'random_vrf_list':  random_vrf_list
-        }
-        ptfhost.host.options['variable_manager'].extra_vars.update(ptf_extra_vars)
-        ptfhost.template(src='vrf/vrf_capacity_ptf_cfg.j2', dest='/tmp/vrf_capacity_ptf_cfg.sh', mode="0755")
-        ptfhost.shell('/tmp/vrf_capacity_ptf_cfg.sh')
+        # wait for peer ip addresses on ptf
+        ptf_task.get()
 
         # ping to trigger neigh resolving, also acitvate the static routes
         dut_extra_vars.update({
@@ -1144,11 +1152,14 @@ class TestVrfCapacity():
 
         # -------- Teardown ----------
 
-        # remove cfg on ptf
-        ptfhost.shell("ip address flush dev eth{}".format(ptf_port1))
-        ptfhost.shell("ip address flush dev eth{}".format(ptf_port2))
-        ptfhost.template(src='vrf/vrf_capacity_del_ptf_cfg.j2', dest='/tmp/vrf_capacity_del_ptf_cfg.sh', mode="0755")
-        ptfhost.shell('/tmp/vrf_capacity_del_ptf_cfg.sh')
+        # remove cfg on ptf, in background while dut cfg is being removed
+        def teardown_ptf():
+            ptfhost.shell("ip address flush dev eth{}".format(ptf_port1))
+            ptfhost.shell("ip address flush dev eth{}".format(ptf_port2))
+            ptfhost.template(src='vrf/vrf_capacity_del_ptf_cfg.j2', dest='/tmp/vrf_capacity_del_ptf_cfg.sh', mode="0755")
+            ptfhost.shell('/tmp/vrf_capacity_del_ptf_cfg.sh')
+
+        ptf_task = run_async(teardown_ptf)
 
         duthost.shell("config interface startup {}".format(dut_port1))
         duthost.shell("config interface startup {}".format(dut_port2))
@@ -1180,6 +1191,8 @@ class TestVrfCapacity():
 
                 time.sleep(attrs['remove_sleep_time'])
 
+        ptf_task.get()
+
         duthost.shell("logger -p INFO -- '-------- {} end!!! ---------'".format(request.cls.__name__))
 
     def test_ping(self, duthost, random_vrf_list):